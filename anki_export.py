@@ -0,0 +1,300 @@
+"""Export finished cards to Anki.
+
+    python anki_export.py vocab.apkg                  # a package to import
+    python anki_export.py ~/path/to/collection.anki2  # straight into a collection
+
+Cards are streamed out of the card store and written in batched
+transactions, so memory use doesn't grow with the number of cards. Each
+(language, field list) pair becomes a note type whose fields are the term
+followed by the LANGUAGE_FIELDS of the language. Images are hard-linked into
+a collection's media folder, or streamed into a package's zip, never read
+into memory.
+"""
+from card_store import Card, get_card_store
+from itertools import islice
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+import argparse
+import data
+import hashlib
+import json
+import os
+import re
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+import zipfile
+
+BATCH_SIZE = 1000
+
+# legacy (schema 11) collection layout, which every Anki version can import
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS col (
+    id integer primary key, crt integer not null, mod integer not null, scm integer not null,
+    ver integer not null, dty integer not null, usn integer not null, ls integer not null,
+    conf text not null, models text not null, decks text not null, dconf text not null,
+    tags text not null
+);
+CREATE TABLE IF NOT EXISTS notes (
+    id integer primary key, guid text not null, mid integer not null, mod integer not null,
+    usn integer not null, tags text not null, flds text not null, sfld integer not null,
+    csum integer not null, flags integer not null, data text not null
+);
+CREATE TABLE IF NOT EXISTS cards (
+    id integer primary key, nid integer not null, did integer not null, ord integer not null,
+    mod integer not null, usn integer not null, type integer not null, queue integer not null,
+    due integer not null, ivl integer not null, factor integer not null, reps integer not null,
+    lapses integer not null, left integer not null, odue integer not null, odid integer not null,
+    flags integer not null, data text not null
+);
+CREATE TABLE IF NOT EXISTS revlog (
+    id integer primary key, cid integer not null, usn integer not null, ease integer not null,
+    ivl integer not null, lastIvl integer not null, factor integer not null, time integer not null,
+    type integer not null
+);
+CREATE TABLE IF NOT EXISTS graves (usn integer not null, oid integer not null, type integer not null);
+CREATE INDEX IF NOT EXISTS ix_notes_usn ON notes (usn);
+CREATE INDEX IF NOT EXISTS ix_cards_usn ON cards (usn);
+CREATE INDEX IF NOT EXISTS ix_revlog_usn ON revlog (usn);
+CREATE INDEX IF NOT EXISTS ix_cards_nid ON cards (nid);
+CREATE INDEX IF NOT EXISTS ix_cards_sched ON cards (did, queue, due);
+CREATE INDEX IF NOT EXISTS ix_revlog_cid ON revlog (cid);
+CREATE INDEX IF NOT EXISTS ix_notes_csum ON notes (csum);
+"""
+
+_DEFAULT_CONF = {
+    "nextPos": 1, "estTimes": True, "activeDecks": [1], "sortType": "noteFld", "timeLim": 0,
+    "sortBackwards": False, "addToCur": True, "curDeck": 1, "newBury": True, "newSpread": 0,
+    "dueCounts": True, "curModel": None, "collapseTime": 1200,
+}
+
+_DEFAULT_DCONF = {
+    "1": {
+        "id": 1, "name": "Default", "replayq": True, "timer": 0, "maxTaken": 60, "usn": 0,
+        "mod": 0, "autoplay": True, "dyn": False,
+        "new": {"delays": [1, 10], "ints": [1, 4, 7], "initialFactor": 2500, "separate": True,
+                "order": 1, "perDay": 20, "bury": False},
+        "rev": {"perDay": 200, "ease4": 1.3, "fuzz": 0.05, "minSpace": 1, "ivlFct": 1,
+                "maxIvl": 36500, "bury": False, "hardFactor": 1.2},
+        "lapse": {"delays": [10], "mult": 0, "minInt": 1, "leechFails": 8, "leechAction": 0},
+    },
+}
+
+_CSS = ".card { font-family: arial; font-size: 20px; text-align: center; color: black; background-color: white; }"
+
+_html_re = re.compile(r'<[^>]*>')
+
+_BASE91 = "abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789!#$%&()*+,-./:;<=>?@[]^_`{|}~"
+
+# ----------------------------------- SCHEMA -----------------------------------
+
+def _stable_id(name: str) -> int:
+    # the same note type / deck gets the same id in every export, so
+    # re-importing updates rather than duplicates
+    return (1 << 40) + int(hashlib.sha1(name.encode()).hexdigest()[:8], 16)
+
+def _guid(card: Card) -> str:
+    n = int(hashlib.sha1(f"{card.lang}\x1f{card.term}\x1f{card.created!r}".encode()).hexdigest()[:16], 16)
+    out = ""
+    while n:
+        n, rem = divmod(n, len(_BASE91))
+        out = _BASE91[rem] + out
+    return out
+
+def _field_name(key: str) -> str:
+    return key.replace("_", " ").capitalize()
+
+def deck_name(lang: str) -> str:
+    return f"Vocab::{lang}"
+
+def _back_row(name: str) -> str:
+    # e.g. {{#Pinyin}}<div>Pinyin: {{Pinyin}}</div>{{/Pinyin}}
+    label = "" if name == "Image" else f"{name}: "
+    return "{{#" + name + "}}<div>" + label + "{{" + name + "}}</div>{{/" + name + "}}"
+
+def _model(lang: str, keys: Tuple[str, ...], now: int) -> Dict[str, Any]:
+    names = ["Term"] + [_field_name(key) for key in keys]
+    name = f"anki-vocab-gen {lang} ({', '.join(keys)})"
+    back = "{{FrontSide}}<hr id=answer>" + "".join(_back_row(n) for n in names[1:])
+    return {
+        "id": _stable_id(name), "name": name, "type": 0, "mod": now, "usn": -1, "sortf": 0,
+        "did": _stable_id(deck_name(lang)), "tags": [], "vers": [], "css": _CSS,
+        "latexPre": "\\documentclass[12pt]{article}\n\\special{papersize=3in,5in}\n\\usepackage{amssymb,amsmath}\n\\pagestyle{empty}\n\\setlength{\\parindent}{0in}\n\\begin{document}\n",
+        "latexPost": "\\end{document}",
+        "flds": [
+            {"name": n, "ord": i, "sticky": False, "rtl": False, "font": "Arial", "size": 20, "media": []}
+            for i, n in enumerate(names)
+        ],
+        "tmpls": [{
+            "name": "Recognition", "ord": 0, "qfmt": "{{Term}}", "afmt": back,
+            "did": None, "bqfmt": "", "bafmt": "",
+        }],
+        "req": [[0, "any", [0]]],
+    }
+
+def _deck(lang: str, now: int) -> Dict[str, Any]:
+    return {
+        "id": _stable_id(deck_name(lang)), "name": deck_name(lang), "desc": "", "mod": now,
+        "usn": -1, "collapsed": False, "browserCollapsed": False, "dyn": 0, "conf": 1,
+        "extendNew": 0, "extendRev": 0,
+        "newToday": [0, 0], "revToday": [0, 0], "lrnToday": [0, 0], "timeToday": [0, 0],
+    }
+
+def _default_deck(now: int) -> Dict[str, Any]:
+    deck = _deck("", now)
+    deck.update(id=1, name="Default")
+    return deck
+
+# ----------------------------------- NOTES ------------------------------------
+
+class _CollectionWriter:
+    """Appends notes and cards to an open collection, one transaction per batch."""
+
+    def __init__(self, conn: sqlite3.Connection) -> None:
+        self.conn = conn
+        self.now = int(time.time())
+        conn.executescript(_SCHEMA)
+        row = conn.execute("SELECT models, decks FROM col").fetchone()
+        if row is None:
+            self.models: Dict[str, Any] = {}
+            self.decks: Dict[str, Any] = {"1": _default_deck(self.now)}
+            conn.execute(
+                "INSERT INTO col VALUES (1, ?, ?, ?, 11, 0, 0, 0, ?, '{}', '{}', ?, '{}')",
+                (self.now, self.now * 1000, self.now * 1000,
+                 json.dumps(_DEFAULT_CONF), json.dumps(_DEFAULT_DCONF)),
+            )
+        else:
+            ver = conn.execute("SELECT ver FROM col").fetchone()[0]
+            if ver > 11:
+                raise ValueError(f"collection schema {ver} is newer than 11; export a .apkg and import it instead")
+            self.models, self.decks = json.loads(row[0]), json.loads(row[1])
+        # ids are millisecond timestamps in Anki; start past everything there
+        top = conn.execute("SELECT MAX(id) FROM notes").fetchone()[0] or 0
+        top_card = conn.execute("SELECT MAX(id) FROM cards").fetchone()[0] or 0
+        self._next_id = max(top, top_card, self.now * 1000) + 1
+        self._next_due = (conn.execute("SELECT MAX(due) FROM cards WHERE type = 0").fetchone()[0] or 0) + 1
+        # notes from an earlier export of the same cards are left as they are
+        self._guids: Set[str] = {guid for guid, in conn.execute("SELECT guid FROM notes")}
+        self.media: Set[str] = set()
+        self.count = 0
+
+    def _model_id(self, card: Card) -> int:
+        model = _model(card.lang, tuple(key for key, _ in card.fields), self.now)
+        mid = str(model["id"])
+        if mid not in self.models:
+            self.models[mid] = model
+        did = str(model["did"])
+        if did not in self.decks:
+            self.decks[did] = _deck(card.lang, self.now)
+        return int(model["id"])
+
+    def _row(self, card: Card) -> Optional[Tuple[Tuple[Any, ...], Tuple[Any, ...]]]:
+        guid = _guid(card)
+        if guid in self._guids:
+            return None
+        self._guids.add(guid)
+        mid = self._model_id(card)
+        values = [card.term]
+        for key, value in card.fields:
+            if key == "image" and card.image:
+                value = f'<img src="{os.path.basename(card.image)}">'
+                self.media.add(card.image)
+            values.append(value)
+        sort_field = _html_re.sub("", card.term).strip()
+        csum = int(hashlib.sha1(sort_field.encode()).hexdigest()[:8], 16)
+        nid, cid = self._next_id, self._next_id + 1
+        self._next_id += 2
+        note = (nid, guid, mid, self.now, -1, "", "\x1f".join(values), sort_field, csum, 0, "")
+        due = self._next_due
+        self._next_due += 1
+        did = self.models[str(mid)]["did"]
+        card_row = (cid, nid, did, 0, self.now, -1, 0, 0, due, 0, 0, 0, 0, 0, 0, 0, 0, "")
+        return note, card_row
+
+    def write(self, cards: Iterable[Card]) -> None:
+        it = iter(cards)
+        while batch := list(islice(it, BATCH_SIZE)):
+            rows = [row for row in map(self._row, batch) if row is not None]
+            with self.conn:
+                self.conn.executemany("INSERT INTO notes VALUES (?,?,?,?,?,?,?,?,?,?,?)", [n for n, _ in rows])
+                self.conn.executemany(
+                    "INSERT INTO cards VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?)", [c for _, c in rows]
+                )
+            self.count += len(rows)
+
+    def finish(self) -> None:
+        with self.conn:
+            self.conn.execute(
+                "UPDATE col SET mod = ?, models = ?, decks = ?",
+                (self.now * 1000, json.dumps(self.models), json.dumps(self.decks)),
+            )
+
+# ---------------------------------- WRITERS -----------------------------------
+
+def write_collection(path: str, cards: Iterable[Card]) -> int:
+    """Add cards to the collection at path (created if missing), with their
+    images hard-linked (copied across filesystems) into its media folder."""
+    conn = sqlite3.connect(path)
+    try:
+        writer = _CollectionWriter(conn)
+        writer.write(cards)
+        writer.finish()
+    finally:
+        conn.close()
+    media_dir = os.path.splitext(path)[0] + ".media"
+    os.makedirs(media_dir, exist_ok=True)
+    for src in sorted(m for m in writer.media if os.path.exists(m)):
+        dest = os.path.join(media_dir, os.path.basename(src))
+        if os.path.exists(dest):
+            continue
+        try:
+            os.link(src, dest)
+        except OSError:
+            shutil.copy2(src, dest)
+    return writer.count
+
+def write_apkg(path: str, cards: Iterable[Card]) -> int:
+    """Write cards and their images to an Anki package at path."""
+    fd, tmp = tempfile.mkstemp(suffix=".anki2", dir=os.path.dirname(os.path.abspath(path)))
+    os.close(fd)
+    try:
+        conn = sqlite3.connect(tmp)
+        try:
+            writer = _CollectionWriter(conn)
+            writer.write(cards)
+            writer.finish()
+        finally:
+            conn.close()
+
+        zip_tmp = f"{path}.tmp{os.getpid()}"
+        with zipfile.ZipFile(zip_tmp, "w", zipfile.ZIP_DEFLATED) as zf:
+            zf.write(tmp, "collection.anki2")
+            manifest: Dict[str, str] = {}
+            for i, src in enumerate(sorted(m for m in writer.media if os.path.exists(m))):
+                # images are compressed already; zipfile streams them in chunks
+                zf.write(src, str(i), compress_type=zipfile.ZIP_STORED)
+                manifest[str(i)] = os.path.basename(src)
+            zf.writestr("media", json.dumps(manifest))
+        os.replace(zip_tmp, path)
+    finally:
+        os.remove(tmp)
+    return writer.count
+
+def export(path: str, cards: Iterable[Card]) -> int:
+    """write_apkg for a .apkg path, write_collection otherwise."""
+    if path.endswith(".apkg"):
+        return write_apkg(path, cards)
+    return write_collection(path, cards)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Export finished cards to Anki.")
+    parser.add_argument("path", help="a .apkg package to write, or a collection.anki2 to add to")
+    parser.add_argument("--lang", default=None, help="only cards for this language")
+    args = parser.parse_args()
+
+    data.init(offline=True)
+    start = time.perf_counter()
+    count = export(args.path, get_card_store().cards(args.lang))
+    print(f"Exported {count} cards to {args.path} in {time.perf_counter() - start:.1f}s", file=sys.stderr)
@@ -0,0 +1,126 @@
+"""Headless batch generation of default options.
+
+    python batch.py words.txt --lang English --format jsonl > options.jsonl
+    cat words.txt | python batch.py --lang Chinese --format tsv > options.tsv
+
+Terms are looked up across a process pool (dictionaries are opened once per
+worker) and written out in input order as they complete. Throughput is
+reported on stderr.
+"""
+from cache import cached_defaults
+from term_queue import read_terms
+from itertools import islice
+from typing import Any, Callable, Dict, IO, Iterable, Iterator, List, Optional, Tuple
+import argparse
+import data
+import defaults
+import fileinput
+import json
+import multiprocessing
+import os
+import sys
+import time
+
+Options = List[Dict[str, Any]]
+
+TSV_COLUMNS = ["definition", "pinyin", "ipa", "function", "synonyms", "example", "suggestions"]
+
+_provider: Optional[Callable[[str], Options]] = None
+_prepare: Optional[Callable[[List[str]], None]] = None
+
+# terms handed to a worker at a time
+CHUNK_SIZE = 16
+
+def _init_worker(lang: str, use_cache: bool) -> None:
+    global _provider, _prepare
+    data.init(offline=True)
+    if use_cache:
+        _provider = cached_defaults(lang)
+    else:
+        _provider = defaults.LANGUAGE_DEFAULTS[lang]
+    _prepare = defaults.LANGUAGE_PREPARE.get(lang)
+    # open the dictionaries now rather than on this worker's first term
+    defaults.cedict.get_entry("")
+    defaults.senses.senses("", "eng")
+    if lang == "English":
+        defaults.ipa_index.load()
+
+def _lookup(term: str) -> Tuple[str, Options]:
+    assert _provider is not None
+    try:
+        return term, _provider(term)
+    except Exception as e:
+        print(f"Error looking up defaults for {term!r}: {e}", file=sys.stderr)
+        return term, [{}]
+
+def _lookup_chunk(terms: List[str]) -> List[Tuple[str, Options]]:
+    if _prepare is not None:
+        try:
+            _prepare(terms)
+        except Exception as e:
+            print(f"Error preparing defaults for {len(terms)} terms: {e}", file=sys.stderr)
+    return [_lookup(term) for term in terms]
+
+def _chunks(terms: Iterable[str], size: int) -> Iterator[List[str]]:
+    it = iter(terms)
+    while chunk := list(islice(it, size)):
+        yield chunk
+
+def _write_jsonl(out: IO[str], term: str, options: Options) -> None:
+    out.write(json.dumps({"term": term, "options": options}, ensure_ascii=False) + "\n")
+
+def _write_tsv(out: IO[str], term: str, options: Options) -> None:
+    for i, option in enumerate(options):
+        cells = [term, str(i + 1)]
+        for key in TSV_COLUMNS:
+            val = option.get(key, "")
+            if isinstance(val, list):
+                val = " | ".join(val)
+            cells.append(str(val).replace("\t", " ").replace("\n", " "))
+        out.write("\t".join(cells) + "\n")
+
+def run(terms: Iterable[str], lang: str, out: IO[str], fmt: str = "jsonl",
+        workers: Optional[int] = None, use_cache: bool = True) -> int:
+    """Look up every term with `workers` processes, streaming results to out."""
+    if lang not in defaults.LANGUAGE_DEFAULTS:
+        raise ValueError(f"Unsupported language: {lang}")
+
+    # build any missing indexes once here, before the workers go looking for them
+    data.init(offline=True)
+    defaults.cedict.get_entry("")
+    defaults.senses.senses("", "eng")
+    defaults.fuzzy.load()
+    defaults.sentences.load()
+
+    write = _write_tsv if fmt == "tsv" else _write_jsonl
+    if fmt == "tsv":
+        out.write("\t".join(["term", "option"] + TSV_COLUMNS) + "\n")
+
+    ctx = multiprocessing.get_context("spawn")
+    start = time.perf_counter()
+    count = 0
+    with ctx.Pool(workers or os.cpu_count(), initializer=_init_worker, initargs=(lang, use_cache)) as pool:
+        for results in pool.imap(_lookup_chunk, _chunks(terms, CHUNK_SIZE)):
+            for term, options in results:
+                write(out, term, options)
+                count += 1
+    elapsed = time.perf_counter() - start
+    print(f"{count} terms in {elapsed:.1f}s ({count / elapsed if elapsed else 0:.0f} terms/s)",
+          file=sys.stderr)
+    return count
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Generate card default options for a word list.")
+    parser.add_argument("files", nargs="*", help="word lists, one term per line (default: stdin)")
+    parser.add_argument("--lang", default="Chinese", help="target language (default: Chinese)")
+    parser.add_argument("--format", choices=["jsonl", "tsv"], default="jsonl")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes (default: CPU count)")
+    parser.add_argument("--no-cache", action="store_true", help="don't read or fill the defaults cache")
+    args = parser.parse_args(argv)
+
+    with fileinput.input(args.files, encoding="utf-8") as lines:
+        run(read_terms(lines), args.lang, sys.stdout, args.format, args.workers, not args.no_cache)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,259 @@
+"""Benchmarks for the lookup and normalization hot paths.
+
+    python bench.py [--quick] [--only NAME ...] [--save-baseline] [--threshold 0.25]
+
+Runs offline: the fixtures are sampled (with a fixed seed) from data that is
+already on disk, i.e. the CC-CEDICT copy bundled with pycccedict and the
+WordNet sense index, plus a scratch directory of images with clashing names
+and duplicate contents. Pass --zh-words/--en-words to use real word lists
+(e.g. HSK levels) instead.
+
+Each benchmark records per-call latency percentiles, throughput and peak
+Python memory. Every run is appended to data_dir/bench_results.jsonl, and
+compared against data_dir/bench_baseline.json (saved with --save-baseline);
+the exit status is 1 if anything got slower or bigger than the threshold.
+"""
+from typing import Any, Callable, Dict, List, Optional, Sequence
+import argparse
+import data
+import gzip
+import itertools
+import json
+import os
+import random
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+import tracemalloc
+
+ZH_WORDS = 5000
+EN_WORDS = 3000
+IMAGE_FILES = 2000
+# of which this many distinct contents
+IMAGE_CONTENTS = 200
+SEED = 20240601
+# timed runs over each fixture; the best one counts
+REPEAT = 3
+
+# metrics compared against the baseline; for all of them, lower is better
+COMPARED = ("p50_us", "p90_us", "peak_kb")
+
+default_results_path = os.path.join(data.data_dir, 'bench_results.jsonl')
+default_baseline_path = os.path.join(data.data_dir, 'bench_baseline.json')
+
+# ---------------------------------- FIXTURES ----------------------------------
+
+def _read_word_list(path: str) -> List[str]:
+    with open(path, encoding='utf-8') as f:
+        return [word for line in f if (word := line.strip())]
+
+def zh_entries() -> List[Dict[str, Any]]:
+    from cedict_index import default_source, parse_cedict
+    with gzip.open(default_source(), mode='rt', encoding='utf-8') as f:
+        return list(parse_cedict(f))
+
+def zh_words(entries: List[Dict[str, Any]], n: int) -> List[str]:
+    """Short headwords, the kind HSK lists are made of, plus some misses."""
+    words = sorted({e['simplified'] for e in entries if 1 <= len(e['simplified']) <= 4})
+    sample = random.Random(SEED).sample(words, min(n, len(words)))
+    # one in twenty isn't in the dictionary, to cover the pinyin fallback
+    return [w + "们" if i % 20 == 19 else w for i, w in enumerate(sample)]
+
+def zh_definitions(entries: List[Dict[str, Any]], n: int) -> List[str]:
+    rng = random.Random(SEED)
+    defns = [d for e in rng.sample(entries, min(n, len(entries))) for d in e['definitions']]
+    # the classifier lists and trad|simp pairs are what fix_up_zh works hardest on
+    defns += [d for e in entries if any('|' in d for d in e['definitions']) for d in e['definitions']][:n]
+    return defns
+
+def en_words(n: int) -> List[str]:
+    from defaults import senses
+    from wordnet_index import default_index_path
+    senses.senses("warm-up", "eng")  # builds the index if it's missing
+    conn = sqlite3.connect(f"file:{default_index_path()}?mode=ro", uri=True)
+    try:
+        forms = sorted({row[0] for row in conn.execute(
+            "SELECT form FROM forms WHERE lang = 'eng' AND form GLOB '[a-z]*' AND form NOT GLOB '*[_ -]*'")})
+    finally:
+        conn.close()
+    sample = random.Random(SEED).sample(forms, min(n, len(forms)))
+    # inflected forms go through morphy's suffix rules
+    return [w + "s" if i % 5 == 4 else w for i, w in enumerate(sample)]
+
+def make_images(root: str, n: int, contents: int) -> List[str]:
+    """n small files with only a handful of names between them, and shared contents."""
+    rng = random.Random(SEED)
+    blobs = [b"\xff\xd8\xff\xe0" + rng.randbytes(rng.randrange(2_000, 200_000)) for _ in range(contents)]
+    names = ["image.jpg", "download.jpg", "1.jpg", "images.jpeg", "photo.jpg"]
+    paths = []
+    for i in range(n):
+        folder = os.path.join(root, f"drop{i // len(names)}")
+        os.makedirs(folder, exist_ok=True)
+        path = os.path.join(folder, names[i % len(names)])
+        with open(path, 'wb') as f:
+            f.write(blobs[i % contents])
+        paths.append(path)
+    return paths
+
+# ---------------------------------- MEASURING ---------------------------------
+
+def _percentile(sorted_ns: List[int], q: float) -> float:
+    i = min(len(sorted_ns) - 1, int(q * len(sorted_ns)))
+    return sorted_ns[i] / 1000
+
+def measure(fn: Callable[[Any], Any], inputs: Sequence[Any], repeat: int = REPEAT) -> Dict[str, float]:
+    # the first call opens indexes, connections etc.
+    fn(inputs[0])
+    runs = []
+    for _ in range(repeat):
+        times = []
+        start = time.perf_counter()
+        for x in inputs:
+            t = time.perf_counter_ns()
+            fn(x)
+            times.append(time.perf_counter_ns() - t)
+        total = time.perf_counter() - start
+        times.sort()
+        runs.append({
+            "p50_us": round(_percentile(times, 0.50), 1),
+            "p90_us": round(_percentile(times, 0.90), 1),
+            "p99_us": round(_percentile(times, 0.99), 1),
+            "max_us": round(times[-1] / 1000, 1),
+            "per_sec": round(len(inputs) / total, 1),
+        })
+
+    # a separate pass for memory, since tracing allocations slows everything down
+    tracemalloc.start()
+    for x in inputs:
+        fn(x)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    # the best of the runs: noise only ever makes a run slower
+    metrics: Dict[str, float] = {key: min(run[key] for run in runs) for key in runs[0]}
+    metrics["per_sec"] = max(run["per_sec"] for run in runs)
+    metrics["calls"] = len(inputs)
+    metrics["peak_kb"] = round(peak / 1024, 1)
+    return metrics
+
+# ---------------------------------- BENCHMARKS --------------------------------
+
+Benchmark = Callable[[argparse.Namespace], Dict[str, float]]
+
+def _scale(args: argparse.Namespace, n: int) -> int:
+    return max(10, n // 10) if args.quick else n
+
+def bench_fix_up_zh(args: argparse.Namespace) -> Dict[str, float]:
+    from zh_fixup import fix_up_zh
+    return measure(fix_up_zh, zh_definitions(zh_entries(), _scale(args, ZH_WORDS)))
+
+def bench_chinese_defaults(args: argparse.Namespace) -> Dict[str, float]:
+    from defaults import chinese_defaults
+    words = _read_word_list(args.zh_words) if args.zh_words else zh_words(zh_entries(), _scale(args, ZH_WORDS))
+    return measure(chinese_defaults, words)
+
+def bench_english_defaults(args: argparse.Namespace) -> Dict[str, float]:
+    from defaults import english_defaults
+    return measure(english_defaults, _read_word_list(args.en_words) if args.en_words else en_words(_scale(args, EN_WORDS)))
+
+def bench_get_syn_options(args: argparse.Namespace) -> Dict[str, float]:
+    from defaults import get_syn_options
+    words = _read_word_list(args.en_words) if args.en_words else en_words(_scale(args, EN_WORDS))
+    return measure(lambda w: get_syn_options(w, 'eng'), words)
+
+def bench_image_store_add(args: argparse.Namespace) -> Dict[str, float]:
+    from image_store import ImageStore
+    scratch = tempfile.mkdtemp(prefix="anki-vocab-bench-")
+    try:
+        files = make_images(os.path.join(scratch, "src"), _scale(args, IMAGE_FILES), _scale(args, IMAGE_CONTENTS))
+        os.makedirs(os.path.join(scratch, "store"))
+        store = ImageStore(os.path.join(scratch, "store"), os.path.join(scratch, "images.sqlite3"))
+        # each dropped file goes to its own term, as when making a card per drop
+        terms = itertools.count()
+        try:
+            return measure(lambda path: store.add_file(path, "English", f"term{next(terms)}", "jpg"), files)
+        finally:
+            store.close()
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+
+BENCHMARKS: Dict[str, Benchmark] = {
+    "fix_up_zh": bench_fix_up_zh,
+    "chinese_defaults": bench_chinese_defaults,
+    "english_defaults": bench_english_defaults,
+    "get_syn_options": bench_get_syn_options,
+    "image_store_add": bench_image_store_add,
+}
+
+# ---------------------------------- BASELINE ----------------------------------
+
+def compare(results: Dict[str, Dict[str, float]], baseline: Dict[str, Dict[str, float]],
+            threshold: float) -> List[str]:
+    """Descriptions of the metrics that got worse than baseline by more than threshold."""
+    regressions = []
+    for name, metrics in results.items():
+        base = baseline.get(name)
+        if base is None or base.get("calls") != metrics["calls"]:
+            continue
+        for key in COMPARED:
+            if base.get(key) and metrics[key] > base[key] * (1 + threshold):
+                regressions.append(f"{name}: {key} {base[key]} -> {metrics[key]} "
+                                   f"(+{metrics[key] / base[key] - 1:.0%})")
+    return regressions
+
+def _load_baseline(path: str) -> Optional[Dict[str, Dict[str, float]]]:
+    try:
+        with open(path, encoding='utf-8') as f:
+            baseline: Dict[str, Dict[str, float]] = json.load(f)["results"]
+    except FileNotFoundError:
+        return None
+    return baseline
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the lookup and normalization hot paths.")
+    parser.add_argument("--only", nargs="+", choices=sorted(BENCHMARKS), help="run just these benchmarks")
+    parser.add_argument("--quick", action="store_true", help="a tenth of the fixture sizes")
+    parser.add_argument("--zh-words", help="Chinese word list to look up, one per line (e.g. HSK)")
+    parser.add_argument("--en-words", help="English word list to look up, one per line")
+    parser.add_argument("--baseline", default=default_baseline_path, help="baseline to compare against")
+    parser.add_argument("--save-baseline", action="store_true", help="save this run as the baseline")
+    parser.add_argument("--threshold", type=float, default=0.25,
+                        help="fraction by which a metric may exceed the baseline (default 0.25)")
+    parser.add_argument("--results", default=default_results_path, help="file to append this run to")
+    args = parser.parse_args()
+
+    data.init(offline=True)
+    results: Dict[str, Dict[str, float]] = {}
+    for name in args.only or BENCHMARKS:
+        metrics = results[name] = BENCHMARKS[name](args)
+        print(f"{name:>18}: p50 {metrics['p50_us']:>9.1f}us  p90 {metrics['p90_us']:>9.1f}us  "
+              f"p99 {metrics['p99_us']:>9.1f}us  {metrics['per_sec']:>9.0f}/s  "
+              f"peak {metrics['peak_kb']:>8.0f}KB  ({metrics['calls']} calls)")
+
+    record = {"time": time.strftime("%Y-%m-%dT%H:%M:%S"), "quick": args.quick, "results": results}
+    with open(args.results, 'a', encoding='utf-8') as f:
+        f.write(json.dumps(record) + "\n")
+
+    baseline = _load_baseline(args.baseline)
+    if args.save_baseline:
+        # keep the baselines of benchmarks not run this time
+        record["results"] = {**(baseline or {}), **results}
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump(record, f, indent=1)
+        print(f"Saved baseline to {args.baseline}")
+        return 0
+    if baseline is None:
+        print(f"No baseline at {args.baseline} yet; save one with --save-baseline")
+        return 0
+    regressions = compare(results, baseline, args.threshold)
+    for regression in regressions:
+        print(f"REGRESSION {regression}")
+    if not regressions:
+        print(f"No regressions beyond {args.threshold:.0%} of the baseline")
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,129 @@
+from defaults import LANGUAGE_DEFAULTS, dictionary_version, lookups_settled
+from tracing import span
+from typing import Any, Callable, Dict, List, Optional
+import data
+import json
+import os
+import sqlite3
+import threading
+
+Options = List[Dict[str, Any]]
+
+CACHE_MAX_ENTRIES = 50_000
+
+class DefaultsCache:
+    """Persistent LRU cache of language default lookups.
+
+    Rows are keyed by (language, word, dictionary version). Opening the cache
+    for a language drops rows written against any other dictionary version.
+    """
+
+    def __init__(self, path: str, max_entries: int = CACHE_MAX_ENTRIES) -> None:
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS defaults ("
+            " lang TEXT NOT NULL, word TEXT NOT NULL, version TEXT NOT NULL,"
+            " options TEXT NOT NULL, used INTEGER NOT NULL,"
+            " PRIMARY KEY (lang, word, version))"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS defaults_used ON defaults (used)")
+        tick, count = self._conn.execute("SELECT MAX(used), COUNT(*) FROM defaults").fetchone()
+        self._tick: int = tick or 0
+        self._count: int = count
+        self._checked: set[str] = set()
+
+    def invalidate(self, lang: str, version: str) -> None:
+        """Drop rows for lang that weren't produced by this dictionary version."""
+        with self._lock:
+            cur = self._conn.execute(
+                "DELETE FROM defaults WHERE lang = ? AND version != ?", (lang, version)
+            )
+            self._count -= cur.rowcount
+
+    def get(self, lang: str, word: str, version: str) -> Optional[Options]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT options FROM defaults WHERE lang = ? AND word = ? AND version = ?",
+                (lang, word, version),
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._tick += 1
+            self._conn.execute(
+                "UPDATE defaults SET used = ? WHERE lang = ? AND word = ? AND version = ?",
+                (self._tick, lang, word, version),
+            )
+        options: Options = json.loads(row[0])
+        return options
+
+    def put(self, lang: str, word: str, version: str, options: Options) -> None:
+        payload = json.dumps(options, ensure_ascii=False)
+        with self._lock:
+            self._tick += 1
+            cur = self._conn.execute(
+                "INSERT OR IGNORE INTO defaults (lang, word, version, options, used)"
+                " VALUES (?, ?, ?, ?, ?)",
+                (lang, word, version, payload, self._tick),
+            )
+            self._count += cur.rowcount
+            if self._count > self.max_entries:
+                self._evict()
+
+    def _evict(self) -> None:
+        # trim to 90% of the cap so eviction runs once per many inserts
+        excess = self._count - self.max_entries * 9 // 10
+        cur = self._conn.execute(
+            "DELETE FROM defaults WHERE rowid IN"
+            " (SELECT rowid FROM defaults ORDER BY used LIMIT ?)",
+            (excess,),
+        )
+        self._count -= cur.rowcount
+
+    def wrap(self, lang: str, provider: Callable[[str], Options]) -> Callable[[str], Options]:
+        """Return provider with lookups served from (and stored to) the cache."""
+        version = dictionary_version(lang)
+        if lang not in self._checked:
+            self._checked.add(lang)
+            self.invalidate(lang, version)
+
+        def cached(word: str) -> Options:
+            with span("defaults", word):
+                options = self.get(lang, word, version)
+                if options is None:
+                    options = provider(word)
+                    # kept only once they're what this version will always give
+                    if lookups_settled():
+                        self.put(lang, word, version, options)
+                return options
+        return cached
+
+    def stats(self) -> Dict[str, int]:
+        return {"hits": self.hits, "misses": self.misses, "entries": self._count}
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+_cache: Optional[DefaultsCache] = None
+
+def get_cache() -> DefaultsCache:
+    global _cache
+    if _cache is None:
+        _cache = DefaultsCache(os.path.join(data.data_dir, 'defaults_cache.sqlite3'))
+    return _cache
+
+def cached_defaults(lang: str) -> Callable[[str], Options]:
+    """The LANGUAGE_DEFAULTS provider for lang, backed by the on-disk cache."""
+    provider = LANGUAGE_DEFAULTS.get(lang)
+    if provider is None:
+        return lambda _: []
+    return get_cache().wrap(lang, provider)
@@ -0,0 +1,84 @@
+"""Finished cards, kept until they're exported.
+
+Each card is the term plus its field values in LANGUAGE_FIELDS order (which
+is also the note type it's exported with) and the path of its image, if any.
+"""
+from dataclasses import dataclass, field
+from typing import Iterator, List, Optional, Tuple
+import data
+import json
+import os
+import sqlite3
+import threading
+import time
+
+@dataclass
+class Card:
+    lang: str
+    term: str
+    fields: List[Tuple[str, str]]
+    image: Optional[str] = None
+    created: float = field(default_factory=time.time)
+    id: Optional[int] = None
+
+class CardStore:
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS cards ("
+            " id INTEGER PRIMARY KEY, lang TEXT NOT NULL, term TEXT NOT NULL,"
+            " fields TEXT NOT NULL, image TEXT, created REAL NOT NULL)"
+        )
+        # a card replayed from the session journal may already be here
+        self._conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS cards_key ON cards (lang, term, created)")
+
+    def add(self, card: Card) -> Optional[int]:
+        """Store card, unless it's stored already; returns its new id, if any."""
+        with self._lock:
+            cur = self._conn.execute(
+                "INSERT OR IGNORE INTO cards (lang, term, fields, image, created) VALUES (?, ?, ?, ?, ?)",
+                (card.lang, card.term, json.dumps(card.fields, ensure_ascii=False), card.image, card.created),
+            )
+        if not cur.rowcount:
+            return None
+        card.id = cur.lastrowid
+        return card.id
+
+    def count(self, lang: Optional[str] = None) -> int:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT COUNT(*) FROM cards WHERE ? IS NULL OR lang = ?", (lang, lang)
+            ).fetchone()
+        return int(row[0])
+
+    def cards(self, lang: Optional[str] = None, batch: int = 1000) -> Iterator[Card]:
+        """All cards (for lang, if given) oldest first, read batch rows at a time."""
+        # a connection of its own, so a slow consumer never holds the lock
+        conn = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True)
+        try:
+            cur = conn.execute(
+                "SELECT id, lang, term, fields, image, created FROM cards"
+                " WHERE ? IS NULL OR lang = ? ORDER BY id",
+                (lang, lang),
+            )
+            while rows := cur.fetchmany(batch):
+                for id, card_lang, term, fields, image, created in rows:
+                    yield Card(card_lang, term, [(k, v) for k, v in json.loads(fields)], image, created, id)
+        finally:
+            conn.close()
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+_store: Optional[CardStore] = None
+
+def get_card_store() -> CardStore:
+    global _store
+    if _store is None:
+        _store = CardStore(os.path.join(data.data_dir, 'cards.sqlite3'))
+    return _store
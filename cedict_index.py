@@ -0,0 +1,465 @@
+"""Compiled, memory-mapped CC-CEDICT index.
+
+The dictionary source is compiled once into a flat file laid out as
+
+    header | slots | keys | records | trie | string pool
+
+where keys are the headwords, simplified and traditional alike, sorted by
+their UTF-8 bytes, each pointing at the record it's the simplified headword
+of and the one it's the traditional headword of (usually the same); slots
+are an open-addressed crc32 hash table over the keys, and records are
+(offset, length) pairs pointing at an entry's traditional, simplified,
+pinyin and definitions strings stored back to back, followed by the
+accented pinyin and the definitions through fix_up_zh for simplified and
+for traditional display, normalized in bulk at build time. The trie is a
+character trie over the headwords (for segmenting terms that aren't
+headwords themselves), and the pool holds everything else once. Lookups
+probe the slots or walk the trie straight out of the mmap, so nothing but
+the touched pages is ever loaded.
+
+    python cedict_index.py [cedict_ts.u8[.gz]]
+
+rebuilds the index (by default from the copy bundled with pycccedict).
+"""
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+import data
+import gzip
+import mmap
+import os
+import struct
+import sys
+import threading
+import zlib
+from tracing import span
+from zh_fixup import accent_pinyin, fix_up_zh_bulk
+
+INDEX_MAGIC = b"CEDX"
+INDEX_FORMAT = 4
+
+# magic, format, record count, key count, slot count,
+# slots/keys/records/trie/pool offsets, source path (pool offset, length), source stamp
+_HEADER = struct.Struct("<4sIIIIQQQQQII32s")
+# key index + 1, or 0 for an empty slot
+_SLOT = struct.Struct("<I")
+# pool offset, length, record as simplified headword + 1, as traditional + 1 (0 if not)
+_KEY = struct.Struct("<IIII")
+# pool offset, length of the entry's fields
+_RECORD = struct.Struct("<II")
+# trie node: character on the edge into it, first child, child count, key index + 1
+# (or 0 if no headword ends here); node 0 is the root
+_NODE = struct.Struct("<IIII")
+
+# a trie step not taken yet
+_UNSEEN = (-1, -1, -1)
+
+def _step_key(first: int, ch: int) -> int:
+    # characters are below 0x110000
+    return first * 0x110000 + ch
+
+# separators that never occur in the source: between the fields of an entry,
+# and between its definitions
+_FIELD_SEP = "\x1e"
+_DEFN_SEP = "\n"
+
+def default_source() -> str:
+    from pycccedict import cccedict
+    return str(Path(cccedict.__file__).parent / 'data' / 'cedict_1_0_ts_utf-8_mdbg.txt.gz')
+
+def default_index_path() -> str:
+    return os.path.join(data.data_dir, 'cedict.idx')
+
+def source_stamp(source: str) -> bytes:
+    st = os.stat(source)
+    return f"{st.st_size}:{st.st_mtime_ns}".encode()
+
+# ----------------------------------- BUILD ------------------------------------
+
+def parse_cedict(lines: Iterable[str]) -> Iterator[Dict[str, Any]]:
+    """Parse CC-CEDICT lines into entries shaped like pycccedict's."""
+    for line in lines:
+        if line.startswith('#'):
+            continue
+        line = line.strip().rstrip('/')
+        if not line:
+            continue
+        chinese, english = line.split('/', maxsplit=1)
+        heads, pinyin = chinese.strip().split('[')
+        traditional, simplified = heads.strip().split()
+        definitions = [d for sense in english.split('/') for d in sense.split(';')]
+        yield {
+            'traditional': traditional,
+            'simplified': simplified,
+            'pinyin': pinyin[:-1],
+            'definitions': definitions,
+        }
+
+def _read_source(source: str) -> List[Dict[str, Any]]:
+    opener = gzip.open if source.endswith('.gz') else open
+    with opener(source, mode='rt', encoding='utf-8') as f:
+        return list(parse_cedict(f))
+
+def _build_trie(key_index: Dict[str, int]) -> bytes:
+    """Trie nodes over the headwords, breadth first, so each node's children
+    are consecutive and sorted by character."""
+    # the nodes of depth d are the headwords' distinct prefixes of length d, sorted
+    levels = [[""]]
+    keys = list(key_index)
+    while keys:
+        d = len(levels)
+        levels.append(sorted({k[:d] for k in keys}))
+        keys = [k for k in keys if len(k) > d]
+    nodes = bytearray()
+    level_start = 0
+    for d, level in enumerate(levels):
+        below = levels[d + 1] if d + 1 < len(levels) else []
+        below_start = level_start + len(level)
+        j = 0
+        for prefix in level:
+            first = j
+            while j < len(below) and below[j][:d] == prefix:
+                j += 1
+            key = key_index[prefix] + 1 if prefix in key_index else 0
+            nodes.extend(_NODE.pack(ord(prefix[-1]) if prefix else 0, below_start + first, j - first, key))
+        level_start = below_start
+    return bytes(nodes)
+
+def build_index(source: str, dest: str) -> None:
+    entries = _read_source(source)
+
+    pool = bytearray()
+    interned: Dict[bytes, Tuple[int, int]] = {}
+    def intern(s: str) -> Tuple[int, int]:
+        b = s.encode('utf-8')
+        if b not in interned:
+            interned[b] = (len(pool), len(b))
+            pool.extend(b)
+        return interned[b]
+
+    records = bytearray()
+    # headword -> [record as simplified + 1, record as traditional + 1]
+    key_records: Dict[str, List[int]] = {}
+    with span("fix_up_zh"):
+        all_defns = [d.strip() for entry in entries for d in entry['definitions']]
+        display = fix_up_zh_bulk(all_defns)
+        display_traditional = fix_up_zh_bulk(all_defns, traditional=True)
+    n = 0
+    for i, entry in enumerate(entries):
+        defns = display[n:n + len(entry['definitions'])]
+        defns_traditional = display_traditional[n:n + len(entry['definitions'])]
+        n += len(defns)
+        records.extend(_RECORD.pack(*intern(_FIELD_SEP.join((
+            entry['traditional'],
+            entry['simplified'],
+            entry['pinyin'],
+            _DEFN_SEP.join(entry['definitions']),
+            accent_pinyin(entry['pinyin']),
+            '; '.join(defns),
+            # left empty when it's the same, as it mostly is
+            '' if defns_traditional == defns else '; '.join(defns_traditional),
+        )))))
+        # later entries win
+        key_records.setdefault(entry['simplified'], [0, 0])[0] = i + 1
+        key_records.setdefault(entry['traditional'], [0, 0])[1] = i + 1
+
+    sorted_keys = sorted(k.encode('utf-8') for k in key_records)
+    keys = bytearray()
+    for key in sorted_keys:
+        keys.extend(_KEY.pack(*intern(key.decode('utf-8')), *key_records[key.decode('utf-8')]))
+
+    # load factor <= 0.5 keeps probe chains to a step or two
+    n_slots = 1 << max(1, (2 * len(sorted_keys) - 1).bit_length())
+    slot_table = [0] * n_slots
+    for i, key in enumerate(sorted_keys):
+        slot = zlib.crc32(key) & (n_slots - 1)
+        while slot_table[slot]:
+            slot = (slot + 1) & (n_slots - 1)
+        slot_table[slot] = i + 1
+    slots = struct.pack(f"<{n_slots}I", *slot_table)
+
+    trie = _build_trie({key.decode('utf-8'): i for i, key in enumerate(sorted_keys)})
+    source_ref = intern(os.path.abspath(source))
+
+    slots_off = _HEADER.size
+    keys_off = slots_off + len(slots)
+    records_off = keys_off + len(keys)
+    trie_off = records_off + len(records)
+    pool_off = trie_off + len(trie)
+    header = _HEADER.pack(
+        INDEX_MAGIC, INDEX_FORMAT, len(entries), len(sorted_keys), n_slots,
+        slots_off, keys_off, records_off, trie_off, pool_off, *source_ref, source_stamp(source),
+    )
+
+    os.makedirs(os.path.dirname(os.path.abspath(dest)), exist_ok=True)
+    tmp = f"{dest}.tmp{os.getpid()}"
+    try:
+        with open(tmp, 'wb') as f:
+            f.write(header)
+            f.write(slots)
+            f.write(keys)
+            f.write(records)
+            f.write(trie)
+            f.write(pool)
+        os.replace(tmp, dest)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+# ----------------------------------- LOOKUP -----------------------------------
+
+class CedictIndex:
+    """Read-only view of a compiled index, opened on first lookup."""
+
+    def __init__(self, path: Optional[str] = None, source: Optional[str] = None) -> None:
+        self.path = path or default_index_path()
+        self.source = source
+        self._lock = threading.Lock()
+        self._mm: Optional[mmap.mmap] = None
+        self._n_keys = 0
+        self._slot_mask = 0
+        self._slots_off = 0
+        self._keys_off = 0
+        self._records_off = 0
+        self._trie_off = 0
+        self._pool_off = 0
+        # _step_key(first child, character) -> the child's (first child, child
+        # count, key index + 1), or None; trie steps taken before, so segmenting
+        # long texts doesn't binary search the same nodes over and over
+        self._steps: Dict[int, Optional[Tuple[int, int, int]]] = {}
+        # character -> what convert() makes of it
+        self._converted: Dict[str, str] = {}
+
+    def _read_header(self, mm: mmap.mmap) -> Optional[Tuple[int, ...]]:
+        if len(mm) < _HEADER.size:
+            return None
+        magic, fmt, _, *offsets = _HEADER.unpack_from(mm, 0)[:10]
+        if magic != INDEX_MAGIC or fmt != INDEX_FORMAT:
+            return None
+        return tuple(offsets)
+
+    def _is_stale(self, mm: mmap.mmap) -> bool:
+        # compare against the source the index was built from, unless we were
+        # pointed at a specific one (or that file has since gone away)
+        *_, pool_off, src_off, src_len, stamp = _HEADER.unpack_from(mm, 0)
+        start = pool_off + src_off
+        source = self.source or mm[start:start + src_len].decode('utf-8')
+        if not os.path.exists(source):
+            source = default_source()
+        return bool(stamp.rstrip(b'\0') != source_stamp(source))
+
+    def _map(self) -> Optional[mmap.mmap]:
+        try:
+            with open(self.path, 'rb') as f:
+                return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            return None
+
+    def _open(self) -> mmap.mmap:
+        with self._lock:
+            if self._mm is not None:
+                return self._mm
+            mm = self._map()
+            header = self._read_header(mm) if mm is not None else None
+            if mm is None or header is None or self._is_stale(mm):
+                # missing, from an older format, or the source data changed
+                if mm is not None:
+                    mm.close()
+                build_index(self.source or default_source(), self.path)
+                mm = self._map()
+                header = self._read_header(mm) if mm is not None else None
+            if mm is None or header is None:
+                raise RuntimeError(f"Could not open CC-CEDICT index at {self.path}")
+            (self._n_keys, n_slots, self._slots_off, self._keys_off,
+             self._records_off, self._trie_off, self._pool_off) = header
+            self._slot_mask = n_slots - 1
+            self._mm = mm
+            return mm
+
+    def _str(self, mm: mmap.mmap, offset: int, length: int) -> str:
+        start = self._pool_off + offset
+        return mm[start:start + length].decode('utf-8')
+
+    def _find(self, mm: mmap.mmap, key: bytes) -> int:
+        """Index of the key for headword key, or -1."""
+        slot = zlib.crc32(key) & self._slot_mask
+        while True:
+            (key_index,) = _SLOT.unpack_from(mm, self._slots_off + slot * _SLOT.size)
+            if not key_index:
+                return -1
+            off, length, _, _ = _KEY.unpack_from(mm, self._keys_off + (key_index - 1) * _KEY.size)
+            start = self._pool_off + off
+            if mm[start:start + length] == key:
+                return int(key_index - 1)
+            slot = (slot + 1) & self._slot_mask
+
+    def _record(self, mm: mmap.mmap, key_index: int, traditional: bool) -> int:
+        # a headword of both scripts (of different entries) reads as the one asked for
+        _, _, simplified, trad = _KEY.unpack_from(mm, self._keys_off + key_index * _KEY.size)
+        first, second = (trad, simplified) if traditional else (simplified, trad)
+        return int(first or second) - 1
+
+    def _entry(self, mm: mmap.mmap, record: int) -> Dict[str, Any]:
+        offset, length = _RECORD.unpack_from(mm, self._records_off + record * _RECORD.size)
+        fields = self._str(mm, offset, length).split(_FIELD_SEP)
+        return {
+            'traditional': fields[0],
+            'simplified': fields[1],
+            'pinyin': fields[2],
+            'definitions': fields[3].split(_DEFN_SEP),
+            'pinyin_accented': fields[4],
+            'display': fields[5],
+            'display_traditional': fields[6] or fields[5],
+        }
+
+    def get_entry(self, chinese: str, traditional: bool = False) -> Optional[Dict[str, Any]]:
+        """Look up by simplified or traditional headword, like pycccedict.
+
+        Besides pycccedict's fields, entries carry 'pinyin_accented' and
+        'display' (the definitions through fix_up_zh, joined with "; "), and
+        'display_traditional' (the same, keeping traditional forms). Where
+        the headword is simplified for one entry and traditional for
+        another, `traditional` says which one to return.
+        """
+        mm = self._mm or self._open()
+        key_index = self._find(mm, chinese.encode('utf-8'))
+        if key_index < 0:
+            return None
+        return self._entry(mm, self._record(mm, key_index, traditional))
+
+    def entries(self) -> Iterator[Dict[str, Any]]:
+        """Every entry in the dictionary, shaped like get_entry's."""
+        mm = self._mm or self._open()
+        for record in range(_HEADER.unpack_from(mm, 0)[2]):
+            yield self._entry(mm, record)
+
+    def convert(self, text: str) -> str:
+        """text in simplified characters, one character at a time.
+
+        For looking up terms written in a mix of both scripts: simplified
+        forms are (nearly) unique, so a character that's simplified already
+        stays as it is, and a traditional one becomes the simplified form
+        of its entry; anything else is left alone. There's no way back
+        that's safe a character at a time (发 is 發 or 髮), so show an
+        entry's own traditional headword instead.
+        """
+        mm = self._mm or self._open()
+        converted = self._converted
+        out = []
+        for ch in text:
+            if ch not in converted:
+                converted[ch] = ch
+                key_index = self._find(mm, ch.encode('utf-8'))
+                if key_index >= 0:
+                    _, _, simplified, trad = _KEY.unpack_from(mm, self._keys_off + key_index * _KEY.size)
+                    if not simplified and trad:
+                        converted[ch] = self._entry(mm, trad - 1)['simplified']
+            out.append(converted[ch])
+        return ''.join(out)
+
+    def _step(self, mm: mmap.mmap, first: int, count: int, ch: int) -> Optional[Tuple[int, int, int]]:
+        # binary search for the child on ch
+        lo, hi = first, first + count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            (mid_ch,) = struct.unpack_from("<I", mm, self._trie_off + mid * _NODE.size)
+            if mid_ch < ch:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo == first + count:
+            return None
+        node_ch, child_first, child_count, key = _NODE.unpack_from(mm, self._trie_off + lo * _NODE.size)
+        return (child_first, child_count, key) if node_ch == ch else None
+
+    def segment(self, text: str, traditional: bool = False) -> List[Tuple[str, Optional[Dict[str, Any]]]]:
+        """Split text into headwords, with as few pieces as possible.
+
+        Characters no headword covers come out as pieces of their own, with
+        no entry. Ties go to the split whose first piece is longest.
+        """
+        mm = self._mm or self._open()
+        result: List[Tuple[str, Optional[Dict[str, Any]]]] = []
+        i = 0
+        for end, key_index in self._split(mm, text):
+            entry = self._entry(mm, self._record(mm, key_index, traditional)) if key_index >= 0 else None
+            result.append((text[i:end], entry))
+            i = end
+        return result
+
+    def split(self, text: str) -> List[str]:
+        """The pieces of segment(text), without looking up their entries."""
+        mm = self._mm or self._open()
+        pieces = []
+        i = 0
+        for end, _ in self._split(mm, text):
+            pieces.append(text[i:end])
+            i = end
+        return pieces
+
+    def headwords(self, text: str) -> List[str]:
+        """Every headword in text, overlapping ones included, by where they start."""
+        mm = self._mm or self._open()
+        _, root_first, root_count, _ = _NODE.unpack_from(mm, self._trie_off)
+        steps = self._steps
+        found = []
+        for i in range(len(text)):
+            first, count = root_first, root_count
+            for end in range(i + 1, len(text) + 1):
+                if not count:
+                    break
+                ch = ord(text[end - 1])
+                step = steps.get(_step_key(first, ch), _UNSEEN)
+                if step is _UNSEEN:
+                    step = steps[_step_key(first, ch)] = self._step(mm, first, count, ch)
+                if step is None:
+                    break
+                first, count, key = step
+                if key:
+                    found.append(text[i:end])
+        return found
+
+    def _split(self, mm: mmap.mmap, text: str) -> List[Tuple[int, int]]:
+        """(end, key index or -1) of each piece of text, as segment() splits it."""
+        n = len(text)
+        _, root_first, root_count, _ = _NODE.unpack_from(mm, self._trie_off)
+        steps = self._steps
+        codes = [ord(ch) for ch in text]
+        # for text[i:]: the cost of its best split, pieces * (n + 1) + unknown
+        # characters so that one comparison orders them, where its first piece
+        # ends, and that piece's key index (-1 if it's an unknown character)
+        scale = n + 1
+        cost = [0] * (n + 1)
+        piece_end = [n] * (n + 1)
+        piece_key = [-1] * (n + 1)
+        for i in range(n - 1, -1, -1):
+            best, best_end, best_key = cost[i + 1] + scale + 1, i + 1, -1
+            # walk the trie along text[i:], for each headword text[i:end]
+            first, count = root_first, root_count
+            end = i
+            while count and end < n:
+                ch = codes[end]
+                end += 1
+                # _step_key(first, ch), inlined: this is the hot loop
+                k = first * 0x110000 + ch
+                step = steps.get(k, _UNSEEN)
+                if step is _UNSEEN:
+                    step = steps[k] = self._step(mm, first, count, ch)
+                if step is None:
+                    break
+                first, count, key = step
+                if key and cost[end] + scale <= best:
+                    best, best_end, best_key = cost[end] + scale, end, key - 1
+            cost[i], piece_end[i], piece_key[i] = best, best_end, best_key
+        ends = []
+        i = 0
+        while i < n:
+            ends.append((piece_end[i], piece_key[i]))
+            i = piece_end[i]
+        return ends
+
+
+if __name__ == '__main__':
+    src = sys.argv[1] if len(sys.argv) > 1 else default_source()
+    os.makedirs(data.data_dir, exist_ok=True)
+    build_index(src, default_index_path())
+    print(f"Wrote {default_index_path()} from {src}")
@@ -1,23 +1,69 @@
+from typing import Dict
+import io
+import json
 import os
-import re
+import sys
+import threading
 import nltk
 
 data_dir = os.path.expanduser('~/.anki_card_gen')
 images_dir = os.path.join(data_dir, 'images')
+corpora_stamp_path = os.path.join(data_dir, 'corpora.json')
 
-def init() -> None:
+CORPORA = ('wordnet', 'omw-1.4')
+
+# never touch the network, not even to check for corpus updates
+OFFLINE = os.environ.get('ANKI_VOCAB_OFFLINE', '') not in ('', '0')
+
+def init(offline: bool = OFFLINE) -> None:
     os.makedirs(data_dir, exist_ok=True)
     os.makedirs(images_dir, exist_ok=True)
     nltk.data.path.insert(0, data_dir)
 
-    nltk.download('wordnet', download_dir=data_dir)
-    nltk.download('omw-1.4', download_dir=data_dir)
-
-def get_new_image_path(word: str, extension: str) -> str:
-    sanitised_word = re.sub(r'[<>:"/\\|?*\s]', '_', word)
-    i = 0
-    potential_path = os.path.join(images_dir, f"{sanitised_word}.{extension}")
-    while os.path.exists(potential_path):
-        i += 1
-        potential_path = os.path.join(images_dir, f"{sanitised_word}_{i}.{extension}")
-    return potential_path
+    # If the corpora are exactly as they were when last verified, start
+    # straight away and leave the (network) update check to the background.
+    if _read_corpora_stamps() == _corpora_stamps():
+        if not offline:
+            threading.Thread(target=_download_corpora, args=(True,), daemon=True).start()
+        return
+    if not offline:
+        _download_corpora(False)
+
+def _corpora_stamps() -> Dict[str, str]:
+    return {name: corpus_stamp(name) for name in CORPORA}
+
+def _read_corpora_stamps() -> Dict[str, str]:
+    try:
+        with open(corpora_stamp_path, encoding='utf-8') as f:
+            stamps: Dict[str, str] = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    return stamps
+
+def _download_corpora(quiet: bool) -> None:
+    for name in CORPORA:
+        # a failed background check (e.g. no network) isn't worth reporting
+        nltk.download(name, download_dir=data_dir, quiet=quiet,
+                      print_error_to=io.StringIO() if quiet else sys.stderr)
+    stamps = _corpora_stamps()
+    if all(not stamp.endswith('=?') for stamp in stamps.values()):
+        tmp = f"{corpora_stamp_path}.tmp{os.getpid()}"
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(stamps, f)
+        os.replace(tmp, corpora_stamp_path)
+
+def corpus_stamp(name: str) -> str:
+    """Size/mtime stamp of an nltk corpus in data_dir, zipped or unpacked."""
+    root = os.path.join(data_dir, 'corpora', name)
+    if os.path.exists(root + '.zip'):
+        paths = [root + '.zip']
+    else:
+        paths = [os.path.join(d, f) for d, _, files in os.walk(root) for f in files]
+    if not paths:
+        return f"{name}=?"
+    size, mtime = 0, 0
+    for path in paths:
+        st = os.stat(path)
+        size += st.st_size
+        mtime = max(mtime, int(st.st_mtime))
+    return f"{name}={size}:{mtime}"
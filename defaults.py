@@ -1,28 +1,43 @@
-from dragonmapper.transcriptions import numbered_to_accented
-from nltk.corpus import wordnet
-from pycccedict.cccedict import CcCedict
+from cedict_index import CedictIndex, default_index_path
+from fuzzy_index import FuzzyIndex
 from pypinyin import pinyin, Style
-from typing import Callable, Dict, List, Any
-import eng_to_ipa
+from importlib import metadata
+from ipa_index import IpaIndex, format_ipa
+from sentence_index import SentenceIndex, default_source as sentences_source
+from tracing import span, traced
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from wordnet_index import SenseIndex
+import data
+import hashlib
+import os
 import re
 
-POS_MAP = {"n": "noun", "v": "verb", "a": "adjective", "r": "adverb"}
+POS_MAP = {"n": "noun", "v": "verb", "a": "adjective", "s": "adjective", "r": "adverb"}
+
+# precomputed from nltk's WordNet on first use (see wordnet_index.py)
+senses = SenseIndex()
+# a local sentence corpus, if there is one, compiled at startup (see sentence_index.py)
+sentences = SentenceIndex()
+
+# examples offered per option: they're picked with the keys 1-9
+MAX_EXAMPLES = 9
+# "did you mean" for terms neither dictionary knows, compiled from both at startup (see fuzzy_index.py)
+fuzzy = FuzzyIndex()
 
 def get_syn_options(word: str, lang: str) -> List[Dict[str, Any]]:
     options: List[Dict[str, Any]] = []
-    synsets = wordnet.synsets(word, lang=lang)
-    for syn in synsets:
-        definition = syn.definition() or ""
-        examples_list = syn.examples() or []
-        # bold occurrences of the term in each example sentence
-        pattern = re.compile(re.escape(word), re.IGNORECASE)
+    # bold occurrences of the term in each example sentence
+    pattern = re.compile(re.escape(word), re.IGNORECASE)
+    with span("wordnet"):
+        found = senses.senses(word, lang)
+    for sense in found:
         examples_list = [pattern.sub(lambda m: f"<b>{m.group(0)}</b>", ex)
-                         for ex in examples_list]
-        pos = POS_MAP[syn.pos()]
-        lemmas = [lemma.name().replace("_", " ") for lemma in syn.lemmas()]
+                         for ex in sense["examples"]]
+        pos = POS_MAP[sense["pos"]]
+        lemmas = [name.replace("_", " ") for name in sense["lemmas"]]
         synonyms = "; ".join([l for l in lemmas if l.lower() != word.lower()])
         options.append({
-            "definition": definition,
+            "definition": sense["definition"],
             "example": examples_list,
             "function": pos,
             "synonyms": synonyms,
@@ -30,12 +45,31 @@ def get_syn_options(word: str, lang: str) -> List[Dict[str, Any]]:
 
     return options
 
+def add_corpus_examples(options: List[Dict[str, Any]], word: str, lang: str) -> None:
+    """Fill the first option's examples up from the sentence corpus, after WordNet's own.
+
+    The corpus doesn't tell a word's senses apart, so its sentences are
+    offered once, under the option a card starts on, not under every sense.
+    """
+    first = options[0]
+    own = first.get("example", [])
+    if len(own) >= MAX_EXAMPLES:
+        return
+    with span("sentences"):
+        found = sentences.examples(word, lang, MAX_EXAMPLES)
+    if found:
+        first["example"] = own + [ex for ex in found if ex not in own][:MAX_EXAMPLES - len(own)]
+
 # ----------------------------------- ENGLISH ----------------------------------
 
+# the CMU dictionary, read into memory on first use (see ipa_index.py)
+ipa_index = IpaIndex()
+
+@traced("english_defaults", term=lambda word: word)
 def english_defaults(word: str) -> List[Dict[str, Any]]:
 
-    ipa_list = eng_to_ipa.convert(word, retrieve_all=True)
-    ipa = "/" + "; ".join(ipa_list) + "/"
+    with span("ipa"):
+        ipa = format_ipa(ipa_index.transcribe(word))
 
     options: List[Dict[str, Any]] = []
 
@@ -43,79 +77,178 @@ def english_defaults(word: str) -> List[Dict[str, Any]]:
         option["ipa"] = ipa
         options.append(option)
     if not options:
-        options.append({})
+        # phrases rarely have senses, but their words have transcriptions
+        options.append({"ipa": ipa} if ipa else {})
+        with span("fuzzy"):
+            suggestions = fuzzy.suggest(word, 'eng')
+        if suggestions:
+            options[0]["suggestions"] = suggestions
+    add_corpus_examples(options, word, 'eng')
 
     return options
 
-# ----------------------------------- CHINESE ----------------------------------
-# TODO: also add traditional Chinese support
-
-cccedict = CcCedict()
-
-
-# CL:個|个[ge4],項|项[xiang4]
-#         ^^^^^      ^^^^^^^^
-pinyin_re = re.compile(r'\[([^\]]+)\]')
-
-# CL:個|个[gè],項|项[xiàng]
-#    ^^^       ^^^
-trad_cl_re = re.compile(r'CL:([^\|]*).\|(.\[[^\]]+\])')
-
-# trad_other_re
-# 長沙|长沙[Cháng shā]
-# ^^^^^
-trad_other_re = re.compile(r' [^\[\]|]+\|([^\[\]|]+\[[^\[\]|]+\])')
-
-def fix_up_zh(defn: str) -> str:
-
-    changed = True
-    while changed:
-        defn_shift = pinyin_re.sub(lambda m: '[' + numbered_to_accented(m.group(1)) + ']', defn)
-        changed = defn_shift != defn
-        defn = defn_shift
+def english_prepare(words: List[str]) -> None:
+    """Transcribe upcoming terms in one pass, ahead of english_defaults for each."""
+    with span("ipa_many"):
+        ipa_index.transcribe_many(words)
 
-    changed = True
-    while trad_cl_re.search(defn):
-        defn_shift = trad_cl_re.sub(lambda m: 'CL:' + m.group(1) + m.group(2), defn)
-        changed = defn_shift != defn
-        defn = defn_shift
-
-    changed = True
-    while trad_other_re.search(defn):
-        defn_shift = trad_other_re.sub(lambda m: ' ' + m.group(1), defn)
-        changed = defn_shift != defn
-        defn = defn_shift
-
-    return defn
-
-def chinese_defaults(word: str) -> List[Dict[str, Any]]:
-
-    entry = cccedict.get_entry(word)
+# ----------------------------------- CHINESE ----------------------------------
+# Terms may be simplified, traditional or a mix; `traditional` picks which
+# forms the definitions show (see zh_fixup.py).
+
+# compiled on first use, then memory-mapped (see cedict_index.py)
+cedict = CedictIndex()
+
+
+def _display(entry: Dict[str, Any], traditional: bool) -> str:
+    return str(entry['display_traditional' if traditional else 'display'])
+
+def _traditional(simplified: str) -> str:
+    entry = cedict.get_entry(simplified)
+    return str(entry['traditional']) if entry is not None else simplified
+
+def _pieced_together(word: str, pieces: List[Tuple[str, Optional[Dict[str, Any]]]],
+                     traditional: bool) -> Tuple[str, str]:
+    """Pinyin and a gloss for word from its segmentation into headwords.
+
+    Words of two or more characters read as the dictionary has them;
+    pypinyin, which knows the context, reads the rest (single characters
+    are where polyphones bite).
+    """
+    with span("pypinyin"):
+        syllables = [syll[0] for syll in pinyin(word, style=Style.TONE, heteronym=False)]
+    if len(syllables) != len(word):
+        # pypinyin keeps runs of non-Chinese characters together
+        return " ".join(syllables), ""
+    readings = []
+    glosses = []
+    i = 0
+    for piece, entry in pieces:
+        if entry is not None and len(piece) > 1:
+            readings.append(entry['pinyin_accented'])
+            glosses.append(f"{piece}: {_display(entry, traditional).split('; ')[0]}")
+        else:
+            readings.extend(syllables[i:i + len(piece)])
+            # the entry may be for another reading of the character
+            if entry is not None and entry['pinyin_accented'].lower() == syllables[i].lower():
+                glosses.append(f"{piece}: {_display(entry, traditional).split('; ')[0]}")
+            else:
+                glosses.append(piece)
+        i += len(piece)
+    # a gloss only helps if the term has a word in it, not just characters
+    known_word = any(entry is not None and len(piece) > 1 for piece, entry in pieces)
+    return " ".join(readings), " + ".join(glosses) if known_word else ""
+
+@traced("chinese_defaults", term=lambda word, *_, **__: word)
+def chinese_defaults(word: str, traditional: bool = False) -> List[Dict[str, Any]]:
+
+    with span("cedict"):
+        entry = cedict.get_entry(word, traditional)
+        if entry is None:
+            # written in a mix of both scripts? Look it up in simplified; the
+            # entry shows itself in either script
+            converted = cedict.convert(word)
+            if converted != word:
+                entry = cedict.get_entry(converted, traditional)
     options: List[Dict[str, Any]] = []
 
-    # no cccedict entry found: use the pinyin of each character (less accurate)
+    # no cccedict entry found: piece the term together from the headwords in it
     if entry is None:
-        pinyin_list = pinyin(word, style=Style.TONE, heteronym=False)
-        pinyin_str = " ".join(syll[0] for syll in pinyin_list)
+        with span("segment"):
+            pieces = cedict.segment(word, traditional)
+        pinyin_str, gloss = _pieced_together(word, pieces, traditional)
+        if gloss:
+            options.append({
+                "definition": gloss,
+                "pinyin": pinyin_str,
+            })
     else:
-        pinyin_str = numbered_to_accented(entry['pinyin'])
-        definitions = entry['definitions']
-        definitions = '; '.join(map(lambda x: fix_up_zh(x.strip()), definitions))
+        # both normalized in bulk when the index was built
+        pinyin_str = entry['pinyin_accented']
         options.append({
-            "definition": definitions,
+            "definition": _display(entry, traditional),
             "pinyin": pinyin_str,
         })
 
-    for option in get_syn_options(word, lang='cmn'):
+    # WordNet's Chinese lemmas are simplified
+    for option in get_syn_options(entry['simplified'] if entry else cedict.convert(word), lang='cmn'):
         option["pinyin"] = pinyin_str
         options.append(option)
     if not options:
         options.append({})
+    if entry is None:
+        # a typo, or pinyin: headwords that sound alike
+        with span("fuzzy"):
+            suggestions = fuzzy.suggest(cedict.convert(word), 'cmn')
+        if traditional:
+            suggestions = [_traditional(s) for s in suggestions]
+        if suggestions:
+            options[0]["suggestions"] = suggestions
+    # as the corpus has them: the sentence index finds the term in either script
+    add_corpus_examples(options, word, 'cmn')
     return options
 
+def traditional_chinese_defaults(word: str) -> List[Dict[str, Any]]:
+    return chinese_defaults(word, traditional=True)
+
 # ------------------------------------------------------------------------------
 
 LANGUAGE_DEFAULTS: Dict[str, Callable[[str], List[Dict[str, Any]]]] = {
     "English": english_defaults,
     "Chinese": chinese_defaults,
+    "Chinese (Traditional)": traditional_chinese_defaults,
+}
+
+# optional: given a run of terms about to be looked up, do their shared work at once
+LANGUAGE_PREPARE: Dict[str, Callable[[List[str]], None]] = {
+    "English": english_prepare,
 }
+
+# ---------------------------------- VERSIONS ----------------------------------
+# Anything cached from the providers above is keyed by a version string built
+# from the dictionaries they read, so updating any of them invalidates it.
+
+# bump whenever the shape or formatting of default options changes
+DEFAULTS_FORMAT_VERSION = 5
+
+def _package_stamp(name: str) -> str:
+    try:
+        return f"{name}={metadata.version(name)}"
+    except metadata.PackageNotFoundError:
+        return f"{name}=?"
+
+def _file_stamp(name: str, path: str) -> str:
+    try:
+        st = os.stat(path)
+    except OSError:
+        return f"{name}=?"
+    return f"{name}={st.st_size}:{int(st.st_mtime)}"
+
+def _sentences_stamp() -> str:
+    source = sentences_source()
+    return _file_stamp("sentences", source) if source else "sentences=-"
+
+def lookups_settled() -> bool:
+    """Whether lookups give what they will for the rest of the version: not
+    while the sentence or fuzzy index is still being built, when they go
+    without corpus examples or suggestions."""
+    return (sentences_source() is None or sentences.ready()) and fuzzy.ready()
+
+def _chinese_dictionaries() -> List[str]:
+    return [
+        data.corpus_stamp("wordnet"), data.corpus_stamp("omw-1.4"), _package_stamp("nltk"),
+        _file_stamp("cedict", default_index_path()),
+        _package_stamp("dragonmapper"), _package_stamp("pypinyin"), _sentences_stamp(),
+    ]
+
+LANGUAGE_DICTIONARIES: Dict[str, Callable[[], List[str]]] = {
+    "English": lambda: [
+        data.corpus_stamp("wordnet"), _package_stamp("eng-to-ipa"), _package_stamp("nltk"), _sentences_stamp(),
+    ],
+    "Chinese": _chinese_dictionaries,
+    "Chinese (Traditional)": _chinese_dictionaries,
+}
+
+def dictionary_version(lang: str) -> str:
+    stamps = [str(DEFAULTS_FORMAT_VERSION)] + LANGUAGE_DICTIONARIES.get(lang, lambda: [])()
+    return hashlib.sha1("|".join(stamps).encode()).hexdigest()[:16]
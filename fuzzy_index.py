@@ -0,0 +1,352 @@
+"""Compiled, memory-mapped "did you mean" index, SymSpell style.
+
+For a term no dictionary knows (a typo, or an inflection morphy misses),
+suggestions are the known spellings within MAX_DISTANCE edits of it: for
+English, WordNet's lemmas and irregular forms; for Chinese, CC-CEDICT's
+headwords by their pinyin without tones, so a term typed as pinyin, or with
+a character for one that sounds the same, finds the word. Both are compiled
+once from the other two indexes into a flat file laid out as
+
+    header | deletes | keys | words | string pool
+
+where keys are the distinct spellings (a language code plus a word or
+pinyin), each pointing at a run of words, the headwords or lemmas spelled
+so, most common first (by SemCor tag count for English, number of
+definitions for Chinese); and deletes pair the crc32 of every string a key's
+first PREFIX_LENGTH characters make with up to MAX_DISTANCE characters
+deleted with the key, sorted so a lookup is a binary search. A term's own
+deletes find every key within MAX_DISTANCE edits (and a few more, which an
+edit distance check drops), so nothing is compared with the whole
+vocabulary.
+
+    python fuzzy_index.py [--term WORD --lang eng]
+
+rebuilds the index, or prints the suggestions for a term.
+"""
+from array import array
+from bisect import bisect_left
+from typing import Dict, Iterator, List, Optional, Set, Tuple
+import argparse
+import data
+import hashlib
+import mmap
+import os
+import re
+import struct
+import threading
+import time
+import unicodedata
+import zlib
+
+INDEX_MAGIC = b"FUZX"
+INDEX_FORMAT = 1
+
+MAX_DISTANCE = 2
+# only the start of a spelling is indexed, which bounds the deletes per key
+PREFIX_LENGTH = 7
+# suggestions offered: they're picked with the keys 1-9
+MAX_SUGGESTIONS = 9
+
+# magic, format, delete count, key count, word count, deletes/keys/words/pool offsets, source stamp
+_HEADER = struct.Struct("<4sIIIIQQQQ32s")
+# crc32 << 32 | key index, as one number so they sort together
+_DELETE = "Q"
+# pool offset, length, first word, word count
+_KEY = struct.Struct("<IIII")
+# pool offset, length, weight
+_WORD = struct.Struct("<III")
+
+_tone_re = re.compile(r"[^a-z]")
+
+def default_index_path() -> str:
+    return os.path.join(data.data_dir, 'fuzzy.idx')
+
+def sources_stamp() -> bytes:
+    import cedict_index, wordnet_index
+    stamp = "|".join([
+        wordnet_index.corpus_version(), cedict_index.source_stamp(cedict_index.default_source()).decode(),
+    ])
+    return hashlib.sha1(stamp.encode()).hexdigest()[:32].encode()
+
+def pinyin_key(pinyin: str) -> str:
+    """Pinyin as letters only: "Lu:4 xing2", "lǚxíng" and "lvxing" are all "lvxing"."""
+    pinyin = unicodedata.normalize('NFD', pinyin.lower()).replace("u\u0308", "v").replace("u:", "v")
+    return _tone_re.sub("", pinyin)
+
+def _key(lang: str, spelling: str) -> str:
+    return f"{lang}\x1f{spelling}"
+
+def _deletes(spelling: str, bound: int = MAX_DISTANCE) -> Set[str]:
+    """spelling's first PREFIX_LENGTH characters with up to bound characters deleted."""
+    found = {spelling[:PREFIX_LENGTH]}
+    last = found
+    for _ in range(bound):
+        last = {s[:i] + s[i + 1:] for s in last if len(s) > 1 for i in range(len(s))}
+        found |= last
+    return found
+
+def _delete_hash(lang: str, delete: str) -> int:
+    return zlib.crc32(_key(lang, delete).encode('utf-8'))
+
+def _bound(spelling: str) -> int:
+    # two edits make almost anything of a short word
+    return 1 if len(spelling) <= 4 else MAX_DISTANCE
+
+def _within(a: bytes, b: bytes, k: int) -> bool:
+    """Whether a is at most k > 0 edits (with adjacent transpositions) from b."""
+    i = 0
+    n = min(len(a), len(b))
+    while i < n and a[i] == b[i]:
+        i += 1
+    a, b = a[i:], b[i:]
+    if abs(len(a) - len(b)) > k:
+        return False
+    if not a or not b:
+        return True
+    # a's first character substituted, deleted or inserted before, or its first two swapped
+    if k == 1:
+        return a[1:] == b[1:] or a[1:] == b or a == b[1:] \
+            or (a[:1] == b[1:2] and a[1:2] == b[:1] and a[2:] == b[2:])
+    return _within(a[1:], b[1:], k - 1) or _within(a[1:], b, k - 1) or _within(a, b[1:], k - 1) \
+        or (a[:1] == b[1:2] and a[1:2] == b[:1] and _within(a[2:], b[2:], k - 1))
+
+def distance(a: bytes, b: bytes, bound: int = MAX_DISTANCE) -> int:
+    """Edit distance with adjacent transpositions, or bound + 1 if it's over bound.
+
+    Only ever a few edits, so trying each edit of the first characters
+    that differ beats filling in the whole table.
+    """
+    # the ends they share don't change it
+    i = 0
+    n = min(len(a), len(b))
+    while i < n and a[i] == b[i]:
+        i += 1
+    j = 0
+    n -= i
+    while j < n and a[-1 - j] == b[-1 - j]:
+        j += 1
+    a, b = a[i:len(a) - j], b[i:len(b) - j]
+    if a == b:
+        return 0
+    for k in range(1, bound + 1):
+        if _within(a, b, k):
+            return k
+    return bound + 1
+
+# ----------------------------------- BUILD ------------------------------------
+
+def _vocabulary() -> Iterator[Tuple[str, str, str, int]]:
+    """(language, spelling, word, weight) of everything suggestions may be."""
+    from defaults import cedict, senses
+    # irregular forms too, which morphy takes back to their lemmas once they're spelled right
+    for form, count in (senses.lemmas() | senses.inflections()).items():
+        yield "eng", form.replace("_", " "), form.replace("_", " "), count
+    for entry in cedict.entries():
+        spelling = pinyin_key(entry['pinyin'])
+        if spelling:
+            yield "cmn", spelling, entry['simplified'], len(entry['definitions'])
+
+def build_index(dest: str) -> None:
+    # (language, spelling) -> word -> weight
+    spellings: Dict[Tuple[str, str], Dict[str, int]] = {}
+    for lang, spelling, word, weight in _vocabulary():
+        words = spellings.setdefault((lang, spelling), {})
+        words[word] = max(words.get(word, 0), weight)
+
+    pool = bytearray()
+    def add(b: bytes) -> Tuple[int, int]:
+        pool.extend(b)
+        return len(pool) - len(b), len(b)
+
+    keys = bytearray()
+    words_out = bytearray()
+    deletes: List[int] = []
+    n_words = 0
+    for i, (lang, spelling) in enumerate(sorted(spellings)):
+        words = spellings[lang, spelling]
+        keys.extend(_KEY.pack(*add(spelling.encode('utf-8')), n_words, len(words)))
+        for word in sorted(words, key=lambda w: (-words[w], w)):
+            words_out.extend(_WORD.pack(*add(word.encode('utf-8')), words[word]))
+        n_words += len(words)
+        deletes.extend(_delete_hash(lang, d) << 32 | i for d in _deletes(spelling))
+    deletes.sort()
+    delete_table = array(_DELETE, deletes).tobytes()
+
+    deletes_off = _HEADER.size
+    keys_off = deletes_off + len(delete_table)
+    words_off = keys_off + len(keys)
+    pool_off = words_off + len(words_out)
+    header = _HEADER.pack(
+        INDEX_MAGIC, INDEX_FORMAT, len(deletes), len(spellings), n_words,
+        deletes_off, keys_off, words_off, pool_off, sources_stamp(),
+    )
+
+    os.makedirs(os.path.dirname(os.path.abspath(dest)), exist_ok=True)
+    tmp = f"{dest}.tmp{os.getpid()}"
+    try:
+        with open(tmp, 'wb') as f:
+            f.write(header)
+            f.write(delete_table)
+            f.write(keys)
+            f.write(words_out)
+            f.write(pool)
+        os.replace(tmp, dest)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+# ----------------------------------- LOOKUP -----------------------------------
+
+class FuzzyIndex:
+    """Read-only view of a compiled fuzzy index.
+
+    Building it takes a while, so lookups never do: until load() has built
+    (or opened) a current index, they suggest nothing.
+    """
+
+    def __init__(self, path: Optional[str] = None) -> None:
+        self.path = path or default_index_path()
+        self._lock = threading.Lock()
+        self._build_lock = threading.Lock()
+        self._mm: Optional[mmap.mmap] = None
+        self._delete_table: Optional[memoryview] = None
+        self._keys_off = 0
+        self._words_off = 0
+        self._pool_off = 0
+
+    def _read_header(self, mm: mmap.mmap) -> Optional[Tuple[int, ...]]:
+        if len(mm) < _HEADER.size:
+            return None
+        magic, fmt, n_deletes, _, _, *offsets, stamp = _HEADER.unpack_from(mm, 0)
+        if magic != INDEX_MAGIC or fmt != INDEX_FORMAT or stamp != sources_stamp():
+            return None
+        return (n_deletes, *offsets)
+
+    def _map(self) -> Optional[mmap.mmap]:
+        try:
+            with open(self.path, 'rb') as f:
+                return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            return None
+
+    def _open(self) -> Optional[mmap.mmap]:
+        """The index, if it's current; None (until load() has built it) if not."""
+        with self._lock:
+            if self._mm is not None:
+                return self._mm
+            mm = self._map()
+            header = self._read_header(mm) if mm is not None else None
+            if mm is None or header is None:
+                # missing, from an older format, or WordNet or CC-CEDICT changed
+                if mm is not None:
+                    mm.close()
+                return None
+            n_deletes, deletes_off, self._keys_off, self._words_off, self._pool_off = header
+            size = array(_DELETE).itemsize
+            self._delete_table = memoryview(mm)[deletes_off:deletes_off + n_deletes * size].cast("Q")
+            self._mm = mm
+            return mm
+
+    def load(self) -> None:
+        """Build the index if it's missing or out of date, and open it. Slow
+        the first time; lookups made meanwhile don't wait for it."""
+        with self._build_lock:
+            if self._mm is not None or self._open() is not None:
+                return
+            build_index(self.path)
+        if self._open() is None:
+            raise RuntimeError(f"Could not open fuzzy index at {self.path}")
+
+    def ready(self) -> bool:
+        """Whether lookups make suggestions now."""
+        return (self._mm or self._open()) is not None
+
+    def _str(self, mm: mmap.mmap, offset: int, length: int) -> str:
+        start = self._pool_off + offset
+        return mm[start:start + length].decode('utf-8')
+
+    def _key_indexes(self, lang: str, spelling: str, bound: int) -> Set[int]:
+        """The keys that share a delete with spelling: every one within bound edits, and then some."""
+        table = self._delete_table
+        assert table is not None
+        found = set()
+        for delete in _deletes(spelling, bound):
+            h = _delete_hash(lang, delete)
+            i = bisect_left(table, h << 32)
+            while i < len(table) and table[i] >> 32 == h:
+                found.add(table[i] & 0xffffffff)
+                i += 1
+        return found
+
+    def suggest(self, term: str, lang: str, n: int = MAX_SUGGESTIONS) -> List[str]:
+        """Up to n known words spelled as few edits from term as any, commonest first.
+
+        One edit is tried first, and two (for all but short terms) only if
+        nothing is one edit away. Chinese terms are matched by pinyin,
+        whether typed as pinyin or in characters, and the words that are
+        spelled the same come first.
+        """
+        # the term as the words it mustn't suggest are written: any casing of it for English
+        if lang == "eng":
+            spelling = same = term.strip().lower()
+        elif lang == "cmn":
+            from pypinyin import lazy_pinyin
+            same = term.strip()
+            spelling = pinyin_key("".join(lazy_pinyin(same)))
+        else:
+            return []
+        if not spelling:
+            return []
+        mm = self._mm or self._open()
+        if mm is None:
+            return []
+        for bound in range(1, _bound(spelling) + 1):
+            suggestions = self._suggest(mm, same, lang, spelling, bound, n)
+            if suggestions:
+                return suggestions
+        return []
+
+    def _suggest(self, mm: mmap.mmap, same: str, lang: str, spelling: str, bound: int, n: int) -> List[str]:
+        # compared as UTF-8, which is the same for pinyin and (nearly all) lemmas
+        target = spelling.encode('utf-8')
+        # (distance, -weight, word index) of every word within bound; only the best are read
+        near: List[Tuple[int, int, int]] = []
+        for key_index in self._key_indexes(lang, spelling, bound):
+            off, length, first, count = _KEY.unpack_from(mm, self._keys_off + key_index * _KEY.size)
+            if abs(length - len(target)) > bound:
+                continue
+            start = self._pool_off + off
+            d = distance(target, mm[start:start + length], bound)
+            if d > bound:
+                continue
+            for i in range(first, first + count):
+                near.append((d, -_WORD.unpack_from(mm, self._words_off + i * _WORD.size)[2], i))
+        suggestions: List[str] = []
+        for _, _, i in sorted(near):
+            off, length, _ = _WORD.unpack_from(mm, self._words_off + i * _WORD.size)
+            word = self._str(mm, off, length)
+            if (word.lower() if lang == "eng" else word) != same and word not in suggestions:
+                suggestions.append(word)
+                if len(suggestions) >= n:
+                    break
+        return suggestions
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Build or query the did-you-mean index.")
+    parser.add_argument("--term", help="print the suggestions for this term")
+    parser.add_argument("--lang", default="eng", choices=("eng", "cmn"), help="language of --term (default: eng)")
+    args = parser.parse_args()
+
+    data.init(offline=True)
+    if args.term:
+        index = FuzzyIndex()
+        index.load()
+        start = time.perf_counter()
+        suggestions = index.suggest(args.term, args.lang)
+        for suggestion in suggestions:
+            print(suggestion)
+        print(f"{len(suggestions)} suggestions in {(time.perf_counter() - start) * 1000:.2f}ms")
+    else:
+        start = time.perf_counter()
+        build_index(default_index_path())
+        print(f"Wrote {default_index_path()} in {time.perf_counter() - start:.1f}s")
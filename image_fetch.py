@@ -0,0 +1,122 @@
+"""Background download of dropped image URLs.
+
+The response is streamed in chunks to a scratch file in the image store,
+so a slow host never blocks the GUI and a large image never sits in memory.
+The file type is sniffed from the first bytes, and the size limit, time limit
+and cancellation are checked between chunks.
+"""
+from PyQt5.QtCore import QObject, pyqtSignal
+from typing import Callable
+from image_store import get_store
+from urllib.parse import urlparse
+import hashlib
+import imghdr
+import os
+import threading
+import time
+import urllib.request
+
+MAX_IMAGE_BYTES = int(os.environ.get("ANKI_VOCAB_MAX_IMAGE_MB", "20")) * 1024 * 1024
+# for the whole download; any single read gives up after SOCKET_TIMEOUT
+IMAGE_TIMEOUT = 60.0
+SOCKET_TIMEOUT = 10.0
+CHUNK_SIZE = 64 * 1024
+
+class DownloadError(Exception):
+    pass
+
+class DownloadCancelled(DownloadError):
+    pass
+
+def image_extension(head: bytes, url: str) -> str:
+    """Extension for an image from its first bytes, else from its URL."""
+    detected = imghdr.what(None, head)
+    return (
+        'jpg' if detected == 'jpeg'
+        else detected
+    ) or os.path.splitext(urlparse(url).path)[1].lstrip('.') or 'jpg'
+
+def download_image(url: str, lang: str, term: str,
+                   cancelled: Callable[[], bool] = lambda: False,
+                   progress: Callable[[int, int], None] = lambda received, total: None,
+                   max_bytes: int = MAX_IMAGE_BYTES, timeout: float = IMAGE_TIMEOUT) -> str:
+    """Download url into the image store as the image of term (in lang).
+
+    progress is called with (bytes received, Content-Length or 0) after each
+    chunk. Returns the saved path; raises DownloadError on failure.
+    """
+    deadline = time.monotonic() + timeout
+    store = get_store()
+    out, tmp = store.temp_file()
+    digest = hashlib.sha1()
+    try:
+        with out, urllib.request.urlopen(url, timeout=min(timeout, SOCKET_TIMEOUT)) as resp:
+            total = int(resp.headers.get('Content-Length') or 0)
+            if total > max_bytes:
+                raise DownloadError(f"image is too large ({total // 1024} KB)")
+            head = b""
+            received = 0
+            while True:
+                if cancelled():
+                    raise DownloadCancelled("download cancelled")
+                if time.monotonic() > deadline:
+                    raise DownloadError(f"download timed out after {timeout:g}s")
+                chunk = resp.read1(CHUNK_SIZE)
+                if not chunk:
+                    break
+                if not head:
+                    head = chunk[:32]
+                    # a link to a web page rather than to the image itself
+                    if imghdr.what(None, head) is None and resp.headers.get_content_maintype() == 'text':
+                        raise DownloadError(f"not an image ({resp.headers.get_content_type()})")
+                received += len(chunk)
+                if received > max_bytes:
+                    raise DownloadError(f"image is too large (over {max_bytes // 1024} KB)")
+                digest.update(chunk)
+                out.write(chunk)
+                progress(received, total)
+        return store.adopt(tmp, digest.hexdigest(), image_extension(head, url), lang, term)
+    except DownloadError:
+        raise
+    except Exception as e:
+        raise DownloadError(str(e)) from e
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+class ImageDownload(QObject):
+    """download_image on a background thread, reporting back through signals."""
+
+    # emitted on the GUI thread via queued connections
+    progress = pyqtSignal(int, int)
+    done = pyqtSignal(str)
+    failed = pyqtSignal(str)
+
+    def __init__(self, url: str, lang: str, term: str) -> None:
+        super().__init__()
+        self.url = url
+        self.lang = lang
+        self.term = term
+        self._cancel = threading.Event()
+
+    def start(self) -> None:
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def cancel(self) -> None:
+        """Stop at the next chunk; nothing is emitted after this."""
+        self._cancel.set()
+
+    def _run(self) -> None:
+        try:
+            path = download_image(self.url, self.lang, self.term, self._cancel.is_set, self.progress.emit)
+        except DownloadCancelled:
+            return
+        except DownloadError as e:
+            if not self._cancel.is_set():
+                self.failed.emit(str(e))
+            return
+        if self._cancel.is_set():
+            # the file may be shared with other terms and cards: unindex it, and let gc() decide
+            get_store().forget(self.lang, self.term)
+            return
+        self.done.emit(path)
@@ -0,0 +1,193 @@
+"""Content-addressed store for card images.
+
+Every image is saved once under images_dir as <sha1>.<ext>, however many
+times (or for however many terms) it is dropped. An index maps each term
+(per language) to the image on its card; images neither a term nor a saved
+card (see card_store.py) refers to any more are deleted by
+
+    python image_store.py gc [--dry-run]
+"""
+from typing import Dict, IO, Iterable, List, Optional, Tuple
+import argparse
+import data
+import hashlib
+import os
+import re
+import sqlite3
+import tempfile
+import threading
+import time
+
+# gc leaves files this recent alone, in case a running app is still indexing them
+GC_GRACE_SECONDS = 3600
+
+_blob_re = re.compile(r'^([0-9a-f]{40})\.(\w+)$')
+_thumb_re = re.compile(r'^([0-9a-f]{40})_\d+\.png$')
+
+def content_hash(path: str) -> str:
+    h = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+def stored_digest(path: str) -> Optional[str]:
+    """The content hash of a file in the store, read off its name."""
+    m = _blob_re.match(os.path.basename(path))
+    if m is None or os.path.dirname(os.path.abspath(path)) != os.path.abspath(data.images_dir):
+        return None
+    return m.group(1)
+
+class ImageStore:
+    """Deduplicating image files plus the term -> image index."""
+
+    def __init__(self, root: str, index_path: str) -> None:
+        self.root = root
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(index_path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS blobs ("
+            " digest TEXT PRIMARY KEY, ext TEXT NOT NULL, size INTEGER NOT NULL)"
+        )
+        columns = [row[1] for row in self._conn.execute("PRAGMA table_info(terms)")]
+        if columns and "lang" not in columns:
+            # indexes from before terms were kept per language: their language isn't known
+            self._conn.execute("ALTER TABLE terms RENAME TO terms_v1")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS terms ("
+            " lang TEXT NOT NULL, term TEXT NOT NULL, digest TEXT NOT NULL, added REAL NOT NULL,"
+            " PRIMARY KEY (lang, term))"
+        )
+        if columns and "lang" not in columns:
+            self._conn.execute("INSERT INTO terms SELECT '', term, digest, added FROM terms_v1")
+            self._conn.execute("DROP TABLE terms_v1")
+
+    def path(self, digest: str, ext: str) -> str:
+        return os.path.join(self.root, f"{digest}.{ext}")
+
+    def temp_file(self) -> Tuple[IO[bytes], str]:
+        """An open scratch file in the store, to be passed to adopt()."""
+        fd, tmp = tempfile.mkstemp(prefix='.incoming-', suffix='.part', dir=self.root)
+        return os.fdopen(fd, 'wb'), tmp
+
+    def adopt(self, tmp: str, digest: str, ext: str, lang: str, term: str) -> str:
+        """Move a scratch file with the given content hash into the store as
+        term's image, and return its path. If the store already has the same
+        content, the scratch file is dropped instead."""
+        with self._lock:
+            row = self._conn.execute("SELECT ext FROM blobs WHERE digest = ?", (digest,)).fetchone()
+            if row is not None:
+                ext = row[0]
+            dest = self.path(digest, ext)
+            if row is not None and os.path.exists(dest):
+                os.remove(tmp)
+            else:
+                size = os.path.getsize(tmp)
+                # atomic: a concurrent adopt of the same content writes the same bytes
+                os.replace(tmp, dest)
+                self._conn.execute("INSERT OR REPLACE INTO blobs VALUES (?, ?, ?)", (digest, ext, size))
+            self._conn.execute(
+                "INSERT OR REPLACE INTO terms VALUES (?, ?, ?, ?)", (lang, term, digest, time.time())
+            )
+        return dest
+
+    def add_file(self, src: str, lang: str, term: str, ext: str) -> str:
+        """Copy src into the store as term's image, and return its path."""
+        h = hashlib.sha1()
+        out, tmp = self.temp_file()
+        try:
+            with out, open(src, 'rb') as f:
+                for chunk in iter(lambda: f.read(1 << 20), b''):
+                    h.update(chunk)
+                    out.write(chunk)
+        except BaseException:
+            os.remove(tmp)
+            raise
+        return self.adopt(tmp, h.hexdigest(), ext, lang, term)
+
+    def image_for(self, lang: str, term: str) -> Optional[str]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT blobs.digest, blobs.ext FROM terms JOIN blobs USING (digest)"
+                " WHERE lang = ? AND term = ?",
+                (lang, term),
+            ).fetchone()
+        return None if row is None else self.path(row[0], row[1])
+
+    def forget(self, lang: str, term: str) -> None:
+        """Drop term's image from the index; gc then deletes it if unshared."""
+        with self._lock:
+            self._conn.execute("DELETE FROM terms WHERE lang = ? AND term = ?", (lang, term))
+
+    def gc(self, dry_run: bool = False, grace: float = GC_GRACE_SECONDS,
+           card_images: Optional[Iterable[Optional[str]]] = None) -> Dict[str, int]:
+        """Delete images (and their thumbnails) that no term or saved card refers to.
+
+        card_images are the image paths of the cards not exported yet, by
+        default those in the card store: a term's image may have changed
+        since its card was saved.
+        """
+        if card_images is None:
+            from card_store import get_card_store
+            card_images = (card.image for card in get_card_store().cards())
+        in_cards = set()
+        for image in card_images:
+            m = _blob_re.match(os.path.basename(image or ""))
+            if m is not None:
+                in_cards.add(m.group(1))
+        with self._lock:
+            referenced = {digest for digest, in self._conn.execute("SELECT DISTINCT digest FROM terms")}
+            referenced |= in_cards
+            cutoff = time.time() - grace
+            doomed: List[str] = []
+            doomed_digests: List[str] = []
+            for name in os.listdir(self.root):
+                m = _blob_re.match(name)
+                if m is None or m.group(1) in referenced:
+                    continue
+                path = os.path.join(self.root, name)
+                if os.path.getmtime(path) < cutoff:
+                    doomed.append(path)
+                    doomed_digests.append(m.group(1))
+            thumbs = os.path.join(self.root, 'thumbs')
+            if os.path.isdir(thumbs):
+                for name in os.listdir(thumbs):
+                    m = _thumb_re.match(name)
+                    if m is not None and m.group(1) not in referenced:
+                        doomed.append(os.path.join(thumbs, name))
+
+            freed = 0
+            for path in doomed:
+                freed += os.path.getsize(path)
+                if not dry_run:
+                    os.remove(path)
+            if not dry_run:
+                self._conn.executemany("DELETE FROM blobs WHERE digest = ?", ((d,) for d in doomed_digests))
+        return {"files": len(doomed), "bytes": freed}
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+_store: Optional[ImageStore] = None
+
+def get_store() -> ImageStore:
+    global _store
+    if _store is None:
+        os.makedirs(data.images_dir, exist_ok=True)
+        _store = ImageStore(data.images_dir, os.path.join(data.data_dir, 'images.sqlite3'))
+    return _store
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Manage the card image store.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    gc_parser = sub.add_parser("gc", help="delete images no term or saved card refers to")
+    gc_parser.add_argument("--dry-run", action="store_true", help="only report what would be deleted")
+    args = parser.parse_args()
+
+    result = get_store().gc(dry_run=args.dry_run)
+    verb = "Would delete" if args.dry_run else "Deleted"
+    print(f"{verb} {result['files']} files ({result['bytes'] / 1e6:.1f} MB)")
@@ -0,0 +1,172 @@
+"""Running text (an article, a chapter) into a ranked list of terms to queue.
+
+Text is fed in chunks as it's read. Each chunk is only counted: Chinese as
+runs of Han characters, English as lowercased words. Once the text is all
+in, each distinct run or word is segmented or lemmatized once, however often
+it occurred:
+
+- Chinese runs are split into CC-CEDICT headwords (see CedictIndex.split);
+  single characters, mostly function words, aren't candidates.
+- English words go through WordNet's morphy, so "ran" and "running" both
+  count towards "run"; words WordNet doesn't know, and words that only ever
+  appear capitalized (names, mostly), are dropped.
+
+Function words (a short closed list per language) are dropped too, and the
+rest are ranked by in-text frequency against how common they are in
+general: for English, how often WordNet's SemCor corpus tagged them; for
+Chinese, with no frequency data on disk, the breadth of the CC-CEDICT entry
+(common words have many definitions).
+
+    python ingest.py [--lang Chinese] [--top 200] [article.txt]
+
+prints the ranked terms of a text (default: stdin).
+"""
+from collections import Counter
+from typing import Callable, Dict, Iterable, List, Set, TextIO, Tuple
+import argparse
+import data
+import math
+import re
+import sys
+import time
+
+# terms queued from one text
+INGEST_TOP = 200
+# characters read from a file at a time
+CHUNK_CHARS = 1 << 16
+
+_han_re = re.compile(r"[㐀-䶿一-鿿豈-﫿\U00020000-\U0002fa1f]+")
+_word_re = re.compile(r"[A-Za-z]+(?:['’-][A-Za-z]+)*")
+_possessive_re = re.compile(r"['’]s$")
+
+def is_chinese(lang: str) -> bool:
+    return lang.startswith("Chinese")
+
+# closed-class words, which WordNet and CC-CEDICT list (WHO, IT, ...) but are never worth a card
+STOP_WORDS_EN = frozenset("""
+    about above after again against all also although among and another any are because been before
+    being below between both but can could did does doing down during each either else even ever every
+    few for from had has have having her here hers herself him himself his how however into its itself
+    just less many may might more most much must neither never nor not now off once only other our ours
+    ourselves out over own per rather same shall she should since some such than that the their theirs
+    them themselves then there these they this those though through thus too under until upon very was
+    were what whatever when where whether which while who whom whose why will with within without would
+    yet you your yours yourself yourselves
+""".split())
+STOP_WORDS_ZH = frozenset("""
+    我们 你们 他们 她们 它们 咱们 自己 大家 这个 那个 这些 那些 这样 那样 这里 那里 这么 那么 什么 怎么
+    怎样 为什么 哪里 哪个 因为 所以 但是 可是 而且 并且 或者 还是 如果 虽然 然后 因此 于是 不过 只是 就是
+    不是 没有 已经 一个 一些 一样 一起 可以 可能 应该 需要 非常 比较 还有 以及 对于 关于 通过 由于 为了 之后
+    以后 之前 以前 时候 现在 其中 其他 另外 所有 每个 一直 一定 也许 的话 之一 起来 出来 下来 上来 进行
+""".split())
+
+def _score(count: int, weight: float) -> float:
+    return math.log1p(count) * weight
+
+class Ingester:
+    """Counts the words of a text fed in chunks, then ranks them."""
+
+    def __init__(self, lang: str) -> None:
+        self.lang = lang
+        self.chars = 0
+        self._counts: Counter[str] = Counter()
+        # English words seen lowercased at least once
+        self._lowercase: Set[str] = set()
+        # the end of the last chunk, which may continue in the next one
+        self._tail = ""
+
+    def feed(self, text: str) -> None:
+        self.chars += len(text)
+        text = self._tail + text
+        cut = len(text)
+        while cut and (text[cut - 1].isalnum() or text[cut - 1] in "'’-"):
+            cut -= 1
+        self._tail = text[cut:]
+        self._count(text[:cut])
+
+    def _count(self, text: str) -> None:
+        if is_chinese(self.lang):
+            self._counts.update(_han_re.findall(text))
+            return
+        for word in _word_re.findall(text):
+            word = _possessive_re.sub("", word)
+            lower = word.lower()
+            self._counts[lower] += 1
+            if word == lower:
+                self._lowercase.add(lower)
+
+    def close(self) -> None:
+        self._count(self._tail)
+        self._tail = ""
+
+    def _candidates_zh(self) -> Dict[str, Tuple[int, float]]:
+        from defaults import cedict
+        traditional = self.lang == "Chinese (Traditional)"
+        counts: Counter[str] = Counter()
+        for run, n in self._counts.items():
+            for piece in cedict.split(run):
+                if len(piece) > 1:
+                    counts[piece] += n
+        candidates: Dict[str, Tuple[int, float]] = {}
+        for word, n in counts.items():
+            entry = cedict.get_entry(word, traditional)
+            if entry is None or entry['simplified'] in STOP_WORDS_ZH:
+                continue
+            # the same word in either script counts as one, in the script of the cards
+            word = entry['traditional' if traditional else 'simplified']
+            total, _ = candidates.get(word, (0, 0.0))
+            # squared, since the number of definitions says so little
+            candidates[word] = (total + n, 1 / (1 + len(entry['definitions'])) ** 2)
+        return candidates
+
+    def _candidates_en(self) -> Dict[str, Tuple[int, float]]:
+        from defaults import senses
+        counts: Counter[str] = Counter()
+        for word, n in self._counts.items():
+            if word not in self._lowercase or len(word) < 3 or word in STOP_WORDS_EN:
+                continue
+            lemma = senses.lemmatize(word)
+            if lemma is not None and lemma not in STOP_WORDS_EN:
+                counts[lemma] += n
+        return {lemma: (n, 1 / math.sqrt(1 + senses.tag_count(lemma))) for lemma, n in counts.items()}
+
+    def ranked(self, n: int = INGEST_TOP, skip: Callable[[str], bool] = lambda _: False) -> List[str]:
+        """The n best candidates, best first, leaving out those skip() is true for."""
+        self.close()
+        candidates = self._candidates_zh() if is_chinese(self.lang) else self._candidates_en()
+        order = sorted(candidates, key=lambda w: (-_score(*candidates[w]), w))
+        return [word for word in order if not skip(word)][:n]
+
+def read_chunks(f: TextIO, size: int = CHUNK_CHARS) -> Iterable[str]:
+    while chunk := f.read(size):
+        yield chunk
+
+def ingest(chunks: Iterable[str], lang: str, n: int = INGEST_TOP,
+           skip: Callable[[str], bool] = lambda _: False) -> List[str]:
+    ingester = Ingester(lang)
+    for chunk in chunks:
+        ingester.feed(chunk)
+    return ingester.ranked(n, skip)
+
+def ingest_file(path: str, lang: str, n: int = INGEST_TOP,
+                skip: Callable[[str], bool] = lambda _: False) -> List[str]:
+    with open(path, encoding='utf-8', errors='replace') as f:
+        return ingest(read_chunks(f), lang, n, skip)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Rank the words of a text for the queue.")
+    parser.add_argument("path", nargs="?", help="text file to read (default: stdin)")
+    parser.add_argument("--lang", default="Chinese", help="language of the text (default: Chinese)")
+    parser.add_argument("--top", type=int, default=INGEST_TOP, help=f"terms to print (default: {INGEST_TOP})")
+    args = parser.parse_args()
+
+    data.init(offline=True)
+    start = time.perf_counter()
+    if args.path:
+        terms = ingest_file(args.path, args.lang, args.top)
+    else:
+        terms = ingest(read_chunks(sys.stdin), args.lang, args.top)
+    for term in terms:
+        print(term)
+    print(f"{len(terms)} terms in {time.perf_counter() - start:.2f}s", file=sys.stderr)
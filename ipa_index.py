@@ -0,0 +1,130 @@
+"""English IPA from the CMU pronouncing dictionary bundled with eng_to_ipa.
+
+eng_to_ipa.convert() connects to its SQLite copy of the dictionary and
+queries it on every call. Here the table is read into a dict once (a fraction
+of a second, ~20MB), each token's transcriptions are worked out once and
+kept, and terms of several words are transcribed token by token: hyphenated
+words are split, and rather than every combination of the tokens'
+alternatives only a few variants are listed.
+
+    python ipa_index.py [words.txt]
+
+prints the IPA of each term in a word list (default: stdin).
+"""
+from eng_to_ipa.transcribe import cmu_to_ipa
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+import eng_to_ipa
+import fileinput
+import re
+import sqlite3
+import sys
+import threading
+
+# transcriptions listed for a term of several words
+MAX_VARIANTS = 4
+
+_hyphen_re = re.compile(r"[\-‐-―/]+")
+# what eng_to_ipa strips off the ends of each word
+_PUNCT = '!"#$%&\'()*+,-./:;<=>/?@[\\]^_`{|}~«» '
+
+def default_source() -> str:
+    return str(Path(eng_to_ipa.__file__).parent / 'resources' / 'CMU_dict.db')
+
+def format_ipa(transcriptions: List[str]) -> str:
+    return "/" + "; ".join(transcriptions) + "/" if transcriptions else ""
+
+def _entry(phonemes: Dict[str, str], token: str) -> str:
+    # as written first, for entries like "ol'" and "standin'"
+    return token if token in phonemes else token.strip(_PUNCT)
+
+class IpaIndex:
+    """The CMU dictionary in memory, read in on first lookup."""
+
+    def __init__(self, source: Optional[str] = None) -> None:
+        self.source = source
+        self._lock = threading.Lock()
+        self._phonemes: Optional[Dict[str, str]] = None
+        self._tokens: Dict[str, List[str]] = {}
+
+    def load(self) -> Dict[str, str]:
+        with self._lock:
+            if self._phonemes is None:
+                conn = sqlite3.connect(f"file:{self.source or default_source()}?mode=ro", uri=True)
+                try:
+                    # a word's alternative pronunciations, newline-separated
+                    phonemes: Dict[str, str] = {}
+                    for word, ph in conn.execute("SELECT word, phonemes FROM dictionary ORDER BY id"):
+                        phonemes[word] = f"{phonemes[word]}\n{ph}" if word in phonemes else ph
+                finally:
+                    conn.close()
+                self._phonemes = phonemes
+            return self._phonemes
+
+    def token(self, token: str) -> List[str]:
+        """A single word's transcriptions, sorted like eng_to_ipa's; [] if unknown."""
+        token = token.lower()
+        found = self._tokens.get(token)
+        if found is None:
+            known = self.load()
+            phonemes = known.get(_entry(known, token))
+            found = cmu_to_ipa([phonemes.split("\n")])[0] if phonemes else []
+            self._tokens[token] = found
+        return found
+
+    def transcribe(self, term: str) -> List[str]:
+        """Transcriptions of term, [] if none of its words are known.
+
+        Unknown words of a longer term are kept as spelled, marked with a *
+        as eng_to_ipa does.
+        """
+        tokens = []
+        for word in term.split():
+            # hyphenated words the dictionary doesn't list are split
+            if self.token(word) or not _hyphen_re.search(word):
+                tokens.append(word)
+            else:
+                tokens += _hyphen_re.split(word)
+        tokens = [t for t in tokens if t.strip(_PUNCT)]
+        found = [self.token(t) for t in tokens]
+        if not any(found):
+            return []
+        if len(tokens) == 1:
+            return found[0]
+        # eng_to_ipa's pick for each word, then that with one word swapped at a time
+        alts = [f or [t.strip(_PUNCT).lower() + "*"] for t, f in zip(tokens, found)]
+        top = [a[-1] for a in alts]
+        variants = [" ".join(top)]
+        for i, a in enumerate(alts):
+            for alt in a[:-1]:
+                if len(variants) >= MAX_VARIANTS:
+                    return variants
+                variants.append(" ".join(top[:i] + [alt] + top[i + 1:]))
+        return variants
+
+    def transcribe_many(self, terms: Iterable[str]) -> Dict[str, List[str]]:
+        """transcribe() over many terms, e.g. the upcoming queue or a chunk of a
+        word list: the words among them not seen yet are converted in one pass."""
+        phonemes = self.load()
+        terms = list(dict.fromkeys(terms))
+        new: Dict[str, None] = {}
+        for term in terms:
+            for word in term.split():
+                for token in [word] + _hyphen_re.split(word):
+                    token = token.lower()
+                    if token.strip(_PUNCT) and token not in self._tokens:
+                        new[token] = None
+        entries = {token: _entry(phonemes, token) for token in new}
+        known = [token for token in new if entries[token] in phonemes]
+        for token, found in zip(known, cmu_to_ipa([phonemes[entries[token]].split("\n") for token in known])):
+            self._tokens[token] = found
+        for token in new:
+            self._tokens.setdefault(token, [])
+        return {term: self.transcribe(term) for term in terms}
+
+
+if __name__ == '__main__':
+    with fileinput.input(sys.argv[1:], encoding='utf-8') as lines:
+        terms = [line.strip() for line in lines if line.strip()]
+    for term, transcriptions in IpaIndex().transcribe_many(terms).items():
+        print(f"{term}\t{format_ipa(transcriptions)}")
@@ -0,0 +1,214 @@
+"""Crash-safe session journal.
+
+Everything that changes the session (queue edits, advancing to the next
+term, finishing a card, choices and edits on the current card) is appended
+to data_dir/session.journal as one small checksummed JSON line (the queue
+as the changes TermQueue reports, not copies of it). Records are handed to
+a writer thread, which writes whatever has piled up and fsyncs once per
+batch, so appending never waits on the disk.
+
+The writer also folds each record into a SessionState, and every so often
+rewrites the journal as a single snapshot of it. Replaying the journal at
+launch therefore only covers the work done since the last snapshot. A batch
+that fails to write is kept, and retried as such a snapshot.
+
+Finished cards are saved to the card store as they're made; the journal
+only puts back any that a crash kept from it.
+"""
+from card_store import Card, CardStore, get_card_store
+from term_queue import TermQueue
+from typing import Any, BinaryIO, Callable, Dict, Iterator, List, Optional
+import data
+import json
+import os
+import queue
+import threading
+import zlib
+
+# how long the writer waits for more records before each fsync
+GROUP_COMMIT_SECONDS = 0.05
+# rewrite the journal as a snapshot once this much or this many records are appended to it
+SNAPSHOT_BYTES = 1 << 20
+SNAPSHOT_RECORDS = 2000
+# how long the writer waits before trying again after a failed write
+RETRY_SECONDS = 1.0
+
+Record = Dict[str, Any]
+
+def default_journal_path() -> str:
+    return os.path.join(data.data_dir, 'session.journal')
+
+def _encode(record: Record) -> bytes:
+    payload = json.dumps(record, ensure_ascii=False, separators=(',', ':')).encode()
+    return b"%08x " % zlib.crc32(payload) + payload + b"\n"
+
+def _decode(path: str) -> Iterator[Record]:
+    """Records in the journal, up to the first torn or corrupt line."""
+    try:
+        f = open(path, 'rb')
+    except FileNotFoundError:
+        return
+    with f:
+        for line in f:
+            crc, _, payload = line.rstrip(b"\n").partition(b" ")
+            if not line.endswith(b"\n") or crc != b"%08x" % zlib.crc32(payload):
+                return
+            yield json.loads(payload)
+
+class SessionState:
+    """What the journal's records add up to."""
+
+    def __init__(self, store: CardStore) -> None:
+        self.store = store
+        self.queue = TermQueue()
+        self.has_queue = False
+        self.draft: Optional[Record] = None
+
+    def apply(self, record: Record) -> None:
+        kind = record["t"]
+        if kind == "snapshot":
+            self.has_queue = record["queue"] is not None
+            if record["queue"] is not None:
+                self.queue.restore(record["queue"])
+            self.draft = record["draft"]
+        elif kind == "queue":
+            self.has_queue = True
+            self.queue.apply(record["change"])
+        elif kind == "next":
+            # the terms it took off the queue were journaled as queue changes
+            self.draft = {"lang": record["lang"], "term": record["term"]}
+        elif kind == "card":
+            card = record["card"]
+            card["fields"] = [(key, value) for key, value in card["fields"]]
+            self.store.add(Card(**card))
+        elif kind == "draft":
+            self.draft = record["draft"]
+
+    def snapshot(self) -> Record:
+        return {"t": "snapshot", "queue": self.queue.snapshot() if self.has_queue else None, "draft": self.draft}
+
+class Journal:
+    def __init__(self, path: Optional[str] = None, store: Optional[CardStore] = None) -> None:
+        self.path = path or default_journal_path()
+        self.state = SessionState(store or get_card_store())
+        self._records: "queue.Queue[Optional[Record]]" = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._file: Optional[BinaryIO] = None
+        self._since_snapshot = 0
+        # the journal's size right after the last snapshot
+        self._snapshot_bytes = 0
+
+    def replay(self) -> SessionState:
+        """Rebuild the session from the journal; call before start()."""
+        for record in _decode(self.path):
+            try:
+                self.state.apply(record)
+            except Exception as e:
+                print(f"Error replaying journal record {record.get('t')!r}: {e}")
+        return self.state
+
+    def follow_queue(self, term_queue: TermQueue) -> None:
+        """Journal term_queue's changes from here on; call before start().
+
+        The journal's queue takes on term_queue as it is now, so the changes
+        apply to the same terms they were made to.
+        """
+        self.state.queue.restore(term_queue.snapshot())
+        self.state.has_queue = self.state.has_queue or bool(len(term_queue)) or term_queue.has_more()
+        term_queue.on_change = lambda change: self.append({"t": "queue", "change": change})
+
+    def start(self) -> None:
+        self._thread = threading.Thread(target=self._run, name="journal", daemon=True)
+        self._thread.start()
+
+    def append(self, record: Record) -> None:
+        """Queue a record for writing; never blocks."""
+        self._records.put(record)
+
+    def close(self, timeout: float = 2.0) -> None:
+        """Write out everything appended so far and stop the writer."""
+        if self._thread is None:
+            return
+        self._records.put(None)
+        self._thread.join(timeout)
+        self._thread = None
+
+    def _run(self) -> None:
+        # replayed records are folded into the state already: start afresh from it
+        self._try(self._compact)
+        # applied to the state, but not yet written out
+        pending: List[Record] = []
+        while True:
+            batch = self._next_batch(RETRY_SECONDS if pending else None)
+            records = [record for record in batch if record is not None]
+            # the state follows every record, written out or not, so the queue
+            # changes after a failed write still apply to the right terms
+            for record in records:
+                try:
+                    self.state.apply(record)
+                except Exception as e:
+                    print(f"Error applying journal record {record.get('t')!r}: {e}")
+            pending += records
+            if pending and self._try(lambda: self._write(pending)):
+                pending = []
+            if batch and batch[-1] is None:
+                if self._file is not None:
+                    self._file.close()
+                return
+
+    def _next_batch(self, timeout: Optional[float]) -> List[Optional[Record]]:
+        """The records appended by now, waiting up to timeout for the first."""
+        try:
+            batch: List[Optional[Record]] = [self._records.get(timeout=timeout)]
+        except queue.Empty:
+            return []
+        try:
+            while batch[-1] is not None:
+                batch.append(self._records.get(timeout=GROUP_COMMIT_SECONDS))
+        except queue.Empty:
+            pass
+        return batch
+
+    def _try(self, write: Callable[[], None]) -> bool:
+        try:
+            write()
+        except Exception as e:
+            print(f"Error writing session journal (will retry): {e}")
+            # the journal may end in a torn line now: rewrite it from the state next time
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+            return False
+        return True
+
+    def _write(self, records: List[Record]) -> None:
+        """Append records, already applied to the state, to the journal."""
+        if self._file is None:
+            self._compact()
+            return
+        self._file.write(b"".join(map(_encode, records)))
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._since_snapshot += len(records)
+        if self._since_snapshot >= SNAPSHOT_RECORDS or self._file.tell() - self._snapshot_bytes >= SNAPSHOT_BYTES:
+            self._compact()
+
+    def _compact(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        tmp = f"{self.path}.tmp{os.getpid()}"
+        with open(tmp, 'wb') as f:
+            f.write(_encode(self.state.snapshot()))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.path)
+        # make the rename itself durable
+        dir_fd = os.open(os.path.dirname(os.path.abspath(self.path)), os.O_RDONLY)
+        try:
+            os.fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
+        self._file = open(self.path, 'ab')
+        self._since_snapshot = 0
+        self._snapshot_bytes = self._file.tell()
@@ -0,0 +1,91 @@
+"""Keyboard shortcuts, dispatched through a table.
+
+Bindings are looked up in a dict keyed by (mode, key, modifiers), where the
+mode is worked out once per key press from the editor's state, so a key
+press costs the same however many fields and modes there are. A Keymap only
+filters the widgets it's attached to, not every event in the application.
+
+Set ANKI_VOCAB_KEY_LATENCY=1 to print how long each handled key press takes
+to reach the screen.
+"""
+from PyQt5.QtCore import QEvent, QObject, Qt
+from PyQt5.QtGui import QKeyEvent, QKeySequence
+from PyQt5.QtWidgets import QWidget
+from typing import Callable, Dict, Iterable, Optional, Set, Tuple, cast
+import os
+import time
+
+# bindings in this mode apply in every mode, ahead of the mode's own
+ANY_MODE = "*"
+
+# an action may return False to let the key through after all
+Action = Callable[[], Optional[bool]]
+
+def latency_probe_enabled() -> bool:
+    return os.environ.get("ANKI_VOCAB_KEY_LATENCY", "") not in ("", "0")
+
+class LatencyProbe(QObject):
+    """Times key presses to the next repaint of the window they were made in."""
+
+    # a repaint this much later isn't the key's doing
+    MAX_SECONDS = 1.0
+
+    def __init__(self) -> None:
+        super().__init__()
+        self._pending: Dict[QWidget, Tuple[str, float]] = {}
+
+    def start(self, window: QWidget, name: str) -> None:
+        # while keys repeat faster than paints, report the oldest unpainted press
+        if window not in self._pending:
+            window.installEventFilter(self)
+            self._pending[window] = (name, time.perf_counter())
+
+    def eventFilter(self, obj: QObject, event: QEvent) -> bool:
+        if event.type() != QEvent.UpdateRequest or obj not in self._pending:
+            return False
+        name, start = self._pending.pop(obj)
+        obj.removeEventFilter(self)
+        # paint now, so the time includes it
+        obj.event(event)
+        elapsed = time.perf_counter() - start
+        if elapsed < self.MAX_SECONDS:
+            print(f"key {name}: {elapsed * 1000:.1f}ms to paint")
+        return True
+
+class Keymap(QObject):
+    def __init__(self, mode: Callable[[], str]) -> None:
+        super().__init__()
+        self._mode = mode
+        self._actions: Dict[Tuple[str, int, int], Action] = {}
+        self._blocking: Set[str] = set()
+        self.probe = LatencyProbe() if latency_probe_enabled() else None
+
+    def bind(self, mode: str, keys: Iterable[int], action: Action, modifiers: int = Qt.NoModifier) -> None:
+        for key in keys:
+            self._actions[(mode, key, int(modifiers))] = action
+
+    def bound(self, mode: str, key: int, modifiers: int = Qt.NoModifier) -> bool:
+        return (mode, key, int(modifiers)) in self._actions
+
+    def block(self, mode: str) -> None:
+        """In mode, swallow keys without modifiers that have no binding."""
+        self._blocking.add(mode)
+
+    def attach(self, *widgets: QWidget) -> None:
+        for widget in widgets:
+            widget.installEventFilter(self)
+
+    def eventFilter(self, obj: QObject, event: QEvent) -> bool:
+        if event.type() != QEvent.KeyPress:
+            return False
+        ke = cast(QKeyEvent, event)
+        # keypad arrows and Enter act like the main ones
+        modifiers = int(ke.modifiers()) & ~int(Qt.KeypadModifier)
+        mode = self._mode()
+        for scope in (ANY_MODE, mode):
+            action = self._actions.get((scope, ke.key(), modifiers))
+            if action is not None and action() is not False:
+                if self.probe is not None and isinstance(obj, QWidget):
+                    self.probe.start(obj.window(), f"{mode}/{QKeySequence(ke.key()).toString()}")
+                return True
+        return mode in self._blocking and modifiers == Qt.NoModifier
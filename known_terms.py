@@ -0,0 +1,221 @@
+"""Terms already in an Anki collection, for flagging duplicates in the queue.
+
+The collection (ANKI_VOCAB_COLLECTION, a collection.anki2) is only ever
+opened read-only. One field of each note (ANKI_VOCAB_NOTE_FIELD, by default
+the first, which is what Anki checks for duplicates) of the chosen note type
+(ANKI_VOCAB_NOTE_TYPE, by default every note type) is normalized like queue
+terms are and kept as a 64-bit hash, so checking a term is a set lookup
+however big the collection.
+
+The hashes are cached in data_dir along with the note ids they came from
+and the collection's size/mtime. While those stay the same the collection
+isn't opened at all; once they change, only notes modified since the last
+refresh are read again (and deleted ones dropped). Anki holds the collection
+locked while it's open, in which case the cached set is used as it is.
+
+    python known_terms.py collection.anki2 [--note-type NAME] [--field NAME] [words.txt]
+
+refreshes the cache and prints the terms of a word list (default: stdin)
+that are already in the collection.
+"""
+from array import array
+from term_queue import normalize_term
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple
+import argparse
+import data
+import fileinput
+import hashlib
+import html
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+
+CACHE_FORMAT = 1
+
+_html_re = re.compile(r'<[^>]*>|\[sound:[^\]]*\]')
+
+def term_hash(term: str) -> int:
+    # not hash(): str hashes are salted per process, and these are cached on disk
+    return int.from_bytes(hashlib.blake2b(normalize_term(term).encode(), digest_size=8).digest(), 'little')
+
+def field_term(value: str) -> str:
+    """A note field's text as a queue term: markup, sounds and entities stripped."""
+    return normalize_term(html.unescape(_html_re.sub(" ", value)))
+
+def default_cache_path(collection: str) -> str:
+    digest = hashlib.sha1(os.path.abspath(collection).encode()).hexdigest()[:16]
+    return os.path.join(data.data_dir, f'known-{digest}.bin')
+
+def collection_stamp(path: str) -> str:
+    # changes still in Anki's write-ahead log count too
+    parts = []
+    for p in (path, path + "-wal"):
+        try:
+            st = os.stat(p)
+        except OSError:
+            continue
+        parts.append(f"{st.st_size}:{st.st_mtime_ns}")
+    return "|".join(parts)
+
+def _note_fields(conn: sqlite3.Connection, note_type: Optional[str], field: Optional[str]) -> Dict[int, int]:
+    """Note type id -> index of the field to read, for the chosen note type(s)."""
+    # (note type id, name, field names in order)
+    models: List[Tuple[int, str, List[str]]] = []
+    ver = conn.execute("SELECT ver FROM col").fetchone()[0]
+    if ver <= 11:
+        row = conn.execute("SELECT models FROM col").fetchone()
+        for mid, model in json.loads(row[0]).items():
+            names = [f["name"] for f in sorted(model["flds"], key=lambda f: f["ord"])]
+            models.append((int(mid), model["name"], names))
+    else:
+        # newer schemas keep note types and their fields in tables of their own
+        names_by_type: Dict[int, List[str]] = {}
+        for ntid, name in conn.execute("SELECT ntid, name FROM fields ORDER BY ntid, ord"):
+            names_by_type.setdefault(ntid, []).append(name)
+        for ntid, name in conn.execute("SELECT id, name FROM notetypes"):
+            models.append((ntid, name, names_by_type.get(ntid, [])))
+    fields: Dict[int, int] = {}
+    for mid, name, names in models:
+        if note_type is not None and name != note_type:
+            continue
+        if field is None:
+            fields[mid] = 0
+        elif field in names:
+            fields[mid] = names.index(field)
+    if note_type is not None and not fields:
+        raise ValueError(f"no note type {note_type!r}" + (f" with a field {field!r}" if field else ""))
+    return fields
+
+class KnownTerms:
+    def __init__(self, collection: str, note_type: Optional[str] = None, field: Optional[str] = None,
+                 cache_path: Optional[str] = None) -> None:
+        self.collection = collection
+        self.note_type = note_type
+        self.field = field
+        self.cache_path = cache_path or default_cache_path(collection)
+        self._lock = threading.Lock()
+        self._stamp = ""
+        self._config = ""
+        # the newest note modification time seen, in Anki's seconds
+        self._mod = 0
+        self._notes: Dict[int, int] = {}
+        self._hashes: Set[int] = set()
+
+    def __len__(self) -> int:
+        return len(self._hashes)
+
+    def __contains__(self, term: str) -> bool:
+        return term_hash(term) in self._hashes
+
+    def load(self) -> bool:
+        """Read the cached hashes, if any; returns whether there were any."""
+        try:
+            with open(self.cache_path, 'rb') as f:
+                header = json.loads(f.readline())
+                if header.get("format") != CACHE_FORMAT:
+                    return False
+                nids, hashes = array('q'), array('Q')
+                nids.fromfile(f, header["count"])
+                hashes.fromfile(f, header["count"])
+        except (OSError, ValueError, EOFError) as e:
+            if not isinstance(e, FileNotFoundError):
+                print(f"Error reading known terms cache: {e}")
+            return False
+        with self._lock:
+            self._stamp, self._config, self._mod = header["stamp"], header["config"], header["mod"]
+            self._notes = dict(zip(nids, hashes))
+            self._hashes = set(hashes)
+        return True
+
+    def _save(self) -> None:
+        header = {"format": CACHE_FORMAT, "source": os.path.abspath(self.collection), "stamp": self._stamp,
+                  "config": self._config, "mod": self._mod, "count": len(self._notes)}
+        tmp = f"{self.cache_path}.tmp{os.getpid()}"
+        with open(tmp, 'wb') as f:
+            f.write(json.dumps(header).encode() + b"\n")
+            array('q', self._notes.keys()).tofile(f)
+            array('Q', self._notes.values()).tofile(f)
+        os.replace(tmp, self.cache_path)
+
+    def refresh(self) -> bool:
+        """Catch up with the collection if it changed; returns whether anything did."""
+        with self._lock:
+            stamp = collection_stamp(self.collection)
+            if not stamp or stamp == self._stamp:
+                return False
+            # read into locals: if the read fails (say Anki holds a lock), what's known stays
+            conn = sqlite3.connect(f"file:{self.collection}?mode=ro", uri=True)
+            try:
+                fields = _note_fields(conn, self.note_type, self.field)
+                config = json.dumps(sorted(fields.items()))
+                # other note types or fields: start over
+                notes, last_mod = (self._notes, self._mod) if config == self._config else ({}, 0)
+                live = {nid for nid, mid in conn.execute("SELECT id, mid FROM notes") if mid in fields}
+                notes = {nid: h for nid, h in notes.items() if nid in live}
+                mod = last_mod
+                # notes edited within the same second as the last refresh are read again
+                for nid, mid, note_mod, flds in conn.execute(
+                        "SELECT id, mid, mod, flds FROM notes WHERE mod >= ?", (last_mod,)):
+                    if mid not in fields:
+                        continue
+                    values = flds.split("\x1f")
+                    i = fields[mid]
+                    term = field_term(values[i]) if i < len(values) else ""
+                    if term:
+                        notes[nid] = term_hash(term)
+                    else:
+                        notes.pop(nid, None)
+                    mod = max(mod, note_mod)
+            finally:
+                conn.close()
+            self._stamp, self._config, self._notes, self._mod = stamp, config, notes, mod
+            self._hashes = set(notes.values())
+            self._save()
+        return True
+
+    def known(self, terms: Iterable[str]) -> Iterator[str]:
+        return (term for term in terms if term in self)
+
+
+_known: Optional[KnownTerms] = None
+
+def get_known_terms() -> Optional[KnownTerms]:
+    """The terms of ANKI_VOCAB_COLLECTION, loaded from the cache; None if it isn't set."""
+    global _known
+    collection = os.environ.get("ANKI_VOCAB_COLLECTION", "")
+    if not collection:
+        return None
+    if _known is None:
+        _known = KnownTerms(os.path.expanduser(collection),
+                            os.environ.get("ANKI_VOCAB_NOTE_TYPE") or None,
+                            os.environ.get("ANKI_VOCAB_NOTE_FIELD") or None)
+        _known.load()
+    return _known
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="List the terms of a word list already in an Anki collection.")
+    parser.add_argument("collection", help="the collection.anki2 to check against")
+    parser.add_argument("words", nargs="*", help="word lists, one term per line (default: stdin)")
+    parser.add_argument("--note-type", default=None, help="only notes of this type (default: all)")
+    parser.add_argument("--field", default=None, help="the field holding the term (default: the first)")
+    args = parser.parse_args()
+
+    os.makedirs(data.data_dir, exist_ok=True)
+    known = KnownTerms(args.collection, args.note_type, args.field)
+    start = time.perf_counter()
+    known.load()
+    loaded = time.perf_counter()
+    try:
+        known.refresh()
+    except (sqlite3.Error, ValueError) as e:
+        print(f"Error reading collection: {e}")
+    print(f"{len(known)} known terms (cache {(loaded - start) * 1000:.0f}ms, "
+          f"refresh {(time.perf_counter() - loaded) * 1000:.0f}ms)")
+    with fileinput.input(args.words, encoding='utf-8') as lines:
+        for term in known.known(normalize_term(line) for line in lines):
+            if term:
+                print(term)
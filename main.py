@@ -1,22 +1,42 @@
+import startup
 from PyQt5.QtWidgets import (
-    QApplication, QMainWindow, QWidget, QVBoxLayout, QHBoxLayout, QBoxLayout, QLayout,
+    QApplication, QMainWindow, QWidget, QVBoxLayout, QHBoxLayout, QBoxLayout,
     QPushButton, QTextEdit, QLabel, QLineEdit, QComboBox, QScrollArea, QFrame,
-    QSizePolicy
+    QSizePolicy, QFileDialog, QStackedWidget, QCheckBox
 )
-from PyQt5.QtCore import Qt, QEvent, QObject, QMimeData
-from PyQt5.QtGui import QKeyEvent, QFocusEvent, QMouseEvent, QDragEnterEvent, QDropEvent, QPixmap
-from dataclasses import dataclass
-from defaults import LANGUAGE_DEFAULTS
+from PyQt5.QtCore import Qt, QEvent, QObject, QMimeData, QTimer, pyqtSignal
+from PyQt5.QtGui import (
+    QKeyEvent, QFocusEvent, QResizeEvent, QDragEnterEvent, QDropEvent, QPixmap, QImage, QCloseEvent, QTextCursor,
+    QColor, QSyntaxHighlighter, QTextCharFormat
+)
+from dataclasses import asdict, dataclass
+from functools import partial
+startup.mark("import PyQt5")
+startup.timed_imports("nltk", "pypinyin", "eng_to_ipa", "cedict_index", "wordnet_index", "defaults")
+from anki_export import export
+from cache import cached_defaults, get_cache
+from card_store import Card, get_card_store
+from image_fetch import ImageDownload
+from image_store import get_store
+from ingest import INGEST_TOP, ingest, ingest_file, read_chunks
+from journal import Journal
+from keymap import ANY_MODE, Keymap
+from known_terms import KnownTerms, get_known_terms
+from prefetch import DefaultsPrefetcher
+from thumbnails import ThumbnailLoader
+from tracing import traced
+from term_queue import TermQueue, normalize_term
 from typing import Any, Callable, Dict, List, Optional, Union, cast
 import sys
-import unicodedata
 import data
+import defaults
+import io
+import sqlite3
+import threading
 from urllib.parse import quote_plus
-import shutil
 import os
 import imghdr
-import urllib.request
-from urllib.parse import urlparse
+startup.mark("import rest")
 
 # Editable multi-line text: Enter finishes edit, Shift+Enter newline, blur also finishes
 class QTextAreaEdit(QTextEdit):
@@ -36,6 +56,139 @@ class QTextAreaEdit(QTextEdit):
         else:
             super().keyPressEvent(event)
 
+# Greys out queue lines whose term is already in the Anki collection
+class KnownTermsHighlighter(QSyntaxHighlighter):
+    def __init__(self, known: KnownTerms, parent: QTextEdit) -> None:
+        super().__init__(parent.document())
+        self.known = known
+        self._format = QTextCharFormat()
+        self._format.setForeground(QColor("gray"))
+        self._format.setFontStrikeOut(True)
+
+    def highlightBlock(self, text: str) -> None:
+        term = normalize_term(text)
+        if term and term in self.known:
+            self.setFormat(0, len(text), self._format)
+
+# The queue as editable text, one term per line. The text shows the head of a
+# TermQueue: advancing removes just the first line, and long lists (opened
+# files, large pastes) are read in a window at a time as the queue drains.
+class QueueEdit(QTextEdit):
+    # text pasted while article_mode is on, to be ingested rather than inserted
+    article_pasted = pyqtSignal(str)
+
+    def __init__(self, *args: Any, **kwargs: Any) -> None:
+        super().__init__(*args, **kwargs)
+        self.setAcceptRichText(False)
+        self.queue = TermQueue()
+        self._dirty = False
+        self._updating = False
+        self.article_mode = False
+        self.document().contentsChanged.connect(self._on_contents_changed)
+
+    def _on_contents_changed(self) -> None:
+        if not self._updating:
+            self._dirty = True
+
+    def _sync(self) -> None:
+        # re-read the text only if the user changed it since last time
+        if self._dirty:
+            self._dirty = False
+            self.queue.reset(self.toPlainText().splitlines())
+            if not len(self.queue):
+                # cleared by hand: drop the rest of the list too
+                self.queue.clear()
+        self._append(self.queue.refill())
+
+    def _append(self, terms: List[str]) -> None:
+        if not terms:
+            return
+        doc = self.document()
+        text = "\n".join(terms)
+        if doc.lastBlock().text().strip():
+            text = "\n" + text
+        cursor = QTextCursor(doc)
+        cursor.movePosition(QTextCursor.End)
+        self._updating = True
+        try:
+            cursor.insertText(text)
+        finally:
+            self._updating = False
+
+    def peek(self, n: int) -> List[str]:
+        self._sync()
+        return self.queue.peek(n)
+
+    def pop_term(self) -> Optional[str]:
+        """Take the next term off the queue, removing its line from the text."""
+        self._sync()
+        term = self.queue.popleft()
+        if term is None:
+            return None
+        doc = self.document()
+        # the term's line is the first non-blank one; blank lines before it go too
+        block = doc.firstBlock()
+        while block.next().isValid() and not block.text().strip():
+            block = block.next()
+        cursor = QTextCursor(doc)
+        if block.next().isValid():
+            cursor.setPosition(block.next().position(), QTextCursor.KeepAnchor)
+        else:
+            cursor.movePosition(QTextCursor.End, QTextCursor.KeepAnchor)
+        self._updating = True
+        try:
+            cursor.removeSelectedText()
+        finally:
+            self._updating = False
+        self._append(self.queue.refill())
+        return term
+
+    def open_file(self, path: str) -> None:
+        """Replace the queue with a word list, read in as it's needed."""
+        self.queue.open(path)
+        self._updating = True
+        try:
+            self.clear()
+        finally:
+            self._updating = False
+        self._dirty = False
+        self._sync()
+
+    def add_terms(self, terms: List[str]) -> None:
+        """Queue terms after everything already queued."""
+        self._sync()
+        self.queue.extend(terms)
+        self._sync()
+
+    def restore(self, snapshot: Dict[str, Any]) -> None:
+        """Put back a queue saved with TermQueue.snapshot()."""
+        self.queue.restore(snapshot)
+        self._updating = True
+        try:
+            self.setPlainText("\n".join(self.queue.peek(len(self.queue))))
+        finally:
+            self._updating = False
+        self._dirty = False
+
+    def insertFromMimeData(self, source: QMimeData) -> None:
+        if self.article_mode and source.hasText():
+            self.article_pasted.emit(source.text())
+            return
+        lines = source.text().splitlines() if source.hasText() else []
+        if len(lines) <= self.queue.window:
+            super().insertFromMimeData(source)
+            return
+        # Large paste: only the first window of lines goes into the text. The
+        # rest, then whatever followed the cursor, is queued to be read in later.
+        cursor = self.textCursor()
+        cursor.beginEditBlock()
+        cursor.removeSelectedText()
+        cursor.movePosition(QTextCursor.End, QTextCursor.KeepAnchor)
+        after = cursor.selection().toPlainText().splitlines()
+        cursor.insertText("\n".join(lines[:self.queue.window]))
+        cursor.endEditBlock()
+        self.setTextCursor(cursor)
+        self.queue.push_front(lines[self.queue.window:] + after)
 
 
 
@@ -47,15 +200,22 @@ class CardField:
     placeholder: str
     shortcut: Optional[int] = None
 
+# (label, display, editor) for one field
+FieldWidgets = tuple[QLabel, QLabel, Union[QLineEdit, QTextAreaEdit]]
+
+_CHINESE_FIELDS = [
+    CardField("definition",  "[d]efinition:",        QLineEdit,      "Enter definition here",        Qt.Key_D),
+    CardField("pinyin",      "[p]inyin:",            QLineEdit,      "Enter pinyin here",            Qt.Key_P),
+    CardField("function",    "[f]unction:",          QLineEdit,      "Enter function here",          Qt.Key_F),
+    CardField("example",     "[e]xample sentence:",  QLineEdit,      "Enter example sentence here",  Qt.Key_E),
+    CardField("notes",       "[n]otes:",             QTextAreaEdit,  "Enter notes here",             Qt.Key_N),
+    CardField("image",       "[i]mage:",             QLineEdit,      "",                             Qt.Key_I),
+]
+
 LANGUAGE_FIELDS = {
-    "Chinese": [
-        CardField("definition",  "[d]efinition:",        QLineEdit,      "Enter definition here",        Qt.Key_D),
-        CardField("pinyin",      "[p]inyin:",            QLineEdit,      "Enter pinyin here",            Qt.Key_P),
-        CardField("function",    "[f]unction:",          QLineEdit,      "Enter function here",          Qt.Key_F),
-        CardField("example",     "[e]xample sentence:",  QLineEdit,      "Enter example sentence here",  Qt.Key_E),
-        CardField("notes",       "[n]otes:",             QTextAreaEdit,  "Enter notes here",             Qt.Key_N),
-        CardField("image",       "[i]mage:",             QLineEdit,      "",                             Qt.Key_I),
-    ],
+    "Chinese": _CHINESE_FIELDS,
+    # the same card, showing traditional forms (see zh_fixup.py)
+    "Chinese (Traditional)": _CHINESE_FIELDS,
     "English": [
         CardField("definition",  "[d]efinition:",        QLineEdit,      "Enter definition here",        Qt.Key_D),
         CardField("function",    "[f]unction:",          QLineEdit,      "Enter function here",          Qt.Key_F),
@@ -66,44 +226,82 @@ LANGUAGE_FIELDS = {
     ],
 }
 
+# while Up/Down repeats, the defaults option shown is repainted at most this often
+RENDER_INTERVAL_MS = 16
+
+@dataclass
+class RenderedOption:
+    """A defaults option formatted for display, once, when the options arrive."""
+    summary: str
+    displays: Dict[str, str]
+    examples: List[str]
+
+def render_option(option: Dict[str, Any]) -> RenderedOption:
+    displays = {}
+    for key, val in option.items():
+        displays[key] = "\n<hr> ".join(val) if isinstance(val, list) else val
+    summary = " - ".join(part for part in (option.get("pos", ""), option.get("synonyms", "")) if part)
+    return RenderedOption(summary, displays, cast(List[str], option.get("example", [])))
+
+def _set_text(label: QLabel, text: str) -> None:
+    # setText re-lays out rich text even when it's unchanged
+    if label.text() != text:
+        label.setText(text)
+
 
 
 class CardEditor(QWidget):
-    def __init__(self) -> None:
+    # a choice or edit was made on the current card (see draft())
+    draft_changed = pyqtSignal()
+
+    def __init__(self, prefetcher: Optional[DefaultsPrefetcher] = None) -> None:
         super().__init__()
+        self.prefetcher = prefetcher
+        self.lang = "Chinese"
         self.fields = LANGUAGE_FIELDS["Chinese"]
-        self.defaults_provider: Callable[[str], List[Dict[str, Any]]] = LANGUAGE_DEFAULTS["Chinese"]
-        self.widgets: Dict[str, tuple[QLabel, QLabel, Union[QLineEdit, QTextAreaEdit]]] = {}
+        self.defaults_provider: Callable[[str], List[Dict[str, Any]]] = cached_defaults("Chinese")
+        self.widgets: Dict[str, FieldWidgets] = {}
         self.term_title = QLabel("(none)")
         self.term_title.setStyleSheet("font-weight: bold; font-size: 18px")
         self.term_title.setWordWrap(True)
         self.term_title.setTextFormat(Qt.RichText)
         self._layout = QVBoxLayout()
         self._layout.addWidget(self.term_title, alignment=Qt.AlignTop)
-        self._fields_start_index = self._layout.count()
-        self._build_fields()
+        # one panel of field widgets per language, built on first use and kept
+        self._panels = QStackedWidget()
+        self._panel_pages: Dict[str, tuple[QWidget, Dict[str, FieldWidgets]]] = {}
+        self._layout.addWidget(self._panels, 1)
         self.setLayout(self._layout)
+        self._show_panel(self.lang)
+        self._build_drop_area()
         self.defaults_options: list[Dict[str, str]] = []
+        self._rendered: List[RenderedOption] = []
         self.current_default_index: int = 0
+        # coalesces repaints of the defaults option while keys repeat
+        self._render_timer = QTimer(self)
+        self._render_timer.setSingleShot(True)
+        self._render_timer.setInterval(RENDER_INTERVAL_MS)
+        self._render_timer.timeout.connect(self._on_render_timer)
+        self._render_pending = False
         self.selecting_defaults: bool = False
         self.example_options: list[str] = []
+        # "did you mean" terms, when the dictionaries don't know the term (see fuzzy_index.py)
+        self.suggestions: List[str] = []
         self.current_example_index: int = 0
         self.example_index_selected: Optional[int] = None
         self.selecting_example: bool = False
         self.current_term: Optional[str] = None
+        # terms of the Anki collection, to flag cards that would be duplicates
+        self.known_terms: Optional[KnownTerms] = None
         self.editable: bool = False
-
-    def _clear_fields(self) -> None:
-        """Remove all field widgets/layouts down to initial start index."""
-        while self._layout.count() > self._fields_start_index:
-            item = self._layout.takeAt(self._layout.count() - 1)
-            widget = item.widget()
-            if widget:
-                widget.deleteLater()
-            else:
-                layout = item.layout()
-                if layout:
-                    self._clear_layout(layout)
+        self.loading_defaults: bool = False
+        self._download: Optional[ImageDownload] = None
+        self.image_path: Optional[str] = None
+        self.edits: Dict[str, str] = {}
+        self._pending_draft: Optional[Dict[str, Any]] = None
+        self.thumbnails = ThumbnailLoader()
+        self.thumbnails.ready.connect(self._on_thumbnail_ready)
+        self.thumbnails.failed.connect(self._on_thumbnail_failed)
 
     def _set_title(self, title: str) -> None:
         mw = self.window()
@@ -115,8 +313,20 @@ class CardEditor(QWidget):
         if hasattr(mw, "next_button"):
             mw.next_button.setFocus()
 
-    def _build_fields(self) -> None:
-        for field in self.fields:
+    def _show_panel(self, lang: str) -> None:
+        if lang not in self._panel_pages:
+            page = QWidget()
+            layout = QVBoxLayout(page)
+            layout.setContentsMargins(0, 0, 0, 0)
+            self._panel_pages[lang] = (page, self._build_fields(LANGUAGE_FIELDS.get(lang, []), layout))
+            self._panels.addWidget(page)
+        page, self.widgets = self._panel_pages[lang]
+        self._panels.setCurrentWidget(page)
+
+    @traced("build_fields")
+    def _build_fields(self, fields: List[CardField], layout: QVBoxLayout) -> Dict[str, FieldWidgets]:
+        widgets: Dict[str, FieldWidgets] = {}
+        for field in fields:
 
             label_widget = QLabel(field.label)
             # Special-case image: vertical layout with the preview below the label
@@ -126,7 +336,7 @@ class CardEditor(QWidget):
                 display.setSizePolicy(QSizePolicy.Expanding, QSizePolicy.Preferred)
                 input_widget = QLineEdit()
                 input_widget.editingFinished.connect(
-                    lambda k=field.key: self._on_field_finished(k)
+                    lambda k=field.key, w=widgets: self._on_field_finished(k, w)
                 )
                 input_widget.setPlaceholderText(field.placeholder)
                 input_widget.hide()
@@ -134,8 +344,8 @@ class CardEditor(QWidget):
                 img_container.addWidget(label_widget, alignment=Qt.AlignTop)
                 img_container.addWidget(display)
                 img_container.addWidget(input_widget)
-                self._layout.addLayout(img_container)
-                self.widgets[field.key] = (label_widget, display, input_widget)
+                layout.addLayout(img_container)
+                widgets[field.key] = (label_widget, display, input_widget)
                 continue
 
             display = QLabel("")
@@ -144,12 +354,12 @@ class CardEditor(QWidget):
 
             if field.input_widget_cls is QTextAreaEdit:
                 input_widget = field.input_widget_cls(
-                    finish_callback=lambda k=field.key: self._on_field_finished(k)
+                    finish_callback=lambda k=field.key, w=widgets: self._on_field_finished(k, w)
                 )
             elif field.input_widget_cls is QLineEdit:
                 input_widget = field.input_widget_cls()
                 input_widget.editingFinished.connect(
-                    lambda k=field.key: self._on_field_finished(k)
+                    lambda k=field.key, w=widgets: self._on_field_finished(k, w)
                 )
             else:
                 raise ValueError(f"Unsupported input widget class: {field.input_widget_cls}")
@@ -170,10 +380,11 @@ class CardEditor(QWidget):
                 container.addWidget(label_widget, alignment=Qt.AlignTop)
                 container.addWidget(display, 1, Qt.AlignTop)
                 container.addWidget(input_widget, 1, Qt.AlignTop)
-            self._layout.addLayout(container)
-            self.widgets[field.key] = (label_widget, display, input_widget)
+            layout.addLayout(container)
+            widgets[field.key] = (label_widget, display, input_widget)
 
-        self._layout.addStretch(1)
+        layout.addStretch(1)
+        return widgets
 
     def _strip_brackets(self, label: str) -> str:
         if len(label) >= 3 and label[0] == '[' and label[2] == ']':
@@ -181,48 +392,115 @@ class CardEditor(QWidget):
         return label
 
     def set_fields(self, lang: str, editable: bool) -> None:
-
+        changed = lang != self.lang
+        self.lang = lang
         self.fields = LANGUAGE_FIELDS.get(lang, [])
-        self.defaults_provider = LANGUAGE_DEFAULTS.get(lang, lambda _: [])
-
-        self._clear_fields()
-        self.widgets.clear()
-        self._build_fields()
-        # If a term is already loaded, re-enter defaults-selection for it with the new language
-        curr = self.term_title.text().split(" ", 1)[0]
-        self.set_term(curr, editable)
-
-    def _clear_layout(self, layout: QLayout) -> None:
-        while layout.count():
-            item = layout.takeAt(0)
-            widget = item.widget()
-            if widget:
-                widget.deleteLater()
-            else:
-                sub_layout = item.layout()
-                if sub_layout:
-                    self._clear_layout(sub_layout)
+        self.defaults_provider = cached_defaults(lang)
+        if self.prefetcher is not None:
+            self.prefetcher.set_language(lang)
+        self._show_panel(lang)
+
+        term = self.current_term
+        if term is None or not changed:
+            return
+        # Re-enter defaults-selection for the current term with the new
+        # language's defaults, keeping what was typed or dropped for it
+        draft = self.draft()
+        self.set_term(term, editable)
+        if editable:
+            self.restore_draft({"term": term, "edits": draft["edits"], "image": draft["image"]})
 
+    @traced("set_term", term=lambda self, text, *_: text)
     def set_term(self, text: str, editable: bool) -> None:
         """Start defaults-selection or editing for the given term."""
+        self.cancel_image_download()
+        self._drop_area.hide()
+        self.image_path = None
+        # rendering skips unchanged text, which wouldn't clear a previous preview
+        _, image_display, _ = self.widgets.get('image', (None, None, None))
+        if image_display is not None:
+            image_display.clear()
+        self.edits = {}
+        self._pending_draft = None
         self.editable = editable
         self.current_term = text
-        self.defaults_options = self.defaults_provider(text)
+        options: Optional[List[Dict[str, Any]]]
+        if self.prefetcher is None:
+            options = self.defaults_provider(text)
+        else:
+            # take the prefetched result if it's in, otherwise show a
+            # placeholder and fill in from on_defaults_ready
+            options = self.prefetcher.get(text)
+        self.loading_defaults = options is None
+        self._load_defaults(options if options is not None else [{}])
+        if self.loading_defaults:
+            self._set_title("Loading defaults...")
+            assert self.prefetcher is not None
+            # last: a lookup that's already finished answers straight away
+            self.prefetcher.request(text)
+
+    def on_defaults_ready(self, lang: str, term: str, options: List[Dict[str, Any]]) -> None:
+        if not self.loading_defaults or lang != self.lang or term != self.current_term:
+            return
+        self.loading_defaults = False
+        self._load_defaults(options)
+
+    def _load_defaults(self, options: List[Dict[str, Any]]) -> None:
+        self.defaults_options = options
+        self._rendered = [render_option(option) for option in options]
         self.current_default_index = 0
         self.selecting_defaults = len(self.defaults_options) > 1
-        self._set_title(
-            "Press Up/Down to browse defaults, Space to select"
-            if self.selecting_defaults
-            else "Card Editor"
-        )
+        self.suggestions = cast(List[str], options[0].get("suggestions", [])) if options else []
+        if self.selecting_defaults:
+            self._set_title("Press Up/Down to browse defaults, Space to select")
+        elif self.suggestions and self.editable:
+            self._set_title(f"Press 1-{len(self.suggestions)} to look up a suggestion instead")
+        else:
+            self._set_title("Card Editor")
 
         self.current_example_index = 0
         self.example_index_selected = None
         self.selecting_example = False
         self._apply_current_defaults()
+        if self._pending_draft is not None and not self.loading_defaults:
+            self._apply_draft(self._pending_draft)
+
+    def draft(self) -> Dict[str, Any]:
+        """The choices and edits made on the current card, as plain data."""
+        return {
+            "lang": self.lang,
+            "term": self.current_term if self.editable else None,
+            "index": self.current_default_index,
+            "confirmed": not self.selecting_defaults,
+            "example": self.example_index_selected,
+            "edits": dict(self.edits),
+            "image": self.image_path,
+        }
+
+    def restore_draft(self, draft: Dict[str, Any]) -> None:
+        """Re-apply draft() output for the current term, once its defaults are in."""
+        if draft.get("term") != self.current_term:
+            return
+        self._pending_draft = draft
+        if not self.loading_defaults:
+            self._apply_draft(draft)
+
+    def _apply_draft(self, draft: Dict[str, Any]) -> None:
+        self._pending_draft = None
+        self.current_default_index = min(draft.get("index", 0), len(self.defaults_options) - 1)
+        if draft.get("confirmed") and self.selecting_defaults:
+            self.selecting_defaults = False
+            self._set_title("Card Editor")
+        self.example_index_selected = draft.get("example")
+        self.edits = dict(draft.get("edits", {}))
+        self._apply_current_defaults()
+        image = draft.get("image")
+        if image and os.path.exists(image):
+            self.image_path = image
+            self.thumbnails.request(image)
 
     def start_edit(self, field_key: str) -> None:
-        if not self.editable or self.selecting_defaults:
+        if not self.editable or self.selecting_defaults or self.loading_defaults:
             return
         if field_key not in self.widgets:
             return
@@ -259,13 +537,19 @@ class CardEditor(QWidget):
         display.setText(txt)
         input_widget.hide()
         display.show()
+        if self.editable and not self.selecting_defaults:
+            self.edits[field_key] = txt
+            self.draft_changed.emit()
         field = next(f for f in self.fields if f.key == field_key)
         if self.selecting_defaults or not self.editable:
             label_widget.setText(self._strip_brackets(field.label))
         else:
             label_widget.setText(field.label)
 
-    def _on_field_finished(self, field_key: str) -> None:
+    def _on_field_finished(self, field_key: str, panel: Dict[str, FieldWidgets]) -> None:
+        # a hidden panel's input losing focus on a language switch is no edit
+        if panel is not self.widgets:
+            return
         self.finish_edit(field_key)
         _, _, input_widget = self.widgets[field_key]
         input_widget.clearFocus()
@@ -275,13 +559,13 @@ class CardEditor(QWidget):
         if not self.selecting_defaults:
             return
         self.current_default_index = (self.current_default_index + 1) % len(self.defaults_options)
-        self._apply_current_defaults()
+        self._show_option()
 
     def prev_defaults_option(self) -> None:
         if not self.selecting_defaults:
             return
         self.current_default_index = (self.current_default_index - 1) % len(self.defaults_options)
-        self._apply_current_defaults()
+        self._show_option()
 
     def confirm_defaults_option_selection(self) -> None:
         if not self.selecting_defaults:
@@ -289,6 +573,7 @@ class CardEditor(QWidget):
         self.selecting_defaults = False
         self._apply_current_defaults()
         self._set_title("Card Editor")
+        self.draft_changed.emit()
 
     def confirm_example_option_selection(self, index: int) -> None:
         """Confirm selected example option and populate the example field."""
@@ -302,42 +587,69 @@ class CardEditor(QWidget):
         _, display, _ = self.widgets.get("example", (None, None, None))
         if display is not None:
             display.setText(self.example_options[index])
+        self.draft_changed.emit()
+
+    def accept_suggestion(self, index: int) -> bool:
+        """Look up the index-th "did you mean" term in place of the current one."""
+        if not self.editable or self.loading_defaults or index >= len(self.suggestions):
+            return False
+        self.set_term(self.suggestions[index], True)
+        self.draft_changed.emit()
+        return True
 
+    def _show_option(self) -> None:
+        """Paint the current defaults option now, or once the last paint is a frame old."""
+        if self._render_timer.isActive():
+            self._render_pending = True
+            return
+        self._apply_current_defaults()
+        self._render_timer.start()
+
+    def refresh_title(self) -> None:
+        # e.g. the term turned out to be in the collection already
+        if self._rendered:
+            self._show_option()
+
+    def _on_render_timer(self) -> None:
+        if self._render_pending:
+            self._apply_current_defaults()
+            self._render_timer.start()
+
+    @traced("apply_defaults", term=lambda self: self.current_term)
     def _apply_current_defaults(self) -> None:
+        self._render_pending = False
         term = self.current_term or ""
-        defaults = self.defaults_options[self.current_default_index]
+        rendered = self._rendered[self.current_default_index]
         if self.selecting_defaults:
-            total = len(self.defaults_options)
-            idx = self.current_default_index + 1
-            parts = [f"{idx}/{total}"]
-            pos = defaults.get("pos", "")
-            if pos:
-                parts.append(pos)
-            syns = defaults.get("synonyms", "")
-            if syns:
-                parts.append(syns)
+            parts = [f"{self.current_default_index + 1}/{len(self._rendered)}"]
+            if rendered.summary:
+                parts.append(rendered.summary)
             term = f"{term} ({' - '.join(parts)})"
-        self.term_title.setText(term)
-        # update example options
-        self.example_options = cast(List[str], defaults.get("example", []))
-        # update each field's display and label
-        field_map = {f.key: f for f in self.fields}
-        for key, (label_widget, display, _) in self.widgets.items():
-            val = defaults.get(key, "")
-            if isinstance(val, list):
-                val = "\n<hr> ".join(val)
-            display.setText(val)
-            label_widget.setText(
-                self._strip_brackets(field_map[key].label)
-                if self.selecting_defaults
-                else field_map[key].label
-            )
+        if self.known_terms is not None and self.editable and (self.current_term or "") in self.known_terms:
+            term += " (already in collection)"
+        if self.suggestions and self.editable:
+            term += " (did you mean " + ", ".join(f"{i + 1}: {s}" for i, s in enumerate(self.suggestions)) + "?)"
+        _set_text(self.term_title, term)
+        self.example_options = rendered.examples
+        # only widgets whose content changed are touched
+        for field in self.fields:
+            label_widget, display, _ = self.widgets[field.key]
+            # what was picked or typed for this card wins over the defaults
+            if field.key in self.edits:
+                text = self.edits[field.key]
+            elif field.key == "example" and self.example_index_selected is not None \
+                    and self.example_index_selected < len(self.example_options):
+                text = self.example_options[self.example_index_selected]
+            else:
+                text = rendered.displays.get(field.key, "")
+            _set_text(display, text)
+            _set_text(label_widget, self._strip_brackets(field.label) if self.selecting_defaults else field.label)
 
-    def show_image_drop(self) -> None:
-        """Show a drop area for image input, replacing fields list."""
-        self._clear_fields()
-        self._drop_area = QFrame()
+    def _build_drop_area(self) -> None:
+        # an overlay over the field panels, shown by show_image_drop
+        self._drop_area = QFrame(self)
         self._drop_area.setFrameStyle(QFrame.Box | QFrame.Plain)
+        self._drop_area.setAutoFillBackground(True)
         self._drop_area.setAcceptDrops(True)
         def _drag_enter(event: QDragEnterEvent) -> None:
             md: QMimeData = event.mimeData()
@@ -351,12 +663,24 @@ class CardEditor(QWidget):
             self._handle_image_drop(event.mimeData())
             event.acceptProposedAction()
         self._drop_area.dropEvent = _drop_event  # type: ignore
-        label = QLabel("drag and drop an image here")
-        label.setAlignment(Qt.AlignCenter)
+        self._drop_label = QLabel("drag and drop an image here")
+        self._drop_label.setAlignment(Qt.AlignCenter)
         drop_layout = QVBoxLayout(self._drop_area)
-        drop_layout.addWidget(label, alignment=Qt.AlignCenter)
-        self._layout.addWidget(self._drop_area)
+        drop_layout.addWidget(self._drop_label, alignment=Qt.AlignCenter)
+        self._drop_area.hide()
 
+    def show_image_drop(self) -> None:
+        """Show a drop area for image input over the fields."""
+        self._drop_label.setText("drag and drop an image here")
+        self._drop_area.setGeometry(self._panels.geometry())
+        self._drop_area.raise_()
+        self._drop_area.show()
+
+    def resizeEvent(self, event: QResizeEvent) -> None:
+        super().resizeEvent(event)
+        self._drop_area.setGeometry(self._panels.geometry())
+
+    @traced("image_drop", term=lambda self, *_: self.current_term)
     def _handle_image_drop(self, mime_data: QMimeData) -> None:
         urls = mime_data.urls()
         image_path = None
@@ -368,91 +692,153 @@ class CardEditor(QWidget):
                 local_path = entry.toLocalFile()
                 ext = os.path.splitext(local_path)[1].lstrip('.')
                 if not ext:
-                    with open(local_path, 'rb') as f:
-                        data_bytes = f.read()
-                    detected = imghdr.what(None, data_bytes)
+                    detected = imghdr.what(local_path)
                     ext = 'jpg' if detected == 'jpeg' else (detected or 'jpg')
-                dest = data.get_new_image_path(self.current_term or "", ext)
                 try:
-                    shutil.copy(local_path, dest)
+                    dest = get_store().add_file(local_path, self.lang, self.current_term or "", ext)
                 except Exception as e:
                     print(f"Error copying image file: {e}")
                     return
                 image_path = dest
             else:
-                # Remote URL: download into memory to detect type
-                remote = entry.toString()
-                try:
-                    resp = urllib.request.urlopen(remote)
-                    data_bytes = resp.read()
-                except Exception as e:
-                    print(f"Error fetching image from URL: {e}")
-                    return
-                detected = imghdr.what(None, data_bytes)
-                ext = (
-                    'jpg' if detected == 'jpeg'
-                    else detected
-                ) or os.path.splitext(urlparse(remote).path)[1].lstrip('.') or 'jpg'
-                dest = data.get_new_image_path(self.current_term or "", ext)
-                try:
-                    with open(dest, 'wb') as out:
-                        out.write(data_bytes)
-                except Exception as e:
-                    print(f"Error writing image file: {e}")
-                    return
-                image_path = dest
+                self._start_image_download(entry.toString())
         else:
             # Plain text drop: treat as URL if HTTP(S)
             text = mime_data.text().strip()
             if text.startswith("http://") or text.startswith("https://"):
-                try:
-                    resp = urllib.request.urlopen(text)
-                    data_bytes = resp.read()
-                except Exception as e:
-                    print(f"Error fetching image from URL: {e}")
-                    return
-                detected = imghdr.what(None, data_bytes)
-                ext = (
-                    'jpg' if detected == 'jpeg'
-                    else detected
-                ) or os.path.splitext(urlparse(text).path)[1].lstrip('.') or 'jpg'
-                dest = data.get_new_image_path(self.current_term or "", ext)
-                try:
-                    with open(dest, 'wb') as out:
-                        out.write(data_bytes)
-                except Exception as e:
-                    print(f"Error writing image file: {e}")
-                    return
-                image_path = dest
+                self._start_image_download(text)
         if image_path:
             self._end_image_drop(image_path)
 
+    def _start_image_download(self, url: str) -> None:
+        """Download a dropped URL in the background, showing progress in the drop area."""
+        self.cancel_image_download()
+        download = ImageDownload(url, self.lang, self.current_term or "")
+        download.progress.connect(lambda received, total: self._on_download_progress(download, received, total))
+        download.done.connect(lambda path: self._on_download_done(download, path))
+        download.failed.connect(lambda message: self._on_download_failed(download, message))
+        self._download = download
+        self._drop_label.setText("Downloading... (Esc to cancel)")
+        download.start()
+
+    def cancel_image_download(self) -> bool:
+        """Cancel a running download, if any; returns whether there was one."""
+        if self._download is None:
+            return False
+        self._download.cancel()
+        self._download = None
+        self._drop_label.setText("drag and drop an image here")
+        return True
+
+    def _on_download_progress(self, download: ImageDownload, received: int, total: int) -> None:
+        if download is not self._download:
+            return
+        size = f"{received // 1024} KB" + (f" of {total // 1024} KB" if total else "")
+        self._drop_label.setText(f"Downloading... {size} (Esc to cancel)")
+
+    def _on_download_done(self, download: ImageDownload, path: str) -> None:
+        if download is not self._download:
+            return
+        self._download = None
+        self._end_image_drop(path)
+
+    def _on_download_failed(self, download: ImageDownload, message: str) -> None:
+        if download is not self._download:
+            return
+        self._download = None
+        print(f"Error fetching image from URL: {message}")
+        self._drop_label.setText(f"couldn't fetch image ({message})\ndrag and drop an image here")
+
+    def finished_card(self) -> Optional[Card]:
+        """The card for the current term as it stands, or None if there isn't one."""
+        if not self.editable or self.loading_defaults or self.current_term is None:
+            return None
+        self._drop_area.hide()
+        if self._render_timer.isActive() and self._render_pending:
+            self._apply_current_defaults()
+        fields = []
+        for field in self.fields:
+            _, display, input_widget = self.widgets[field.key]
+            if not input_widget.isHidden():
+                self.finish_edit(field.key)
+            if field.key == "image":
+                text = ""
+            elif field.key == "example" and self.selecting_example:
+                # the display holds the numbered list to pick from, not an example
+                index = self.example_index_selected
+                text = self.example_options[index] if index is not None and index < len(self.example_options) else ""
+            else:
+                text = display.text()
+            fields.append((field.key, text))
+        return Card(self.lang, self.current_term, fields, self.image_path)
+
     def _end_image_drop(self, image_path: str) -> None:
-        if hasattr(self, '_drop_area'):
-            self._drop_area.deleteLater()
-            del self._drop_area
-        self._build_fields()
-        self._apply_current_defaults()
+        self._drop_area.hide()
+        self.image_path = image_path
         lbl, disp, inp = self.widgets.get('image', (None, None, None))
         if disp is not None:
-            pix = QPixmap(image_path)
-            if not pix.isNull():
-                disp.setPixmap(pix)
-            else:
-                disp.setText(image_path)
+            disp.setText("loading preview...")
+        # decoded and scaled down off the GUI thread; see thumbnails.py
+        self.thumbnails.request(image_path)
         self._focus_next_button()
+        self.draft_changed.emit()
+
+    def _on_thumbnail_ready(self, image_path: str, image: QImage) -> None:
+        if image_path != self.image_path:
+            return
+        lbl, disp, inp = self.widgets.get('image', (None, None, None))
+        if disp is not None:
+            disp.setPixmap(QPixmap.fromImage(image))
+
+    def _on_thumbnail_failed(self, image_path: str, message: str) -> None:
+        if image_path != self.image_path:
+            return
+        print(f"Error loading image preview: {message}")
+        lbl, disp, inp = self.widgets.get('image', (None, None, None))
+        if disp is not None:
+            disp.setText(image_path)
 
 class MainWindow(QMainWindow):
+    # the known terms caught up with the collection (emitted from a worker thread)
+    known_terms_changed = pyqtSignal()
+    # (ingestion number, ranked terms) of an article, from a worker thread
+    article_ingested = pyqtSignal(int, object)
+
     def __init__(self) -> None:
         super().__init__()
         self.setWindowTitle("Card Editor")
 
+        # Pick up where the last session left off (see journal.py)
+        self.journal = Journal()
+        session = self.journal.replay()
+
         # Left: multi-line text input
-        self.text_input = QTextEdit()
-        self.text_input.setPlainText("研究员\n深度\n能力\n与\n积累\n高等教育\nrunning\njailhouse\nrock")
+        self.text_input = QueueEdit()
+        if session.has_queue:
+            self.text_input.restore(session.queue.snapshot())
+        else:
+            self.text_input.setPlainText("研究员\n深度\n能力\n与\n积累\n高等教育\nrunning\njailhouse\nrock")
 
         # Right: card display
-        self.card_editor = CardEditor()
+        self.prefetcher = DefaultsPrefetcher()
+        self.card_editor = CardEditor(self.prefetcher)
+
+        # Terms already in the Anki collection, if one is set (see known_terms.py)
+        self.known_terms = get_known_terms()
+        self.skip_known = os.environ.get("ANKI_VOCAB_SKIP_KNOWN", "") not in ("", "0")
+        if self.known_terms is not None:
+            self.card_editor.known_terms = self.known_terms
+            self.known_highlighter = KnownTermsHighlighter(self.known_terms, self.text_input)
+            self.known_terms_changed.connect(self._on_known_terms_changed)
+            self.refresh_known_terms()
+        self.prefetcher.ready.connect(self.card_editor.on_defaults_ready)
+
+        # Re-key the prefetch window shortly after the queue text settles
+        self._prefetch_timer = QTimer(self)
+        self._prefetch_timer.setSingleShot(True)
+        self._prefetch_timer.setInterval(200)
+        self._prefetch_timer.timeout.connect(self.prefetch_queue)
+        self.text_input.textChanged.connect(self._prefetch_timer.start)
         scroll = QScrollArea()
         scroll.setWidgetResizable(True)
         scroll.setWidget(self.card_editor)
@@ -463,6 +849,10 @@ class MainWindow(QMainWindow):
         self.next_button.clicked.connect(self.show_next_card)
         self.next_button.setToolTip("Press Space or Enter to advance to the next card")
 
+        self.export_button = QPushButton("Export...")
+        self.export_button.clicked.connect(self.export_cards)
+        self.export_button.setToolTip("Write finished cards to an Anki package or collection")
+
 
         # Layout
         main_layout = QHBoxLayout()
@@ -471,19 +861,39 @@ class MainWindow(QMainWindow):
         lang_row = QHBoxLayout()
         lang_row.addWidget(QLabel("Target Language:"))
         self.target_lang_combo = QComboBox()
-        self.target_lang_combo.addItems(["Chinese", "English", "Other"])
+        self.target_lang_combo.addItems(["Chinese", "Chinese (Traditional)", "English", "Other"])
         self.previous_target_lang = self.target_lang_combo.currentText()
         self.target_lang_combo.currentTextChanged.connect(self.on_target_lang_changed)
         lang_row.addWidget(self.target_lang_combo)
         lang_row.addStretch()
         self.card_editor.set_fields(self.previous_target_lang, False)
         left_layout.addLayout(lang_row)
-        left_layout.addWidget(QLabel("Queue:"))
+        queue_row = QHBoxLayout()
+        queue_row.addWidget(QLabel("Queue:"))
+        queue_row.addStretch()
+        open_button = QPushButton("Open list...")
+        open_button.setToolTip("Replace the queue with a word list file, one term per line")
+        open_button.clicked.connect(self.open_queue_file)
+        queue_row.addWidget(open_button)
+        self.article_check = QCheckBox("Article")
+        self.article_check.setToolTip(
+            "Paste or open running text instead of a word list: its words are ranked and the best queued"
+        )
+        self.article_check.toggled.connect(self._on_article_mode)
+        queue_row.addWidget(self.article_check)
+        self.text_input.article_pasted.connect(self.ingest_text)
+        self.article_ingested.connect(self._on_article_ingested)
+        self._ingestions = 0
+        left_layout.addLayout(queue_row)
         left_layout.addWidget(self.text_input)
 
         right_layout = QVBoxLayout()
         right_layout.addWidget(scroll)
-        right_layout.addWidget(self.next_button, alignment=Qt.AlignRight)
+        button_row = QHBoxLayout()
+        button_row.addStretch()
+        button_row.addWidget(self.export_button)
+        button_row.addWidget(self.next_button)
+        right_layout.addLayout(button_row)
 
         main_layout.addLayout(left_layout)
         main_layout.addLayout(right_layout)
@@ -491,9 +901,32 @@ class MainWindow(QMainWindow):
         container = QWidget()
         container.setLayout(main_layout)
         self.setCentralWidget(container)
-        inst: Optional[QObject] = QApplication.instance()
-        assert inst is not None
-        inst.installEventFilter(self)
+        # clicking outside the text inputs takes the focus away from them
+        container.setFocusPolicy(Qt.ClickFocus)
+        self.keymap = self._build_keymap()
+        self.keymap.attach(
+            self, container, scroll, self.card_editor, self.target_lang_combo,
+            open_button, self.article_check, self.next_button, self.export_button,
+        )
+
+        self._restore_session(session.draft)
+        self.journal.follow_queue(self.text_input.queue)
+        self.card_editor.draft_changed.connect(self._journal_draft)
+        self.journal.start()
+
+    def _restore_session(self, draft: Optional[Dict[str, Any]]) -> None:
+        if draft is None:
+            return
+        lang = draft.get("lang")
+        if lang in LANGUAGE_FIELDS and lang != self.previous_target_lang:
+            self.target_lang_combo.setCurrentText(lang)
+        term = draft.get("term")
+        if term:
+            self.card_editor.set_term(term, True)
+            self.card_editor.restore_draft(draft)
+
+    def _journal_draft(self) -> None:
+        self.journal.append({"t": "draft", "draft": self.card_editor.draft()})
 
     def on_target_lang_changed(self, lang: str) -> None:
         """Handle selection of target language, opening issue link if 'Other' is chosen."""
@@ -517,80 +950,216 @@ class MainWindow(QMainWindow):
 
         self.previous_target_lang = lang
         self.card_editor.set_fields(lang, self.card_editor.editable)
+        self.card_editor.draft_changed.emit()
+        self.prefetch_queue()
+
+    def open_queue_file(self) -> None:
+        title = "Open article" if self.text_input.article_mode else "Open word list"
+        path, _ = QFileDialog.getOpenFileName(self, title, "", "Text files (*.txt);;All files (*)")
+        if not path:
+            return
+        if self.text_input.article_mode:
+            self._start_ingestion(partial(ingest_file, path))
+            return
+        try:
+            self.text_input.open_file(path)
+        except Exception as e:
+            print(f"Error opening word list: {e}")
+            return
+        self.prefetch_queue()
+
+    def _on_article_mode(self, on: bool) -> None:
+        self.text_input.article_mode = on
+
+    def ingest_text(self, text: str) -> None:
+        self._start_ingestion(lambda *args: ingest(read_chunks(io.StringIO(text)), *args))
+
+    def _start_ingestion(self, run: Callable[..., List[str]]) -> None:
+        """Rank an article's words on a worker thread, then queue the best of them."""
+        self._ingestions += 1
+        # terms already queued or in the collection aren't worth a place
+        queued = set(self.text_input.peek(self.text_input.queue.window))
+        known = self.known_terms
+        def skip(term: str) -> bool:
+            return term in queued or (known is not None and term in known)
+        def work(number: int, lang: str) -> None:
+            try:
+                terms = run(lang, INGEST_TOP, skip)
+            except Exception as e:
+                print(f"Error reading article: {e}")
+                terms = []
+            self.article_ingested.emit(number, terms)
+        self.setWindowTitle("Reading article...")
+        threading.Thread(target=work, args=(self._ingestions, self.card_editor.lang), daemon=True).start()
+
+    def _on_article_ingested(self, number: int, terms: List[str]) -> None:
+        # a newer article replaces this one
+        if number != self._ingestions:
+            return
+        self.text_input.add_terms(terms)
+        self.setWindowTitle(f"Queued {len(terms)} words from the article")
+        self.prefetch_queue()
+
+    def prefetch_queue(self) -> None:
+        self._prefetch_timer.stop()
+        self.prefetcher.prefetch(self.text_input.peek(self.prefetcher.depth), keep=self.card_editor.current_term)
+
+    def export_cards(self) -> None:
+        path, _ = QFileDialog.getSaveFileName(
+            self, "Export cards", "vocab.apkg", "Anki package (*.apkg);;Anki collection (*.anki2)"
+        )
+        if not path:
+            return
+        try:
+            count = export(path, get_card_store().cards())
+        except Exception as e:
+            print(f"Error exporting cards: {e}")
+            return
+        self.setWindowTitle(f"Exported {count} new cards to {os.path.basename(path)}")
+        self.refresh_known_terms()
+
+    def refresh_known_terms(self) -> None:
+        """Catch up with changes to the collection in the background."""
+        if self.known_terms is not None:
+            threading.Thread(target=self._refresh_known_terms, args=(self.known_terms,), daemon=True).start()
+
+    def _refresh_known_terms(self, known: KnownTerms) -> None:
+        try:
+            changed = known.refresh()
+        except (OSError, sqlite3.Error, ValueError) as e:
+            print(f"Error reading Anki collection: {e}")
+            return
+        if changed:
+            self.known_terms_changed.emit()
+
+    def _on_known_terms_changed(self) -> None:
+        self.known_highlighter.rehighlight()
+        self.card_editor.refresh_title()
+
+    def changeEvent(self, event: QEvent) -> None:
+        super().changeEvent(event)
+        # back from Anki, perhaps with notes added there
+        if event.type() == QEvent.ActivationChange and self.isActiveWindow():
+            self.refresh_known_terms()
 
     def show_next_card(self) -> None:
-        text = self.text_input.toPlainText().strip().lower()
-        text = unicodedata.normalize("NFKC", text) # replace U+2F00 with U+4E00, etc.
-        lines = text.splitlines()
+        card = self.card_editor.finished_card()
+        if card is not None:
+            try:
+                get_card_store().add(card)
+            except Exception as e:
+                print(f"Error saving card: {e}")
+            # replaying it after a crash adds it only if it isn't stored already
+            self.journal.append({"t": "card", "card": asdict(card)})
+        next_term = self.text_input.pop_term()
+        skipped = 0
+        if self.skip_known and self.known_terms is not None:
+            while next_term is not None and next_term in self.known_terms:
+                skipped += 1
+                next_term = self.text_input.pop_term()
+            if skipped:
+                print(f"Skipped {skipped} terms already in the collection")
+        self.journal.append({"t": "next", "lang": self.card_editor.lang, "term": next_term, "skipped": skipped})
 
-        if not lines:
+        if next_term is None:
             self.card_editor.set_term("(no more terms)", False)
             return
 
-        next_term = lines.pop(0)
         self.card_editor.set_term(next_term, True)
-        self.text_input.setPlainText("\n".join(lines))
-
-
-    def eventFilter(self, obj: QObject, event: QEvent) -> bool:
-        # Clear focus on click outside text inputs
-        if event.type() == QEvent.MouseButtonPress:
-            me = cast(QMouseEvent, event)
-            widget: Optional[QObject] = QApplication.widgetAt(me.globalPos())
-            is_text = False
-            w: Optional[QObject] = widget
-            while w is not None:
-                if isinstance(w, (QLineEdit, QTextEdit)):
-                    is_text = True
-                    break
-                w = w.parent()
-            if not is_text:
-                focused = QApplication.focusWidget()
-                if isinstance(focused, (QLineEdit, QTextEdit)):
-                    focused.clearFocus()
-        if event.type() == QEvent.KeyPress:
-            ke = cast(QKeyEvent, event)
-            if self.card_editor.selecting_defaults:
-                if ke.key() in (Qt.Key_Up, Qt.Key_K):
-                    self.card_editor.prev_defaults_option()
-                    return True
-                if ke.key() in (Qt.Key_Down, Qt.Key_J, Qt.Key_Tab):
-                    self.card_editor.next_defaults_option()
-                    return True
-                if ke.key() in (Qt.Key_Return, Qt.Key_Enter, Qt.Key_Space):
-                    self.card_editor.confirm_defaults_option_selection()
-                    return True
-            if self.card_editor.selecting_example:
-                if Qt.Key_1 <= ke.key() <= Qt.Key_9:
-                    idx = ke.key() - Qt.Key_1
-                    self.card_editor.confirm_example_option_selection(idx)
-                    return True
-                return True
-            if int(ke.modifiers()) == Qt.NoModifier:
-                focused = QApplication.focusWidget()
-                if isinstance(focused, (QLineEdit, QTextEdit)):
-                    return super().eventFilter(obj, event)
-                # While choosing between defaults or if not editable, block editing shortcuts
-                if self.card_editor.selecting_defaults or not self.card_editor.editable:
-                    return True
-                k = ke.key()
-                if k == Qt.Key_I:
-                    self.card_editor.show_image_drop()
-                    return True
-                for field in self.card_editor.fields:
-                    if field.shortcut is not None and k == field.shortcut and field.key in self.card_editor.widgets:
-                        self.card_editor.start_edit(field.key)
-                        return True
-            if ke.key() in (Qt.Key_Return, Qt.Key_Enter, Qt.Key_Space):
-                fw = QApplication.focusWidget()
-                if not isinstance(fw, (QLineEdit, QTextEdit, QPushButton)):
-                    self.show_next_card()
-                    return True
-        return super().eventFilter(obj, event)
-
-data.init()
-app = QApplication(sys.argv)
-window = MainWindow()
-window.resize(600, 300)
-window.show()
-app.exec()
+        self.prefetch_queue()
+
+    def closeEvent(self, event: QCloseEvent) -> None:
+        self.prefetcher.shutdown()
+        self.card_editor.thumbnails.shutdown()
+        self.journal.close()
+        stats = get_cache().stats()
+        print(f"defaults cache: {stats['hits']} hits, {stats['misses']} misses, {stats['entries']} entries")
+        super().closeEvent(event)
+
+    def _key_mode(self) -> str:
+        ce = self.card_editor
+        if ce.selecting_example:
+            return "example"
+        if ce.selecting_defaults:
+            return "defaults"
+        if isinstance(QApplication.focusWidget(), (QLineEdit, QTextEdit)):
+            return "text"
+        if ce.loading_defaults or not ce.editable:
+            return "blocked"
+        # editing a card: the field shortcuts of its language
+        return ce.lang
+
+    def _build_keymap(self) -> Keymap:
+        ce = self.card_editor
+        keymap = Keymap(self._key_mode)
+        keymap.bind(ANY_MODE, [Qt.Key_Escape], ce.cancel_image_download)
+
+        keymap.bind("defaults", [Qt.Key_Up, Qt.Key_K], ce.prev_defaults_option)
+        keymap.bind("defaults", [Qt.Key_Down, Qt.Key_J, Qt.Key_Tab], ce.next_defaults_option)
+        keymap.bind("defaults", [Qt.Key_Return, Qt.Key_Enter, Qt.Key_Space], ce.confirm_defaults_option_selection)
+        keymap.block("defaults")
+
+        for i in range(9):
+            keymap.bind("example", [Qt.Key_1 + i], partial(ce.confirm_example_option_selection, i))
+        keymap.block("example")
+
+        # While choosing between defaults or if not editable, block editing shortcuts
+        keymap.block("blocked")
+
+        # a "did you mean" term, for a term the dictionaries don't know
+        for mode in ["defaults", *LANGUAGE_FIELDS]:
+            for i in range(9):
+                keymap.bind(mode, [Qt.Key_1 + i], partial(ce.accept_suggestion, i))
+
+        for lang, fields in LANGUAGE_FIELDS.items():
+            keymap.bind(lang, [Qt.Key_I], ce.show_image_drop)
+            for field in fields:
+                if field.shortcut is not None and not keymap.bound(lang, field.shortcut):
+                    keymap.bind(lang, [field.shortcut], partial(ce.start_edit, field.key))
+            keymap.bind(lang, [Qt.Key_Return, Qt.Key_Enter, Qt.Key_Space], self._advance_by_key)
+        return keymap
+
+    def _advance_by_key(self) -> bool:
+        # a focused button handles the key itself
+        if isinstance(QApplication.focusWidget(), QPushButton):
+            return False
+        self.show_next_card()
+        return True
+
+def _load_sentences() -> None:
+    # compiles the corpus if it's new or changed: cards made meanwhile just go without its examples
+    try:
+        defaults.sentences.load()
+    except Exception as e:
+        print(f"Error building sentence index: {e}")
+
+def _load_fuzzy() -> None:
+    # compiled once per dictionary update: typos looked up meanwhile just get no suggestions
+    try:
+        defaults.fuzzy.load()
+    except Exception as e:
+        print(f"Error building fuzzy index: {e}")
+
+def _first_paint() -> None:
+    startup.mark("first paint")
+    print(startup.write_report(os.path.join(data.data_dir, 'startup_timings.jsonl')))
+
+def main() -> None:
+    with startup.phase("data.init"):
+        data.init()
+    threading.Thread(target=_load_sentences, daemon=True).start()
+    threading.Thread(target=_load_fuzzy, daemon=True).start()
+    with startup.phase("QApplication"):
+        app = QApplication(sys.argv)
+    with startup.phase("MainWindow"):
+        window = MainWindow()
+        window.resize(600, 300)
+    window.show()
+    window.prefetch_queue()
+    # runs once the event loop has handled the show/paint events queued above
+    QTimer.singleShot(0, _first_paint)
+    app.exec()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+from PyQt5.QtCore import QObject, pyqtSignal
+from concurrent.futures import Future, ThreadPoolExecutor
+from cache import cached_defaults
+from defaults import LANGUAGE_PREPARE
+from itertools import islice
+from typing import Any, Callable, Dict, Iterable, List, Optional
+import os
+
+Options = List[Dict[str, Any]]
+
+# how many upcoming queue terms to look up ahead of time
+PREFETCH_DEPTH = int(os.environ.get("ANKI_VOCAB_PREFETCH_DEPTH", "4"))
+PREFETCH_WORKERS = 2
+
+class DefaultsPrefetcher(QObject):
+    """Looks up language defaults for upcoming terms on a worker pool."""
+
+    # (language, term, options), emitted on the GUI thread via a queued connection
+    ready = pyqtSignal(str, str, object)
+
+    def __init__(self, depth: int = PREFETCH_DEPTH, workers: int = PREFETCH_WORKERS) -> None:
+        super().__init__()
+        self.depth = depth
+        self._pool = ThreadPoolExecutor(max_workers=workers)
+        self._lang = ""
+        self._provider: Callable[[str], Options] = lambda _: []
+        self._prepare: Optional[Callable[[List[str]], None]] = None
+        self._futures: Dict[str, Future[Options]] = {}
+
+    def set_language(self, lang: str) -> None:
+        """Switch provider, dropping everything computed for the old language."""
+        if lang == self._lang:
+            return
+        self._lang = lang
+        self._provider = cached_defaults(lang)
+        self._prepare = LANGUAGE_PREPARE.get(lang)
+        for future in self._futures.values():
+            future.cancel()
+        self._futures.clear()
+
+    def request(self, term: str) -> None:
+        """Make sure a lookup for term is queued or finished."""
+        future = self._futures.get(term)
+        if future is not None and not future.cancelled():
+            return
+        lang, provider = self._lang, self._provider
+        future = self._pool.submit(self._lookup, provider, term)
+        future.add_done_callback(lambda f: self._on_done(lang, term, f))
+        self._futures[term] = future
+
+    def get(self, term: str) -> Optional[Options]:
+        """Return the finished options for term, or None if not ready yet."""
+        future = self._futures.get(term)
+        if future is None or not future.done() or future.cancelled():
+            return None
+        return future.result()
+
+    def prefetch(self, terms: Iterable[str], keep: Optional[str] = None) -> None:
+        """Re-key the prefetch window to the first `depth` of terms.
+
+        Lookups for terms that fell out of the window are cancelled (or
+        discarded, if already running). `keep` is never dropped.
+        """
+        wanted = list(dict.fromkeys(islice(terms, self.depth)))
+        keep_set = set(wanted)
+        if keep is not None:
+            keep_set.add(keep)
+        for term in list(self._futures):
+            if term not in keep_set:
+                self._futures.pop(term).cancel()
+        new = [t for t in wanted if t not in self._futures or self._futures[t].cancelled()]
+        if new and self._prepare is not None:
+            # queued ahead of the lookups, so they find the window's shared work done
+            self._pool.submit(self._run_prepare, self._prepare, new)
+        for term in wanted:
+            self.request(term)
+
+    def shutdown(self) -> None:
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+    def _lookup(self, provider: Callable[[str], Options], term: str) -> Options:
+        try:
+            return provider(term)
+        except Exception as e:
+            print(f"Error looking up defaults for {term!r}: {e}")
+            return [{}]
+
+    def _run_prepare(self, prepare: Callable[[List[str]], None], terms: List[str]) -> None:
+        try:
+            prepare(terms)
+        except Exception as e:
+            print(f"Error preparing defaults for {len(terms)} terms: {e}")
+
+    def _on_done(self, lang: str, term: str, future: Future[Options]) -> None:
+        if future.cancelled():
+            return
+        self.ready.emit(lang, term, future.result())
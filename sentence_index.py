@@ -0,0 +1,363 @@
+"""Compiled, memory-mapped index of a local example-sentence corpus.
+
+Put a Tatoeba export (sentences.csv: id, language, text, tab-separated;
+optionally .gz or .bz2) in data_dir, or point ANKI_VOCAB_SENTENCES at one.
+Its English and Mandarin sentences are compiled once into a flat file laid
+out as
+
+    header | slots | keys | postings | sentences | string pool
+
+where sentences are (offset, length) pairs into the pool, sorted shortest
+first; keys are a language code plus a word, each pointing at a run of
+postings, the (ascending, so shortest first) numbers of the sentences the
+word occurs in, at most MAX_POSTINGS of them; and slots are an
+open-addressed crc32 hash table over the keys. English words are keyed by
+their WordNet base form, so a lookup goes through the sentences with any form
+of the term; those with the term as spelled ("run" in "running", not "ran")
+are kept, and it is bolded there as in WordNet's examples. Chinese sentences
+are keyed by every CC-CEDICT headword in them, overlapping ones included, in
+simplified characters.
+
+    python sentence_index.py [sentences.csv] [--term WORD --lang eng]
+
+rebuilds the index, or prints the examples found for a term.
+"""
+from functools import lru_cache
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+import argparse
+import bz2
+import data
+import gzip
+import mmap
+import os
+import re
+import struct
+import threading
+import time
+import zlib
+
+INDEX_MAGIC = b"SNTX"
+INDEX_FORMAT = 1
+
+# sentences kept per word; lookups want the shortest few
+MAX_POSTINGS = 1000
+# the languages indexed, by Tatoeba's (and WordNet's) codes
+LANGS = ("eng", "cmn")
+
+# magic, format, sentence count, key count, slot count,
+# slots/keys/postings/sentences/pool offsets, source path (pool offset, length), source stamp
+_HEADER = struct.Struct("<4sIIIIQQQQQII32s")
+# key index + 1, or 0 for an empty slot
+_SLOT = struct.Struct("<I")
+# pool offset, length, first posting, posting count
+_KEY = struct.Struct("<IIII")
+_POSTING = struct.Struct("<I")
+# pool offset, length
+_SENTENCE = struct.Struct("<II")
+
+_word_re = re.compile(r"[A-Za-z]+(?:['’-][A-Za-z]+)*")
+
+def default_source() -> Optional[str]:
+    setting = os.environ.get("ANKI_VOCAB_SENTENCES", "")
+    if setting:
+        return os.path.expanduser(setting)
+    for name in ("sentences.csv", "sentences.tsv"):
+        for ext in ("", ".bz2", ".gz"):
+            path = os.path.join(data.data_dir, name + ext)
+            if os.path.exists(path):
+                return path
+    return None
+
+def default_index_path() -> str:
+    return os.path.join(data.data_dir, 'sentences.idx')
+
+def source_stamp(source: str) -> bytes:
+    st = os.stat(source)
+    return f"{st.st_size}:{st.st_mtime_ns}".encode()
+
+def _key(lang: str, word: str) -> bytes:
+    return f"{lang}\x1f{word}".encode('utf-8')
+
+@lru_cache(maxsize=1 << 16)
+def _base_form(word: str) -> str:
+    from defaults import senses
+    return senses.lemmatize(word) or word
+
+def _eng_keys(text: str) -> List[str]:
+    return [_base_form(word.lower()) for word in _word_re.findall(text)]
+
+def _cmn_keys(text: str) -> List[str]:
+    from defaults import cedict
+    # converted a character at a time, so its headwords are the simplified ones
+    return cedict.headwords(cedict.convert(text))
+
+# ----------------------------------- BUILD ------------------------------------
+
+def read_tatoeba(lines: Iterable[str]) -> Iterator[Tuple[str, str]]:
+    """(language, text) of each sentence in Tatoeba's sentences.csv, or its detailed variant."""
+    for line in lines:
+        parts = line.rstrip("\n").split("\t")
+        if len(parts) >= 3 and parts[1] in LANGS and parts[2].strip():
+            yield parts[1], parts[2].strip()
+
+def _open_source(source: str) -> Iterator[str]:
+    if source.endswith('.gz'):
+        f = gzip.open(source, mode='rt', encoding='utf-8', errors='replace')
+    elif source.endswith('.bz2'):
+        f = bz2.open(source, mode='rt', encoding='utf-8', errors='replace')
+    else:
+        f = open(source, encoding='utf-8', errors='replace')
+    with f:
+        yield from f
+
+def build_index(source: str, dest: str) -> None:
+    sentences = sorted(set(read_tatoeba(_open_source(source))), key=lambda s: (len(s[1]), s))
+
+    pool = bytearray()
+    def add(b: bytes) -> Tuple[int, int]:
+        pool.extend(b)
+        return len(pool) - len(b), len(b)
+
+    records = bytearray()
+    # (language, word) -> sentence numbers, ascending
+    postings: Dict[Tuple[str, str], List[int]] = {}
+    lemma_keys = {"eng": _eng_keys, "cmn": _cmn_keys}
+    for i, (lang, text) in enumerate(sentences):
+        records.extend(_SENTENCE.pack(*add(text.encode('utf-8'))))
+        for word in dict.fromkeys(lemma_keys[lang](text)):
+            found = postings.setdefault((lang, word), [])
+            if len(found) < MAX_POSTINGS:
+                found.append(i)
+
+    sorted_keys = [_key(lang, word) for lang, word in sorted(postings)]
+    keys = bytearray()
+    runs = bytearray()
+    n_postings = 0
+    for key, found in zip(sorted_keys, (postings[k] for k in sorted(postings))):
+        keys.extend(_KEY.pack(*add(key), n_postings, len(found)))
+        runs.extend(struct.pack(f"<{len(found)}I", *found))
+        n_postings += len(found)
+
+    # load factor <= 0.5 keeps probe chains to a step or two
+    n_slots = 1 << max(1, (2 * len(sorted_keys) - 1).bit_length())
+    slot_table = [0] * n_slots
+    for i, key in enumerate(sorted_keys):
+        slot = zlib.crc32(key) & (n_slots - 1)
+        while slot_table[slot]:
+            slot = (slot + 1) & (n_slots - 1)
+        slot_table[slot] = i + 1
+    slots = struct.pack(f"<{n_slots}I", *slot_table)
+
+    source_ref = add(os.path.abspath(source).encode('utf-8'))
+
+    slots_off = _HEADER.size
+    keys_off = slots_off + len(slots)
+    postings_off = keys_off + len(keys)
+    sentences_off = postings_off + len(runs)
+    pool_off = sentences_off + len(records)
+    header = _HEADER.pack(
+        INDEX_MAGIC, INDEX_FORMAT, len(sentences), len(sorted_keys), n_slots,
+        slots_off, keys_off, postings_off, sentences_off, pool_off, *source_ref, source_stamp(source),
+    )
+
+    os.makedirs(os.path.dirname(os.path.abspath(dest)), exist_ok=True)
+    tmp = f"{dest}.tmp{os.getpid()}"
+    try:
+        with open(tmp, 'wb') as f:
+            f.write(header)
+            f.write(slots)
+            f.write(keys)
+            f.write(runs)
+            f.write(records)
+            f.write(pool)
+        os.replace(tmp, dest)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+# ----------------------------------- LOOKUP -----------------------------------
+
+def _bold(text: str, spans: List[Tuple[int, int]]) -> str:
+    out = []
+    last = 0
+    for start, end in spans:
+        if start < last:
+            continue
+        out.append(f"{text[last:start]}<b>{text[start:end]}</b>")
+        last = end
+    return "".join(out) + text[last:]
+
+class SentenceIndex:
+    """Read-only view of a compiled sentence index, opened on first lookup.
+
+    Lookups never build it: load() does, from batch.py and at startup on a
+    thread of its own. Until the index is current for the corpus in data_dir
+    (or, with no corpus there, until one was built earlier), lookups find
+    nothing.
+    """
+
+    def __init__(self, path: Optional[str] = None, source: Optional[str] = None) -> None:
+        self.path = path or default_index_path()
+        self.source = source
+        self._lock = threading.Lock()
+        self._build_lock = threading.Lock()
+        self._mm: Optional[mmap.mmap] = None
+        self._missing = False
+        self._slot_mask = 0
+        self._slots_off = 0
+        self._keys_off = 0
+        self._postings_off = 0
+        self._sentences_off = 0
+        self._pool_off = 0
+
+    def _read_header(self, mm: mmap.mmap) -> Optional[Tuple[int, ...]]:
+        if len(mm) < _HEADER.size:
+            return None
+        magic, fmt, _, _, *offsets = _HEADER.unpack_from(mm, 0)[:10]
+        if magic != INDEX_MAGIC or fmt != INDEX_FORMAT:
+            return None
+        return tuple(offsets)
+
+    def _map(self) -> Optional[mmap.mmap]:
+        try:
+            with open(self.path, 'rb') as f:
+                return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            return None
+
+    def _source(self) -> Optional[str]:
+        source = self.source or default_source()
+        return source if source is not None and os.path.exists(source) else None
+
+    def _open(self) -> Optional[mmap.mmap]:
+        """The index, if it's current; None (until load() has built it) if not."""
+        with self._lock:
+            if self._mm is not None or self._missing:
+                return self._mm
+            source = self._source()
+            mm = self._map()
+            header = self._read_header(mm) if mm is not None else None
+            stale = header is not None and mm is not None and source is not None \
+                and _HEADER.unpack_from(mm, 0)[-1].rstrip(b'\0') != source_stamp(source)
+            if mm is None or header is None or stale:
+                # missing, from an older format, or the corpus changed
+                if mm is not None:
+                    mm.close()
+                # with no corpus there's nothing to wait for
+                self._missing = source is None
+                return None
+            n_slots, self._slots_off, self._keys_off, self._postings_off, self._sentences_off, self._pool_off = header
+            self._slot_mask = n_slots - 1
+            self._mm = mm
+            return mm
+
+    def load(self) -> None:
+        """Build the index if the corpus needs it, and open it. Slow the first
+        time; lookups made meanwhile don't wait for it, they find nothing."""
+        with self._build_lock:
+            if self._mm is not None or self._open() is not None:
+                return
+            source = self._source()
+            if source is None:
+                return
+            build_index(source, self.path)
+        self._open()
+
+    def ready(self) -> bool:
+        """Whether lookups find the corpus's sentences now."""
+        return (self._mm or self._open()) is not None
+
+    def _postings(self, mm: mmap.mmap, key: bytes) -> List[int]:
+        slot = zlib.crc32(key) & self._slot_mask
+        while True:
+            (key_index,) = _SLOT.unpack_from(mm, self._slots_off + slot * _SLOT.size)
+            if not key_index:
+                return []
+            off, length, first, count = _KEY.unpack_from(mm, self._keys_off + (key_index - 1) * _KEY.size)
+            start = self._pool_off + off
+            if mm[start:start + length] == key:
+                at = self._postings_off + first * _POSTING.size
+                return list(struct.unpack_from(f"<{count}I", mm, at))
+            slot = (slot + 1) & self._slot_mask
+
+    def _sentence(self, mm: mmap.mmap, i: int) -> str:
+        off, length = _SENTENCE.unpack_from(mm, self._sentences_off + i * _SENTENCE.size)
+        start = self._pool_off + off
+        return mm[start:start + length].decode('utf-8')
+
+    def examples(self, term: str, lang: str, k: int) -> List[str]:
+        """Up to k of the shortest sentences using term, with it in <b> tags."""
+        if lang not in LANGS or not term.strip():
+            return []
+        mm = self._mm or self._open()
+        if mm is None:
+            return []
+        if lang == "eng":
+            return self._eng_examples(mm, term, k)
+        return self._cmn_examples(mm, term, k)
+
+    def _eng_examples(self, mm: mmap.mmap, term: str, k: int) -> List[str]:
+        keys = _eng_keys(term)
+        if not keys:
+            return []
+        # the rarest word's sentences, then those that have the others too
+        candidates = min((self._postings(mm, _key("eng", key)) for key in set(keys)), key=len)
+        # the term as spelled, as get_syn_options bolds it in WordNet's examples
+        pattern = re.compile(re.escape(term.strip()), re.IGNORECASE)
+        found = []
+        for i in candidates:
+            text = self._sentence(mm, i)
+            spans = [m.span() for m in pattern.finditer(text)]
+            # not just the term itself
+            if spans and _word_re.findall(text.lower()) != _word_re.findall(term.lower()):
+                found.append(_bold(text, spans))
+                if len(found) >= k:
+                    break
+        return found
+
+    def _cmn_examples(self, mm: mmap.mmap, term: str, k: int) -> List[str]:
+        from defaults import cedict
+        simplified = cedict.convert(term)
+        pieces = [simplified] if self._postings(mm, _key("cmn", simplified)) else cedict.split(simplified)
+        candidates = min((self._postings(mm, _key("cmn", piece)) for piece in set(pieces)), key=len)
+        found = []
+        for i in candidates:
+            text = self._sentence(mm, i)
+            # converted a character at a time, so positions line up with text
+            converted = cedict.convert(text)
+            spans = []
+            at = converted.find(simplified)
+            while at >= 0:
+                spans.append((at, at + len(simplified)))
+                at = converted.find(simplified, at + len(simplified))
+            if spans and text.strip("。！？.!? ") != term:
+                found.append(_bold(text, spans))
+                if len(found) >= k:
+                    break
+        return found
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Build or query the example-sentence index.")
+    parser.add_argument("source", nargs="?", help="Tatoeba sentences.csv (default: the one in data_dir)")
+    parser.add_argument("--term", help="print the examples found for this term")
+    parser.add_argument("--lang", default="cmn", choices=LANGS, help="language of --term (default: cmn)")
+    parser.add_argument("-k", type=int, default=9, help="examples to print (default: 9)")
+    args = parser.parse_args()
+
+    data.init(offline=True)
+    if args.term:
+        index = SentenceIndex(source=args.source)
+        index.load()
+        start = time.perf_counter()
+        examples = index.examples(args.term, args.lang, args.k)
+        for example in examples:
+            print(example)
+        print(f"{len(examples)} examples in {(time.perf_counter() - start) * 1000:.1f}ms")
+    else:
+        src = args.source or default_source()
+        if src is None:
+            parser.error(f"no sentences.csv in {data.data_dir}; pass one, or set ANKI_VOCAB_SENTENCES")
+        start = time.perf_counter()
+        build_index(src, default_index_path())
+        print(f"Wrote {default_index_path()} from {src} in {time.perf_counter() - start:.1f}s")
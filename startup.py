@@ -0,0 +1,51 @@
+"""Per-phase startup timings.
+
+Import this first: its clock starts when it's imported. Each launch appends
+one JSON line to data_dir/startup_timings.jsonl, so cold-start regressions
+show up by comparing lines.
+"""
+from contextlib import contextmanager
+from typing import Iterator, List, Tuple
+import importlib
+import json
+import time
+
+_start = time.perf_counter()
+_last = _start
+phases: List[Tuple[str, float]] = []
+
+def mark(name: str) -> None:
+    """Record the time since the previous mark (or phase) as phase `name`."""
+    global _last
+    now = time.perf_counter()
+    phases.append((name, now - _last))
+    _last = now
+
+@contextmanager
+def phase(name: str) -> Iterator[None]:
+    global _last
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        _last = time.perf_counter()
+        phases.append((name, _last - start))
+
+def timed_imports(*modules: str) -> None:
+    """Import modules one by one, timing each (later imports of them are free)."""
+    for module in modules:
+        with phase(f"import {module}"):
+            importlib.import_module(module)
+
+def write_report(path: str) -> str:
+    total = time.perf_counter() - _start
+    record = {
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "total_ms": round(total * 1000, 1),
+        "phases": {name: round(secs * 1000, 1) for name, secs in phases},
+    }
+    with open(path, 'a', encoding='utf-8') as f:
+        f.write(json.dumps(record) + "\n")
+    slowest = sorted(phases, key=lambda p: p[1], reverse=True)[:3]
+    return f"startup: {total * 1000:.0f}ms (" + ", ".join(
+        f"{name} {secs * 1000:.0f}ms" for name, secs in slowest) + ")"
@@ -0,0 +1,202 @@
+"""Queue of terms waiting to be made into cards.
+
+Only the head of the queue is held in memory (and shown in the queue
+widget); the rest stays in its source, a word list on disk or the tail of
+a large paste, and is read in as the head drains. Opening a 100k-line file
+costs no more than opening a short one.
+
+Every change is also reported as a small delta (see TermQueue.apply), so the
+session journal can follow the queue without copying it after each edit.
+"""
+from collections import deque
+from itertools import islice
+from typing import Any, BinaryIO, Callable, Deque, Dict, Iterable, Iterator, List, Optional, Union
+import unicodedata
+
+# terms kept in memory/on screen; refilled once fewer than half are left
+QUEUE_WINDOW = 1000
+
+def normalize_term(line: str) -> str:
+    # replace U+2F00 with U+4E00, etc.
+    return unicodedata.normalize("NFKC", line.strip().lower())
+
+def read_terms(lines: Iterable[str]) -> Iterator[str]:
+    for line in lines:
+        term = normalize_term(line)
+        if term:
+            yield term
+
+class _LineSource:
+    """Lines held in memory, e.g. the overflow of a large paste."""
+
+    def __init__(self, lines: List[str], pos: int = 0) -> None:
+        self.lines = lines
+        self.pos = pos
+
+    def readline(self) -> Optional[str]:
+        if self.pos >= len(self.lines):
+            return None
+        self.pos += 1
+        return self.lines[self.pos - 1]
+
+    def state(self) -> Dict[str, Any]:
+        return {"lines": self.lines[self.pos:]}
+
+class _FileSource:
+    """Lines of a word list on disk, read from a byte offset on."""
+
+    def __init__(self, path: str, offset: int = 0) -> None:
+        self.path = path
+        self.offset = offset
+        self._f: Optional[BinaryIO] = None
+
+    def readline(self) -> Optional[str]:
+        if self._f is None:
+            self._f = open(self.path, 'rb')
+            self._f.seek(self.offset)
+        raw = self._f.readline()
+        if not raw:
+            self._f.close()
+            return None
+        self.offset += len(raw)
+        return raw.decode('utf-8', errors='replace')
+
+    def state(self) -> Dict[str, Any]:
+        return {"file": self.path, "offset": self.offset}
+
+_Source = Union[_LineSource, _FileSource]
+
+Change = Dict[str, Any]
+
+class TermQueue:
+    """A deque of normalized terms, backed by lazily read sources of lines."""
+
+    def __init__(self, window: int = QUEUE_WINDOW) -> None:
+        self.window = window
+        self._terms: Deque[str] = deque()
+        self._sources: Deque[_Source] = deque()
+        # called with each change as it's made, e.g. to journal it
+        self.on_change: Optional[Callable[[Change], None]] = None
+
+    def _changed(self, change: Change) -> None:
+        if self.on_change is not None:
+            self.on_change(change)
+
+    def __len__(self) -> int:
+        """Number of terms read in so far (not counting the unread sources)."""
+        return len(self._terms)
+
+    def has_more(self) -> bool:
+        """Whether the sources may still hold unread lines."""
+        return bool(self._sources)
+
+    def peek(self, n: int) -> List[str]:
+        return list(islice(self._terms, n))
+
+    def popleft(self) -> Optional[str]:
+        if not self._terms:
+            return None
+        self._changed({"op": "pop"})
+        return self._terms.popleft()
+
+    def reset(self, lines: Iterable[str]) -> None:
+        """Replace the in-memory terms (e.g. after the user edited them)."""
+        old = list(self._terms)
+        new = list(read_terms(lines))
+        # reported as the one run of terms that changed, usually a line or two
+        start = 0
+        while start < min(len(old), len(new)) and old[start] == new[start]:
+            start += 1
+        end = 0
+        while end < min(len(old), len(new)) - start and old[-1 - end] == new[-1 - end]:
+            end += 1
+        if start == len(old) == len(new):
+            return
+        self._changed({"op": "splice", "at": start, "remove": len(old) - start - end,
+                       "insert": new[start:len(new) - end]})
+        self._terms = deque(new)
+
+    def _splice(self, at: int, remove: int, insert: List[str]) -> None:
+        self._terms.rotate(-at)
+        for _ in range(remove):
+            self._terms.popleft()
+        self._terms.extendleft(reversed(insert))
+        self._terms.rotate(at)
+
+    def clear(self) -> None:
+        """Drop everything, including the unread sources."""
+        self._changed({"op": "clear"})
+        self._terms.clear()
+        self._sources.clear()
+
+    def open(self, path: str) -> None:
+        """Replace the whole queue with the lines of a word list on disk."""
+        self._changed({"op": "open", "path": path})
+        self._terms.clear()
+        self._sources = deque([_FileSource(path)])
+
+    def push_front(self, lines: Iterable[str]) -> None:
+        """Queue raw lines after the in-memory terms, ahead of the unread sources."""
+        lines = list(lines)
+        self._changed({"op": "push_front", "lines": lines})
+        self._sources.appendleft(_LineSource(lines))
+
+    def extend(self, lines: Iterable[str]) -> None:
+        """Queue raw lines after everything else."""
+        lines = list(lines)
+        self._changed({"op": "extend", "lines": lines})
+        self._sources.append(_LineSource(lines))
+
+    def _readlines(self) -> Iterator[str]:
+        while self._sources:
+            line = self._sources[0].readline()
+            if line is None:
+                self._sources.popleft()
+            else:
+                yield line
+
+    def refill(self) -> List[str]:
+        """Read terms from the sources until the window is full again.
+
+        Does nothing while more than half the window is left. Returns the
+        terms appended, for the view to display.
+        """
+        if not self._sources or len(self._terms) * 2 > self.window:
+            return []
+        # the same read again gives the same terms: only that it happened is reported
+        self._changed({"op": "refill"})
+        added = list(islice(read_terms(self._readlines()), self.window - len(self._terms)))
+        self._terms.extend(added)
+        return added
+
+    def snapshot(self) -> Dict[str, Any]:
+        """The queue's state as plain data (see restore)."""
+        return {"terms": list(self._terms), "sources": [source.state() for source in self._sources]}
+
+    def restore(self, snapshot: Dict[str, Any]) -> None:
+        self._terms = deque(snapshot["terms"])
+        self._sources = deque(
+            _FileSource(s["file"], s["offset"]) if "file" in s else _LineSource(s["lines"])
+            for s in snapshot["sources"]
+        )
+
+    def apply(self, change: Change) -> None:
+        """Make a change reported through on_change, e.g. when replaying a journal."""
+        op = change["op"]
+        if op == "pop":
+            self.popleft()
+        elif op == "splice":
+            self._changed(change)
+            self._splice(change["at"], change["remove"], change["insert"])
+        elif op == "clear":
+            self.clear()
+        elif op == "open":
+            self.open(change["path"])
+        elif op == "push_front":
+            self.push_front(change["lines"])
+        elif op == "extend":
+            self.extend(change["lines"])
+        elif op == "refill":
+            self.refill()
+        else:
+            raise ValueError(f"unknown queue change {op!r}")
@@ -0,0 +1,51 @@
+"""A data directory of the tests' own, so they never read or write the
+user's ~/.anki_card_gen."""
+from typing import Iterator
+import os
+import pathlib
+
+import nltk
+import pytest
+
+import cache
+import card_store
+import data
+import defaults
+import image_store
+import known_terms
+from cedict_index import CedictIndex
+from fuzzy_index import FuzzyIndex
+from sentence_index import SentenceIndex
+from wordnet_index import SenseIndex
+
+@pytest.fixture(scope='session')
+def shared_data_dir(tmp_path_factory: pytest.TempPathFactory) -> pathlib.Path:
+    # the dictionary indexes take a while to compile: once per run, not per test
+    return tmp_path_factory.mktemp('data')
+
+@pytest.fixture
+def data_dir(shared_data_dir: pathlib.Path, monkeypatch: pytest.MonkeyPatch) -> Iterator[pathlib.Path]:
+    monkeypatch.setattr(data, 'data_dir', str(shared_data_dir))
+    monkeypatch.setattr(data, 'images_dir', os.path.join(str(shared_data_dir), 'images'))
+    monkeypatch.setattr(data, 'corpora_stamp_path', os.path.join(str(shared_data_dir), 'corpora.json'))
+    monkeypatch.setattr(nltk.data, 'path', list(nltk.data.path))
+    # made against the real data_dir when their modules were imported
+    monkeypatch.setattr(defaults, 'senses', SenseIndex())
+    monkeypatch.setattr(defaults, 'sentences', SentenceIndex())
+    monkeypatch.setattr(defaults, 'fuzzy', FuzzyIndex())
+    monkeypatch.setattr(defaults, 'cedict', CedictIndex())
+    monkeypatch.setattr(cache, '_cache', None)
+    monkeypatch.setattr(image_store, '_store', None)
+    monkeypatch.setattr(card_store, '_store', None)
+    monkeypatch.setattr(known_terms, '_known', None)
+    data.init(offline=True)
+    yield shared_data_dir
+
+@pytest.fixture
+def wordnet(data_dir: pathlib.Path) -> None:
+    """Skip unless nltk finds WordNet outside data_dir (e.g. in ~/nltk_data)."""
+    for name in ('corpora/wordnet', 'corpora/omw-1.4'):
+        try:
+            nltk.data.find(name)
+        except LookupError:
+            pytest.skip(f"needs nltk's {name}")
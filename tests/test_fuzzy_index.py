@@ -0,0 +1,11 @@
+"""Did-you-mean suggestions from the fuzzy index."""
+import os
+import pathlib
+
+from fuzzy_index import FuzzyIndex
+
+def test_lookups_never_build(tmp_path: pathlib.Path) -> None:
+    idx = FuzzyIndex(str(tmp_path / "fuzzy.idx"))
+    assert idx.suggest("helo", "eng") == []
+    assert not idx.ready()
+    assert not os.path.exists(idx.path)
@@ -0,0 +1,129 @@
+"""image_fetch against a local http.server: time limit, cancellation, size
+limit, and a download cancelled after it was already saved."""
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Iterator, List, Optional
+import os
+import pathlib
+import threading
+import time
+
+import pytest
+
+import data
+import image_fetch
+import image_store
+from image_fetch import DownloadCancelled, DownloadError, ImageDownload, download_image
+
+PNG = b'\x89PNG\r\n\x1a\n' + bytes(range(256)) * 4
+
+class Handler(BaseHTTPRequestHandler):
+    def do_GET(self) -> None:
+        if self.path == '/image.png':
+            self.reply(PNG, len(PNG))
+        elif self.path == '/slow.png':
+            # a chunk every 0.1s: never idle long enough for a socket timeout
+            self.reply(PNG, None, pause=0.1, chunks=100)
+        elif self.path == '/huge.png':
+            self.reply(PNG, 1 << 40, chunks=0)
+        elif self.path == '/endless.png':
+            self.reply(PNG, None, chunks=10000)
+        elif self.path == '/page.html':
+            self.reply(b'<html></html>', 13, content_type='text/html')
+        else:
+            self.send_error(404)
+
+    def reply(self, body: bytes, length: Optional[int], content_type: str = 'image/png',
+              pause: float = 0.0, chunks: int = 1) -> None:
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        if length is not None:
+            self.send_header('Content-Length', str(length))
+        self.end_headers()
+        try:
+            for _ in range(chunks):
+                self.wfile.write(body)
+                self.wfile.flush()
+                time.sleep(pause)
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+    def log_message(self, format: str, *args: object) -> None:
+        pass
+
+@pytest.fixture(scope='module')
+def server() -> Iterator[str]:
+    httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    httpd.daemon_threads = True
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{httpd.server_address[1]}"
+    httpd.shutdown()
+    httpd.server_close()
+
+@pytest.fixture
+def store(tmp_path: pathlib.Path, monkeypatch: pytest.MonkeyPatch) -> Iterator[image_store.ImageStore]:
+    monkeypatch.setattr(data, 'data_dir', str(tmp_path))
+    monkeypatch.setattr(data, 'images_dir', os.path.join(str(tmp_path), 'images'))
+    monkeypatch.setattr(image_store, '_store', None)
+    s = image_store.get_store()
+    yield s
+    s.close()
+
+def stored_files(s: image_store.ImageStore) -> List[str]:
+    return sorted(os.listdir(s.root))
+
+def test_download(server: str, store: image_store.ImageStore) -> None:
+    path = download_image(f"{server}/image.png", 'English', 'bank')
+    assert os.path.basename(path) == f"{image_store.content_hash(path)}.png"
+    assert store.image_for('English', 'bank') == path
+    assert store.image_for('German', 'bank') is None
+
+def test_timeout(server: str, store: image_store.ImageStore) -> None:
+    start = time.monotonic()
+    with pytest.raises(DownloadError, match='timed out'):
+        download_image(f"{server}/slow.png", 'English', 'bank', timeout=0.5)
+    assert time.monotonic() - start < 5
+    assert stored_files(store) == []
+
+def test_cancel(server: str, store: image_store.ImageStore) -> None:
+    seen: List[int] = []
+    with pytest.raises(DownloadCancelled):
+        download_image(f"{server}/slow.png", 'English', 'bank',
+                       cancelled=lambda: bool(seen),
+                       progress=lambda received, total: seen.append(received))
+    assert stored_files(store) == []
+    assert store.image_for('English', 'bank') is None
+
+def test_declared_size_limit(server: str, store: image_store.ImageStore) -> None:
+    with pytest.raises(DownloadError, match='too large'):
+        download_image(f"{server}/huge.png", 'English', 'bank')
+    assert stored_files(store) == []
+
+def test_streamed_size_limit(server: str, store: image_store.ImageStore) -> None:
+    with pytest.raises(DownloadError, match='too large'):
+        download_image(f"{server}/endless.png", 'English', 'bank', max_bytes=100 * 1024)
+    assert stored_files(store) == []
+
+def test_not_an_image(server: str, store: image_store.ImageStore) -> None:
+    with pytest.raises(DownloadError, match='not an image'):
+        download_image(f"{server}/page.html", 'English', 'bank')
+    assert stored_files(store) == []
+
+def test_cancel_after_adopt(server: str, store: image_store.ImageStore,
+                            monkeypatch: pytest.MonkeyPatch) -> None:
+    shared = download_image(f"{server}/image.png", 'German', 'Bank')
+    job = ImageDownload(f"{server}/image.png", 'English', 'bank')
+    done: List[str] = []
+    job.done.connect(done.append)
+
+    def download_then_cancel(*args: object, **kwargs: object) -> str:
+        path = download_image(*args, **kwargs)  # type: ignore[arg-type]
+        job.cancel()
+        return path
+    monkeypatch.setattr(image_fetch, 'download_image', download_then_cancel)
+    job._run()
+
+    assert done == []
+    assert store.image_for('English', 'bank') is None
+    # the same content is another term's image: the file stays
+    assert store.image_for('German', 'Bank') == shared
+    assert os.path.exists(shared)
@@ -0,0 +1,30 @@
+"""IPA of English terms and phrases from the CMU dictionary."""
+import defaults
+from ipa_index import IpaIndex, format_ipa
+
+index = IpaIndex()
+
+def test_word() -> None:
+    assert index.transcribe('rock') == ['rɑk']
+    assert index.transcribe('Rock!') == ['rɑk']
+    assert index.transcribe('qwzxv') == []
+
+def test_apostrophes_are_looked_up_as_written() -> None:
+    assert index.transcribe("ol'") == index.transcribe("Ol'") != []
+    assert index.transcribe("'rock'") == ['rɑk']
+
+def test_phrase_marks_unknown_words() -> None:
+    assert index.transcribe('rock qwzxv') == ['rɑk qwzxv*']
+
+def test_hyphenated_words_are_split() -> None:
+    assert index.transcribe('rock-solid') == [f"rɑk {index.token('solid')[-1]}"]
+
+def test_phrase_without_senses_keeps_its_ipa(wordnet: None) -> None:
+    options = defaults.english_defaults('jailhouse rock')
+    assert options[0]['ipa'] == format_ipa(index.transcribe('jailhouse rock'))
+    assert options[0]['ipa'].startswith('/')
+
+def test_many_matches_one_at_a_time() -> None:
+    terms = ['jailhouse rock', 'rock-solid', 'Rock!', 'qwzxv', 'rock qwzxv', 'rock']
+    one_at_a_time = IpaIndex()
+    assert IpaIndex().transcribe_many(terms) == {term: one_at_a_time.transcribe(term) for term in terms}
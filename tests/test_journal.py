@@ -0,0 +1,98 @@
+"""The session journal follows the queue through its changes."""
+from dataclasses import asdict
+from functools import partial
+from typing import Any, Dict, List
+import os
+import pathlib
+import random
+import time
+
+import pytest
+
+import journal
+from card_store import Card, CardStore
+from journal import Journal
+from term_queue import TermQueue
+
+def replayed(tmp_path: pathlib.Path) -> TermQueue:
+    j = Journal(str(tmp_path / "session.journal"), CardStore(str(tmp_path / "cards.sqlite3")))
+    return j.replay().queue
+
+def edit(lines: List[str], rng: random.Random) -> List[str]:
+    lines = list(lines)
+    at = rng.randrange(len(lines) + 1)
+    if lines and rng.random() < 0.5:
+        del lines[at:at + rng.randint(1, 3)]
+    else:
+        lines[at:at] = [f"w{rng.randrange(50)}" for _ in range(rng.randint(1, 3))]
+    return lines
+
+def test_replay_matches_the_queue(tmp_path: pathlib.Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    # compacting now and then, from what the writer has followed so far
+    monkeypatch.setattr(journal, 'SNAPSHOT_RECORDS', 50)
+    # a small window (the journal's too), so the sources are read in often
+    monkeypatch.setattr(journal, 'TermQueue', partial(TermQueue, window=20))
+    word_list = tmp_path / "words.txt"
+    word_list.write_text("".join(f"file{i}\n" for i in range(300)), encoding='utf-8')
+    rng = random.Random(0)
+    q = TermQueue(window=20)
+    q.reset(["a", "b", "c"])
+    j = Journal(str(tmp_path / "session.journal"), CardStore(str(tmp_path / "cards.sqlite3")))
+    j.replay()
+    j.follow_queue(q)
+    j.start()
+    for step in range(500):
+        r = rng.random()
+        if r < 0.4:
+            q.reset(edit(q.peek(len(q)), rng))
+        elif r < 0.8:
+            q.popleft()
+        elif r < 0.9:
+            q.push_front([f"paste{step}.{i}" for i in range(rng.randint(0, 40))])
+        elif r < 0.97:
+            q.extend([f"more{step}"])
+        else:
+            q.open(str(word_list))
+        q.refill()
+    j.close()
+    assert replayed(tmp_path).snapshot() == q.snapshot()
+
+def test_edits_journal_only_what_changed(tmp_path: pathlib.Path) -> None:
+    changes: List[Dict[str, Any]] = []
+    q = TermQueue()
+    q.on_change = changes.append
+    q.reset(["a", "b", "c", "d"])
+    q.reset(["a", "x", "c", "d"])
+    q.reset(["a", "x", "c", "d"])
+    assert changes == [
+        {"op": "splice", "at": 0, "remove": 0, "insert": ["a", "b", "c", "d"]},
+        {"op": "splice", "at": 1, "remove": 1, "insert": ["x"]},
+    ]
+
+def test_failed_writes_are_retried(tmp_path: pathlib.Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(journal, 'RETRY_SECONDS', 0.01)
+    failing = [True]
+    fsync = os.fsync
+    def flaky_fsync(fd: int) -> None:
+        if failing[0]:
+            raise OSError("No space left on device")
+        fsync(fd)
+    q = TermQueue()
+    q.reset(["a", "b", "c"])
+    store = CardStore(str(tmp_path / "cards.sqlite3"))
+    j = Journal(str(tmp_path / "session.journal"), store)
+    j.replay()
+    j.follow_queue(q)
+    j.start()
+    time.sleep(0.1)
+    monkeypatch.setattr(os, 'fsync', flaky_fsync)
+    q.popleft()
+    j.append({"t": "card", "card": asdict(Card("English", "a", [("definition", "first")]))})
+    time.sleep(0.1)
+    q.reset(["x", "c"])
+    time.sleep(0.1)
+    failing[0] = False
+    q.popleft()
+    j.close()
+    assert [card.term for card in store.cards()] == ["a"]
+    assert replayed(tmp_path).snapshot() == q.snapshot()
@@ -0,0 +1,81 @@
+"""Example sentences from a small Tatoeba-style corpus."""
+from typing import Any, Dict, List
+import os
+import pathlib
+
+import pytest
+
+import defaults
+import sentence_index
+from sentence_index import SentenceIndex
+
+CORPUS = [
+    ("eng", "I ran home."),
+    ("eng", "They run every morning."),
+    ("eng", "Running is fun."),
+    ("eng", "Run."),
+    ("cmn", "我是学生。"),
+    ("cmn", "他是學生嗎？"),
+]
+
+# the words are found through the WordNet and CC-CEDICT indexes, in the tests' data_dir
+pytestmark = pytest.mark.usefixtures('wordnet')
+
+def write_corpus(tmp_path: pathlib.Path) -> str:
+    source = tmp_path / "sentences.csv"
+    source.write_text("".join(f"{i}\t{lang}\t{text}\n" for i, (lang, text) in enumerate(CORPUS)),
+                      encoding='utf-8')
+    return str(source)
+
+@pytest.fixture
+def index(tmp_path: pathlib.Path) -> SentenceIndex:
+    idx = SentenceIndex(str(tmp_path / "sentences.idx"), write_corpus(tmp_path))
+    idx.load()
+    return idx
+
+def test_english_term_as_spelled(index: SentenceIndex) -> None:
+    # found through the base form, kept if it has the term itself, and not the term alone
+    assert index.examples("run", "eng", 9) == [
+        "<b>Run</b>ning is fun.", "They <b>run</b> every morning.",
+    ]
+
+def test_chinese_either_script(index: SentenceIndex) -> None:
+    assert index.examples("學生", "cmn", 9) == ["我是<b>学生</b>。", "他是<b>學生</b>嗎？"]
+
+def test_corpus_examples_once(index: SentenceIndex, monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(defaults, 'sentences', index)
+    options: List[Dict[str, Any]] = [{"example": ["WordNet's <b>run</b>"]}, {"example": []}, {}]
+    defaults.add_corpus_examples(options, "run", "eng")
+    assert options == [
+        {"example": ["WordNet's <b>run</b>", "<b>Run</b>ning is fun.", "They <b>run</b> every morning."]},
+        {"example": []},
+        {},
+    ]
+
+def test_lookups_never_build(tmp_path: pathlib.Path) -> None:
+    idx = SentenceIndex(str(tmp_path / "sentences.idx"), write_corpus(tmp_path))
+    assert idx.examples("run", "eng", 9) == []
+    assert not idx.ready()
+    assert not os.path.exists(idx.path)
+    idx.load()
+    assert idx.ready()
+    assert idx.examples("run", "eng", 1) == ["<b>Run</b>ning is fun."]
+
+def test_changed_corpus_is_rebuilt_by_load(tmp_path: pathlib.Path) -> None:
+    source = write_corpus(tmp_path)
+    SentenceIndex(str(tmp_path / "sentences.idx"), source).load()
+    with open(source, 'a', encoding='utf-8') as f:
+        f.write("9\teng\tWe run.\n")
+    idx = SentenceIndex(str(tmp_path / "sentences.idx"), source)
+    # the old index is out of date: nothing, rather than last time's sentences
+    assert idx.examples("run", "eng", 9) == []
+    idx.load()
+    assert idx.examples("run", "eng", 1) == ["We <b>run</b>."]
+
+def test_failed_build_leaves_no_temp_file(tmp_path: pathlib.Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    def fail(src: str, dest: str) -> None:
+        raise OSError("No space left on device")
+    monkeypatch.setattr(os, 'replace', fail)
+    with pytest.raises(OSError):
+        sentence_index.build_index(write_corpus(tmp_path), str(tmp_path / "sentences.idx"))
+    assert sorted(os.listdir(tmp_path)) == ["sentences.csv"]
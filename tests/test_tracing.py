@@ -0,0 +1,26 @@
+"""Traced providers with tracing on: the term is picked out of any call."""
+from typing import Any, Iterator
+import importlib
+
+import pytest
+
+import defaults
+import tracing
+
+@pytest.fixture
+def traced_defaults(wordnet: None, monkeypatch: pytest.MonkeyPatch) -> Iterator[Any]:
+    # traced() decides when the module is imported: import it again with tracing on,
+    # and its indexes are made again, in the tests' data_dir
+    with monkeypatch.context() as m:
+        m.setattr(tracing, 'ENABLED', True)
+        m.setattr(tracing, '_events', [])
+        yield importlib.reload(defaults)
+    importlib.reload(defaults)
+
+def test_traditional_lookup(traced_defaults: Any) -> None:
+    options = traced_defaults.traditional_chinese_defaults('學生')
+    assert options[0]['definition'].startswith('student')
+    spans = [e for e in tracing._events if e['name'] == 'chinese_defaults']
+    assert [e['args']['term'] for e in spans] == ['學生']
+    # the stages inside are charged to the term too
+    assert {e['args']['term'] for e in tracing._events} == {'學生'}
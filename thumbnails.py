@@ -0,0 +1,78 @@
+"""Preview thumbnails for card images.
+
+Images are decoded straight to preview size (QImageReader.setScaledSize lets
+JPEG decoders skip most of the work) on a worker thread, and cached on disk
+under images/thumbs keyed by a hash of the image's content, so a photo is
+only ever decoded at full size once.
+"""
+from PyQt5.QtCore import QObject, QSize, Qt, pyqtSignal
+from PyQt5.QtGui import QImage, QImageReader
+from concurrent.futures import Future, ThreadPoolExecutor
+from image_store import content_hash, stored_digest
+from tracing import traced
+import data
+import os
+
+THUMB_SIZE = 512
+thumbs_dir = os.path.join(data.images_dir, 'thumbs')
+
+class ThumbnailError(Exception):
+    pass
+
+def thumbnail_path(digest: str, size: int = THUMB_SIZE) -> str:
+    return os.path.join(thumbs_dir, f"{digest}_{size}.png")
+
+@traced("thumbnail")
+def make_thumbnail(path: str, size: int = THUMB_SIZE) -> QImage:
+    """The image at path, scaled to fit size x size, from the cache if possible."""
+    # files in the image store are already named by their hash
+    cached = thumbnail_path(stored_digest(path) or content_hash(path), size)
+    if os.path.exists(cached):
+        image = QImage(cached)
+        if not image.isNull():
+            return image
+
+    reader = QImageReader(path)
+    reader.setAutoTransform(True)
+    full = reader.size()
+    if full.isValid() and (full.width() > size or full.height() > size):
+        reader.setScaledSize(full.scaled(QSize(size, size), Qt.KeepAspectRatio))
+    image = reader.read()
+    if image.isNull():
+        raise ThumbnailError(reader.errorString())
+
+    os.makedirs(thumbs_dir, exist_ok=True)
+    tmp = f"{cached}.tmp{os.getpid()}"
+    if image.save(tmp, 'PNG'):
+        os.replace(tmp, cached)
+    return image
+
+class ThumbnailLoader(QObject):
+    """Makes thumbnails on a worker thread."""
+
+    # (image path, QImage), emitted on the GUI thread via a queued connection
+    ready = pyqtSignal(str, object)
+    # (image path, error message)
+    failed = pyqtSignal(str, str)
+
+    def __init__(self, size: int = THUMB_SIZE) -> None:
+        super().__init__()
+        self.size = size
+        self._pool = ThreadPoolExecutor(max_workers=1)
+
+    def request(self, path: str) -> None:
+        future = self._pool.submit(make_thumbnail, path, self.size)
+        future.add_done_callback(lambda f: self._on_done(path, f))
+
+    def shutdown(self) -> None:
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+    def _on_done(self, path: str, future: Future[QImage]) -> None:
+        if future.cancelled():
+            return
+        try:
+            image = future.result()
+        except Exception as e:
+            self.failed.emit(path, str(e))
+            return
+        self.ready.emit(path, image)
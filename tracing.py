@@ -0,0 +1,131 @@
+"""Per-stage timing spans across the card pipeline.
+
+Off unless ANKI_VOCAB_TRACE is set: to 1 to write data_dir/trace.json, or to
+the path to write to. Spans are kept in memory and written on exit in
+Chrome's trace event format (open it in ui.perfetto.dev or chrome://tracing),
+and the terms that took longest are printed.
+
+When tracing is off, traced() hands back the function it's given and span()
+a shared no-op context manager, so instrumented code costs next to nothing.
+
+    python tracing.py [trace.json]
+
+prints the summary of a trace written earlier.
+"""
+from collections import defaultdict
+from contextlib import contextmanager, nullcontext
+from functools import wraps
+from typing import Any, Callable, ContextManager, Dict, Iterator, List, Optional, Tuple, TypeVar
+import atexit
+import data
+import json
+import os
+import sys
+import threading
+import time
+
+_setting = os.environ.get("ANKI_VOCAB_TRACE", "")
+ENABLED = _setting not in ("", "0")
+trace_path = _setting if ENABLED and _setting != "1" else os.path.join(data.data_dir, 'trace.json')
+
+# terms listed in the summary
+SUMMARY_TERMS = 10
+
+F = TypeVar('F', bound=Callable[..., Any])
+Event = Dict[str, Any]
+
+_events: List[Event] = []
+_threads: Dict[int, str] = {}
+_local = threading.local()
+_origin = time.perf_counter()
+_null = nullcontext()
+
+@contextmanager
+def _span(name: str, term: Optional[str]) -> Iterator[None]:
+    # nested spans are charged to the term of the span they're in
+    outer = getattr(_local, "term", None)
+    if term is None:
+        term = outer
+    _local.term = term
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        end = time.perf_counter()
+        _local.term = outer
+        tid = threading.get_ident()
+        if tid not in _threads:
+            _threads[tid] = threading.current_thread().name
+        # list.append is atomic, so worker threads can record without a lock
+        _events.append({
+            "name": name, "ph": "X", "pid": os.getpid(), "tid": tid,
+            "ts": round((start - _origin) * 1e6, 1), "dur": round((end - start) * 1e6, 1),
+            "args": {"term": term, "root": outer is None and term is not None},
+        })
+
+def span(name: str, term: Optional[str] = None) -> ContextManager[None]:
+    """Time the enclosed block as stage `name`, for term (or the enclosing span's)."""
+    if not ENABLED:
+        return _null
+    return _span(name, term)
+
+def traced(name: str, term: Optional[Callable[..., Optional[str]]] = None) -> Callable[[F], F]:
+    """Decorator form of span(); term, if given, picks the term out of the call's arguments."""
+    def decorate(fn: F) -> F:
+        if not ENABLED:
+            return fn
+        @wraps(fn)
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            with _span(name, term(*args, **kwargs) if term is not None else None):
+                return fn(*args, **kwargs)
+        return wrapper  # type: ignore[return-value]
+    return decorate
+
+# ---------------------------------- REPORTING ---------------------------------
+
+def write_trace(path: str) -> None:
+    meta = [{"name": "thread_name", "ph": "M", "pid": os.getpid(), "tid": tid, "args": {"name": name}}
+            for tid, name in list(_threads.items())]
+    tmp = f"{path}.tmp{os.getpid()}"
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump({"traceEvents": meta + list(_events), "displayTimeUnit": "ms"}, f)
+    os.replace(tmp, path)
+
+def summarize(events: List[Event], n: int = SUMMARY_TERMS) -> str:
+    """The n terms whose spans took longest in all, with their slowest stages."""
+    totals: Dict[str, float] = defaultdict(float)
+    stages: Dict[str, Dict[str, float]] = defaultdict(lambda: defaultdict(float))
+    for event in events:
+        term = event.get("args", {}).get("term")
+        if event.get("ph") != "X" or term is None:
+            continue
+        ms = event["dur"] / 1000
+        # only outermost spans count towards the total, so nested time isn't counted twice
+        if event["args"].get("root"):
+            totals[term] += ms
+        stages[term][event["name"]] += ms
+    slowest: List[Tuple[str, float]] = sorted(totals.items(), key=lambda t: t[1], reverse=True)[:n]
+    if not slowest:
+        return "trace: no spans with a term recorded"
+    lines = [f"trace: {len(totals)} terms, slowest {len(slowest)}:"]
+    for term, total in slowest:
+        top = sorted(stages[term].items(), key=lambda s: s[1], reverse=True)[:4]
+        lines.append(f"  {total:8.1f}ms  {term}  (" + ", ".join(f"{name} {ms:.1f}ms" for name, ms in top) + ")")
+    return "\n".join(lines)
+
+def _at_exit() -> None:
+    try:
+        write_trace(trace_path)
+    except OSError as e:
+        print(f"Error writing trace: {e}")
+        return
+    print(summarize(_events))
+    print(f"trace: {len(_events)} spans written to {trace_path}")
+
+if ENABLED:
+    atexit.register(_at_exit)
+
+
+if __name__ == '__main__':
+    with open(sys.argv[1] if len(sys.argv) > 1 else trace_path, encoding='utf-8') as f:
+        print(summarize(json.load(f)["traceEvents"]))
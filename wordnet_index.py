@@ -0,0 +1,288 @@
+"""Precomputed WordNet sense index.
+
+Everything get_syn_options reads from nltk's WordNet reader is dumped once
+into a SQLite file: one row per synset with its definition, examples, part
+of speech and lemma names, plus the lemma -> synset maps for English and
+Chinese, the morphy exception lists and SemCor tag counts. Lookups reproduce
+wordnet.synsets(word, lang) from these tables, so the corpus itself is only
+loaded to (re)build the index:
+
+    python wordnet_index.py
+"""
+from nltk.corpus.reader.wordnet import POS_LIST, WordNetCorpusReader
+from typing import Any, Dict, List, Optional, Set, Tuple
+import data
+import json
+import os
+import sqlite3
+import threading
+
+INDEX_FORMAT = 3
+
+# rules morphy applies to a word that isn't in the exception lists
+_SUBSTITUTIONS = WordNetCorpusReader.MORPHOLOGICAL_SUBSTITUTIONS
+
+def default_index_path() -> str:
+    return os.path.join(data.data_dir, 'wordnet_senses.sqlite3')
+
+def corpus_version() -> str:
+    return "|".join([str(INDEX_FORMAT), data.corpus_stamp('wordnet'), data.corpus_stamp('omw-1.4')])
+
+def _sense_key(pos: str, offset: int) -> str:
+    # satellites live in the adjective data file, and are looked up through it
+    return f"{'a' if pos == 's' else pos}{offset:08d}"
+
+# ----------------------------------- BUILD ------------------------------------
+
+def _write_tables(conn: sqlite3.Connection) -> None:
+    from nltk.corpus import wordnet
+
+    conn.executescript("""
+        CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+        CREATE TABLE senses (
+            key TEXT PRIMARY KEY, pos TEXT NOT NULL, definition TEXT NOT NULL,
+            examples TEXT NOT NULL, lemmas TEXT NOT NULL
+        ) WITHOUT ROWID;
+        CREATE TABLE forms (
+            lang TEXT NOT NULL, form TEXT NOT NULL, pos TEXT NOT NULL, senses TEXT NOT NULL,
+            PRIMARY KEY (lang, form, pos)
+        ) WITHOUT ROWID;
+        CREATE TABLE exceptions (
+            form TEXT NOT NULL, pos TEXT NOT NULL, bases TEXT NOT NULL,
+            PRIMARY KEY (form, pos)
+        ) WITHOUT ROWID;
+        CREATE TABLE counts (form TEXT PRIMARY KEY, count INTEGER NOT NULL) WITHOUT ROWID;
+    """)
+
+    conn.executemany(
+        "INSERT INTO senses VALUES (?, ?, ?, ?, ?)",
+        ((
+            _sense_key(syn.pos(), syn.offset()),
+            syn.pos(),
+            syn.definition() or "",
+            json.dumps(syn.examples() or [], ensure_ascii=False),
+            json.dumps(syn.lemma_names(), ensure_ascii=False),
+        ) for syn in wordnet.all_synsets()),
+    )
+
+    # English: the same (form, pos) -> offsets map and exception lists that
+    # wordnet.synsets walks through morphy
+    wordnet.ensure_loaded()
+    conn.executemany(
+        "INSERT INTO forms VALUES ('eng', ?, ?, ?)",
+        ((
+            form, pos, " ".join(_sense_key(pos, offset) for offset in offsets),
+        ) for form, by_pos in wordnet._lemma_pos_offset_map.items()
+          for pos, offsets in by_pos.items() if pos in POS_LIST),
+    )
+    conn.executemany(
+        "INSERT INTO exceptions VALUES (?, ?, ?)",
+        ((form, pos, json.dumps(bases)) for pos in POS_LIST
+         for form, bases in wordnet._exception_map[pos].items()),
+    )
+    # how often each English lemma was tagged in the SemCor corpus, over all its senses
+    counts: Dict[str, int] = {}
+    try:
+        with wordnet.open('cntlist.rev') as f:
+            for line in f:
+                sense_key, _, count = line.split()
+                form = sense_key.split('%')[0]
+                counts[form] = counts.get(form, 0) + int(count)
+    except (OSError, ValueError) as e:
+        print(f"Error reading WordNet tag counts: {e}")
+    conn.executemany("INSERT INTO counts VALUES (?, ?)", counts.items())
+
+    # Chinese: lemma -> synsets straight from the OMW data
+    try:
+        cmn_lemmas = list(wordnet.all_lemma_names(lang='cmn'))
+    except LookupError:
+        cmn_lemmas = []
+    conn.executemany(
+        "INSERT INTO forms VALUES ('cmn', ?, '', ?)",
+        ((
+            lemma, " ".join(_sense_key(syn.pos(), syn.offset()) for syn in wordnet.synsets(lemma, lang='cmn')),
+        ) for lemma in cmn_lemmas),
+    )
+
+    conn.execute("INSERT INTO meta VALUES ('version', ?)", (corpus_version(),))
+
+def build_index(dest: str) -> None:
+    tmp = f"{dest}.tmp{os.getpid()}"
+    if os.path.exists(tmp):
+        os.remove(tmp)
+    try:
+        conn = sqlite3.connect(tmp)
+        try:
+            _write_tables(conn)
+            conn.commit()
+        finally:
+            conn.close()
+        os.replace(tmp, dest)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+# ----------------------------------- LOOKUP -----------------------------------
+
+class SenseIndex:
+    """Read-only view of the sense index, built on first use if needed."""
+
+    def __init__(self, path: Optional[str] = None) -> None:
+        self.path = path or default_index_path()
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        # English (form, pos) pairs, exception lists and tag counts; read on first lemmatize()
+        self._eng_forms: Optional[Set[Tuple[str, str]]] = None
+        self._eng_exceptions: Dict[Tuple[str, str], List[str]] = {}
+        self._eng_counts: Dict[str, int] = {}
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is not None:
+            return self._conn
+        conn: Optional[sqlite3.Connection] = None
+        if os.path.exists(self.path):
+            conn = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True, check_same_thread=False)
+            try:
+                row = conn.execute("SELECT value FROM meta WHERE key = 'version'").fetchone()
+            except sqlite3.DatabaseError:
+                row = None
+            if row is None or row[0] != corpus_version():
+                conn.close()
+                conn = None
+        if conn is None:
+            build_index(self.path)
+            conn = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True, check_same_thread=False)
+        self._conn = conn
+        return conn
+
+    def _eng_sense_keys(self, conn: sqlite3.Connection, word: str) -> List[str]:
+        # wordnet.synsets: for each pos, morphy the word into known forms
+        # (exception list or suffix rules, plus the word itself), then
+        # collect each form's synsets
+        exceptions: Dict[str, List[str]] = {
+            pos: json.loads(bases) for pos, bases in conn.execute(
+                "SELECT pos, bases FROM exceptions WHERE form = ?", (word,))
+        }
+        candidates: List[Tuple[str, List[str]]] = []
+        for pos in POS_LIST:
+            if pos in exceptions:
+                forms = exceptions[pos]
+            else:
+                forms = [word[:-len(old)] + new for old, new in _SUBSTITUTIONS[pos] if word.endswith(old)]
+            candidates.append((pos, [word] + forms))
+
+        all_forms = sorted({form for _, forms in candidates for form in forms})
+        known = {
+            (form, pos): senses for form, pos, senses in conn.execute(
+                f"SELECT form, pos, senses FROM forms"
+                f" WHERE lang = 'eng' AND form IN ({','.join('?' * len(all_forms))})",
+                all_forms,
+            )
+        }
+        keys: List[str] = []
+        for pos, forms in candidates:
+            for form in dict.fromkeys(forms):
+                if known.get((form, pos)):
+                    keys.extend(known[form, pos].split(" "))
+        return keys
+
+    def _load_eng_forms(self) -> Set[Tuple[str, str]]:
+        with self._lock:
+            if self._eng_forms is None:
+                conn = self._connect()
+                self._eng_exceptions = {
+                    (form, pos): json.loads(bases)
+                    for form, pos, bases in conn.execute("SELECT form, pos, bases FROM exceptions")
+                }
+                self._eng_counts = dict(conn.execute("SELECT form, count FROM counts"))
+                self._eng_forms = {
+                    (form, pos) for form, pos, senses in
+                    conn.execute("SELECT form, pos, senses FROM forms WHERE lang = 'eng'") if senses
+                }
+            return self._eng_forms
+
+    def lemmatize(self, word: str) -> Optional[str]:
+        """The base form morphy finds for an English word.
+
+        Of the forms morphy finds, irregular ones from the exception lists
+        come first, then the shortest ("running" is a noun too, but reads as
+        "run"); None if WordNet doesn't know the word. For
+        many words at a time, e.g. the vocabulary of a whole text: the forms
+        are read into memory once, so this never touches the database again.
+        """
+        word = word.lower()
+        forms = self._load_eng_forms()
+        # (from a rule, length) of each known form
+        found: Dict[str, Tuple[bool, int]] = {}
+        for pos in POS_LIST:
+            exceptions = self._eng_exceptions.get((word, pos))
+            if exceptions is not None:
+                candidates = [(form, False) for form in exceptions] + [(word, True)]
+            elif pos == 'n' and (word, pos) in forms:
+                # a noun in its own right ("species", "glasses"), not a plural
+                candidates = [(word, True)]
+            else:
+                candidates = [(word, True)] + [(word[:-len(old)] + new, True)
+                                               for old, new in _SUBSTITUTIONS[pos] if word.endswith(old)]
+            for form, by_rule in candidates:
+                if (form, pos) in forms and form not in found:
+                    found[form] = (by_rule, len(form))
+        if not found:
+            return None
+        return min(found, key=found.__getitem__)
+
+    def tag_count(self, lemma: str) -> int:
+        """How often lemma was tagged in SemCor: a rough measure of how common it is."""
+        self._load_eng_forms()
+        return self._eng_counts.get(lemma, 0)
+
+    def lemmas(self) -> Dict[str, int]:
+        """Every English lemma with a sense, and its tag_count()."""
+        forms = self._load_eng_forms()
+        return {form: self._eng_counts.get(form, 0) for form, _ in forms}
+
+    def inflections(self) -> Dict[str, int]:
+        """The irregular forms in the exception lists ("children", "ran"), and their bases' tag_count()."""
+        self._load_eng_forms()
+        found: Dict[str, int] = {}
+        for (form, _), bases in self._eng_exceptions.items():
+            count = max(self._eng_counts.get(base, 0) for base in bases) if bases else 0
+            found[form] = max(found.get(form, 0), count)
+        return found
+
+    def senses(self, word: str, lang: str) -> List[Dict[str, Any]]:
+        """Sense records for word, in the order wordnet.synsets(word, lang=lang) gives."""
+        word = word.lower()
+        with self._lock:
+            conn = self._connect()
+            if lang == 'eng':
+                keys = self._eng_sense_keys(conn, word)
+            else:
+                row = conn.execute(
+                    "SELECT senses FROM forms WHERE lang = ? AND form = ? AND pos = ''", (lang, word)
+                ).fetchone()
+                keys = row[0].split(" ") if row is not None and row[0] else []
+            unique = sorted(set(keys))
+            rows = {
+                key: (pos, definition, examples, lemmas)
+                for key, pos, definition, examples, lemmas in conn.execute(
+                    f"SELECT key, pos, definition, examples, lemmas FROM senses"
+                    f" WHERE key IN ({','.join('?' * len(unique))})",
+                    unique,
+                )
+            }
+        return [
+            {
+                "pos": rows[key][0],
+                "definition": rows[key][1],
+                "examples": json.loads(rows[key][2]),
+                "lemmas": json.loads(rows[key][3]),
+            }
+            for key in keys if key in rows
+        ]
+
+
+if __name__ == '__main__':
+    data.init()
+    build_index(default_index_path())
+    print(f"Wrote {default_index_path()}")
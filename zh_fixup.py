@@ -0,0 +1,116 @@
+"""Display clean-up for CC-CEDICT definitions.
+
+CC-CEDICT writes cross-references as traditional|simplified[pin1 yin1]. For
+display we want tone-marked pinyin and only the simplified form:
+
+    CL:個|个[ge4],項|项[xiang4]   ->   CL:个[gè],项[xiàng]
+    see 長沙|长沙[Chang2 sha1]    ->   see 长沙[Cháng shā]
+
+or, with traditional=True, only the traditional one (CL:個[gè],項[xiàng]).
+"""
+from dragonmapper.transcriptions import numbered_to_accented
+from functools import lru_cache
+from typing import Iterable, List, Optional
+import re
+
+# CL:個|个[ge4],項|项[xiang4]
+#         ^^^^^      ^^^^^^^^
+pinyin_re = re.compile(r'\[([^\]]+)\]')
+
+_SPECIAL = '[]|'
+
+@lru_cache(maxsize=None)
+def _accent_syllable(syllable: str) -> str:
+    # repeat until stable: a few malformed syllables take more than one go
+    accented = str(numbered_to_accented(syllable))
+    while accented != syllable:
+        syllable, accented = accented, str(numbered_to_accented(accented))
+    return accented
+
+def accent_pinyin(numbered: str) -> str:
+    """numbered_to_accented, memoized per space-separated syllable."""
+    return ' '.join(map(_accent_syllable, numbered.split(' ')))
+
+def _accent_bracket(m: 're.Match[str]') -> str:
+    return '[' + accent_pinyin(m.group(1)) + ']'
+
+def _pair_follows(text: str, i: int) -> bool:
+    # one character, then a non-empty bracket
+    return (text[i:i + 1] not in ('', '\n') and text[i + 1:i + 2] == '['
+            and text.find(']', i + 2) > i + 2)
+
+def _collapse_classifiers(text: str, traditional: bool = False) -> List[str]:
+    """CL:個|个[gè] -> CL:个[gè], for every pair in a classifier list.
+
+    A pipe is collapsed (it and the traditional character before it dropped,
+    or the simplified one after it if traditional) when it's the first
+    remaining pipe after a "CL:" and is followed by one character and a
+    bracket.
+    """
+    out: List[str] = []
+    cl_start: Optional[int] = None
+    skip = False
+    for i, ch in enumerate(text):
+        if skip:
+            skip = False
+            continue
+        if ch == '|' and cl_start is not None:
+            # a doubled pipe counts as the "character" before the second one
+            if len(out) >= cl_start + 3 and text[i + 1:i + 2] == '|' and _pair_follows(text, i + 2):
+                skip = True
+                continue
+            if len(out) > cl_start + 3 and out[-1] != '\n' and _pair_follows(text, i + 1):
+                if traditional:
+                    skip = True
+                else:
+                    out.pop()
+                continue
+        if ch == '|':
+            cl_start = None
+        out.append(ch)
+        if cl_start is None and ch == ':' and out[-3:] == ['C', 'L', ':']:
+            cl_start = len(out) - 3
+    return out
+
+def _collapse_pairs(text: List[str], traditional: bool = False) -> str:
+    """長沙|长沙[Cháng shā] -> 长沙[Cháng shā], after a space.
+
+    Everything from the first space of the run before the pipe up to the pipe
+    is dropped, matching the original regex rewrite (or if traditional, the
+    pipe and the run after it). Pipes are resolved right to left, since
+    collapsing one can complete the bracket of the one before.
+    """
+    pipes = [i for i, ch in enumerate(text) if ch == '|']
+    for p in reversed(pipes):
+        # after the pipe: a non-empty run, then a non-empty bracket
+        j = p + 1
+        while j < len(text) and text[j] not in _SPECIAL:
+            j += 1
+        if j == p + 1 or j >= len(text) or text[j] != '[':
+            continue
+        k = j + 1
+        while k < len(text) and text[k] not in _SPECIAL:
+            k += 1
+        if k == j + 1 or k >= len(text) or text[k] != ']':
+            continue
+        # before the pipe: the first space of the run, with something after it
+        i = p - 1
+        while i >= 0 and text[i] not in _SPECIAL:
+            i -= 1
+        space = next((q for q in range(i + 1, p - 1) if text[q] == ' '), None)
+        if space is not None:
+            if traditional:
+                del text[p:j]
+            else:
+                del text[space + 1:p + 1]
+    return ''.join(text)
+
+def fix_up_zh(defn: str, traditional: bool = False) -> str:
+    defn = pinyin_re.sub(_accent_bracket, defn)
+    if '|' not in defn:
+        return defn
+    return _collapse_pairs(_collapse_classifiers(defn, traditional), traditional)
+
+def fix_up_zh_bulk(defns: Iterable[str], traditional: bool = False) -> List[str]:
+    """fix_up_zh over many definitions, e.g. a whole dictionary at build time."""
+    return [fix_up_zh(defn, traditional) for defn in defns]